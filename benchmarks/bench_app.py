@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+Benchmark ReM endpoints offline against the mock Figshare API
+
+Covers ``/metadata/``, ``/form/`` GET and POST, and ``/database/read/`` for
+README databases of different sizes. Reports p50/p95/p99 latency and
+throughput, compared with a stored baseline.
+
+Usage: python -m benchmarks.bench_app --sizes 1000 10000 100000
+       python -m benchmarks.bench_app --save-baseline
+
+Run from a source checkout: the mock Figshare API is the test suite's
+``tests.mock_figshare`` module, which also needs ``uvicorn``.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import httpx
+from fastapi import FastAPI
+
+from readme_tool import figshare, figshare_client, intake_form, ratelimit, \
+    search, storage
+from tests.mock_figshare import MockFigshareServer, state
+
+from .bench_submit import make_record, populate
+
+baseline_file = Path(__file__).parent / 'baseline_app.json'
+
+app = FastAPI()
+app.include_router(figshare.router)
+app.include_router(intake_form.router)
+
+form_data = {key: value for key, value in make_record(0).items()
+             if key not in ('article_id', 'curation_id')}
+
+
+def scenarios(db_file: str) -> Dict[str, Callable]:
+    """Return request functions by scenario name, taking client and index"""
+    params = {'db_file': db_file}
+    return {
+        'metadata': lambda client, i: client.get(f'/metadata/{i}/'),
+        'form_get': lambda client, i: client.get(f'/form/{i}/',
+                                                 params=params),
+        'form_post': lambda client, i: client.post(f'/form/{i}/',
+                                                   params=params,
+                                                   data=form_data),
+        'database_read': lambda client, i: client.get(f'/database/read/{i}',
+                                                      params=params),
+        # Matches every record: the slowest query to rank
+        'search': lambda client, i: client.get(
+            '/database/search', params={**params, 'q': 'methods'}),
+    }
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Return the ``p``-th percentile of ``values``, interpolating linearly
+    between the closest ranks
+
+    :param values: Sample values (not empty)
+    :param p: Percentile, from 0 to 100
+    """
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + \
+        (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(timings: List[float], wall: float) -> dict:
+    """
+    Return latency percentiles (ms) and throughput (requests/s)
+
+    :param timings: Request latencies in seconds
+    :param wall: Total elapsed time in seconds
+    """
+    return {
+        'p50': percentile(timings, 50) * 1e3,
+        'p95': percentile(timings, 95) * 1e3,
+        'p99': percentile(timings, 99) * 1e3,
+        'throughput': len(timings) / wall,
+    }
+
+
+async def run_scenario(func: Callable, article_ids: List[int],
+                       concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+    errors = 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                 base_url='http://rem') as client:
+        async def _request(i: int):
+            nonlocal errors
+            async with semaphore:
+                t0 = perf_counter()
+                response = await func(client, i)
+                timings.append(perf_counter() - t0)
+                if response.status_code != 200:
+                    errors += 1
+
+        t0 = perf_counter()
+        await asyncio.gather(*[_request(i) for i in article_ids])
+        wall = perf_counter() - t0
+
+    return {**summarize(timings, wall), 'errors': errors}
+
+
+def run(size: int, requests: int, concurrency: int, suffix: str,
+        latency: float = 0.0, error_rate: float = 0.0) -> dict:
+    results = {}
+    article_ids = list(range(1, min(size, requests) + 1))
+    article_ids = (article_ids * (requests // len(article_ids) + 1))[:requests]
+
+    state.reset()
+    state.add_curations(len(set(article_ids)))
+    state.latency = latency
+    state.error_rate = error_rate
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = str(Path(tmp_dir) / f'intake{suffix}')
+        populate(storage.get_storage(db_file), size)
+        search.get_index(db_file)
+        for name, func in scenarios(db_file).items():
+            # Each scenario starts with a cold metadata cache
+            figshare.metadata_cache.clear()
+            # Silence per-request logging by the app
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[name] = asyncio.run(
+                    run_scenario(func, article_ids, concurrency))
+            figshare_client._clients.clear()
+        search.close_indexes()
+        storage.close_storages()
+    return results
+
+
+def compare(result: dict, baseline: dict) -> str:
+    """Format changes relative to baseline, e.g. ``p95 +12%``"""
+    if not baseline:
+        return ''
+    return ' '.join(f"{key} {(result[key] / baseline[key] - 1) * 100:+.0f}%"
+                    for key in ('p95', 'throughput') if baseline.get(key))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--backend', default='.db')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='Mock Figshare latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of mock Figshare requests failing')
+    parser.add_argument('--baseline', type=Path, default=baseline_file)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='Exit with an error if p95 latency exceeds '
+                             'the baseline by this fraction (e.g., 0.25)')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+
+    figshare.api_key = 'token'
+    figshare_client.retry_policy.backoff_base = 0.01
+    # Measure the app, not the Figshare rate limit
+    ratelimit.rates.update({False: 0.0, True: 0.0})
+    results = {}
+    regressions = []
+    with MockFigshareServer() as server:
+        figshare_client.base_urls[False] = server.url
+        print(f"{'scenario':14} {'records':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'req/s':>8} {'errors':>6}  vs. baseline")
+        for size in args.sizes:
+            for name, result in run(size, args.requests, args.concurrency,
+                                    args.backend, args.latency,
+                                    args.error_rate).items():
+                key = f'{name}/{size}'
+                results[key] = result
+                print(f"{name:14} {size:8d} {result['p50']:8.2f} "
+                      f"{result['p95']:8.2f} {result['p99']:8.2f} "
+                      f"{result['throughput']:8.1f} {result['errors']:6d}  "
+                      f"{compare(result, baseline.get(key))}")
+                if args.max_regression is not None and key in baseline and \
+                        result['p95'] > baseline[key]['p95'] * \
+                        (1 + args.max_regression):
+                    regressions.append(key)
+
+    # Keep other entries (e.g., sizes not run) in the baseline
+    if args.save_baseline:
+        baseline.update({key: {metric: round(value, 3)
+                               for metric, value in result.items()
+                               if metric != 'errors'}
+                         for key, result in results.items()})
+        args.baseline.write_text(json.dumps(baseline, indent=2,
+                                            sort_keys=True) + '\n')
+        print(f"Saved baseline to {args.baseline}")
+
+    if regressions:
+        print(f"p95 latency regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for Figshare citation parsing
+
+Compares the previous chained ``str.split`` parsing in
+``figshare_metadata_readme`` with ``parse_citation`` (uncached and cached)
+over the citation corpus in tests_data/citations.json.
+
+Usage: python -m benchmarks.bench_citation --number 20000
+"""
+import argparse
+import json
+import timeit
+
+from readme_tool.citation import parse_citation
+
+
+def legacy_split(citation: str) -> list:
+    author_list = ([citation.split('):')[0] + ').'])
+    author_list += [str_row + '.' for str_row in
+                    citation.split('): ')[1].split('. ')]
+    return author_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--corpus', default='tests_data/citations.json')
+    args = parser.parse_args()
+
+    with open(args.corpus) as fin:
+        citations = [s['citation'] for s in json.load(fin)
+                     if '): ' in s['citation']]
+
+    def _run(func):
+        for citation in citations:
+            func(citation)
+
+    def _uncached(citation):
+        return parse_citation.__wrapped__(citation).preferred_citation()
+
+    def _cached(citation):
+        return parse_citation(citation).preferred_citation()
+
+    n_calls = args.number * len(citations)
+    for label, func in [('legacy split', legacy_split),
+                        ('parse (uncached)', _uncached),
+                        ('parse (cached)', _cached)]:
+        seconds = timeit.timeit(lambda: _run(func), number=args.number)
+        print(f"{label:18} {seconds / n_calls * 1e6:8.3f} us/citation")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Benchmark app startup: time to import ``main`` and time until a new
+server process answers its readiness probe
+
+Each run uses a fresh Python process, as for a worker start or a
+reload-mode restart.
+
+Usage: python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+from time import perf_counter, sleep
+
+import_code = "from time import perf_counter; t0 = perf_counter(); " \
+              "import main; print(perf_counter() - t0)"
+
+
+def time_import(env: dict) -> float:
+    output = subprocess.run([sys.executable, '-c', import_code], env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_ready(env: dict, path: str) -> float:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    t0 = perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port),
+         '--log-level', 'warning'], env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(
+                        f'http://127.0.0.1:{port}{path}') as response:
+                    if response.status == 200:
+                        return perf_counter() - t0
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            if process.poll() is not None:
+                raise RuntimeError("Server exited during startup")
+            sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/ready',
+                        help='Path polled until the server responds 200')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = {**os.environ,
+               'FIGSHARE_API_KEY': os.getenv('FIGSHARE_API_KEY', 'token'),
+               'FIGSHARE_STAGE_API_KEY':
+                   os.getenv('FIGSHARE_STAGE_API_KEY', 'token'),
+               'REM_PREFETCH_INTERVAL': '0',
+               'REM_SYNC_INTERVAL': '0',
+               'REM_TEMPLATE_CACHE': os.path.join(tmp_dir, 'jinja')}
+
+        imports = [time_import(env) for _ in range(args.runs)]
+        ready = [time_ready(env, args.path) for _ in range(args.runs)]
+
+    print(f"{'measure':16} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for label, timings in [('import main', imports),
+                           ('ready', ready)]:
+        print(f"{label:16} {statistics.median(timings) * 1e3:10.1f} "
+              f"{min(timings) * 1e3:8.1f} {max(timings) * 1e3:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
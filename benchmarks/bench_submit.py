@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Benchmark form submission storage cost against README database size
+
+Compares the previous read-then-insert/update path used by ``post_form``
+with the atomic ``upsert`` and journaled submissions (compaction not
+included) for each storage backend.
+
+Usage: python -m benchmarks.bench_submit --sizes 100 1000 10000
+"""
+import argparse
+import json
+import statistics
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from readme_tool import journal, storage
+
+
+def make_record(article_id: int) -> dict:
+    return {
+        'article_id': article_id,
+        'curation_id': article_id + 1,
+        'citation': 'Preferred citation',
+        'summary': 'Summary ' * 20,
+        'files': 'Files ' * 20,
+        'materials': 'Materials and methods ' * 20,
+        'contributors': 'Contributor roles',
+        'notes': 'Notes',
+    }
+
+
+def read_then_write(store: storage.Storage, record: dict):
+    match = store.get(record['article_id'])
+    if match is None:
+        store.insert(record)
+    else:
+        store.update(match[0], record)
+
+
+def populate(store: storage.Storage, size: int):
+    if isinstance(store, storage.TinyDBStorage):
+        store._db.insert_multiple(make_record(i) for i in range(size))
+    else:
+        with store.connection() as conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO records (article_id, curation_id, data) "
+                "VALUES (?, ?, ?)",
+                ((i, i + 1, json.dumps(make_record(i)))
+                 for i in range(size)))
+            conn.execute("COMMIT")
+
+
+def run(suffix: str, size: int, submits: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = str(Path(tmp_dir) / f'intake{suffix}')
+        store = storage.get_storage(db_file)
+        populate(store, size)
+        sub_journal = journal.get_journal(db_file)
+        for label, func in [('read+write', read_then_write),
+                            ('upsert', lambda s, r: s.upsert(r)),
+                            ('journal', lambda s, r: sub_journal.submit(r))]:
+            timings = []
+            for i in range(submits):
+                # Alternate updates of existing records and new records
+                article_id = i if i % 2 else size + i
+                t0 = perf_counter()
+                func(store, make_record(article_id))
+                timings.append(perf_counter() - t0)
+            results[label] = statistics.median(timings) * 1e3
+        journal.close_journals()
+        storage.close_storages()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100, 1000, 10000])
+    parser.add_argument('--submits', type=int, default=50)
+    parser.add_argument('--backends', nargs='+', default=['.db', '.json'])
+    args = parser.parse_args()
+
+    print(f"{'backend':8} {'records':>8} {'read+write ms':>14} "
+          f"{'upsert ms':>10} {'journal ms':>11}")
+    for suffix in args.backends:
+        for size in args.sizes:
+            result = run(suffix, size, args.submits)
+            print(f"{suffix:8} {size:8d} {result['read+write']:14.3f} "
+                  f"{result['upsert']:10.3f} {result['journal']:11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,211 @@
 #!/usr/bin/env python
-import json
-from os import getenv
-from pathlib import Path
+import os
+from typing import Optional
 
-import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from starlette.staticfiles import StaticFiles
 
-from readme_tool import figshare, intake_form
+from readme_tool import compression, figshare, history, intake_form, \
+    journal, metrics, migrate, prefetch, ratelimit, readme, search, sync
+from readme_tool.assets import AssetFiles, asset_prefix, compress_assets, \
+    precompile_templates
+from readme_tool.compression import CompressionMiddleware
+from readme_tool.figshare_client import close_clients
+from readme_tool.settings import Settings, load_settings
+from readme_tool.storage import close_storages
 
 app = FastAPI()
 
+# Loaded on app startup
+settings: Optional[Settings] = None
+
 
 def configure():
+    """Set up routes and event handlers. Settings are applied on startup"""
     app.mount("/templates", StaticFiles(directory="templates"), name="templates")
+    app.mount(asset_prefix, AssetFiles(directory="templates"), name="assets")
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.add_middleware(CompressionMiddleware)
     configure_routing()
-    configure_api()
+    # Runs before the prefetch, sync and journal tasks start
+    app.add_event_handler("startup", startup)
+    app.add_event_handler("startup", prefetch.start)
+    app.add_event_handler("startup", sync.start)
+    app.add_event_handler("startup", journal.start)
+    app.add_event_handler("shutdown", prefetch.stop)
+    app.add_event_handler("shutdown", sync.stop)
+    app.add_event_handler("shutdown", journal.stop)
+    app.add_event_handler("shutdown", close_clients)
+    app.add_event_handler("shutdown", close_storages)
+    app.add_event_handler("shutdown", history.close_histories)
+    app.add_event_handler("shutdown", search.close_indexes)
 
 
 def configure_routing():
     app.include_router(figshare.router)
     app.include_router(intake_form.router)
-
-
-def configure_api():
-    figshare_api_key = getenv('FIGSHARE_API_KEY')
-    figshare_stage_api_key = getenv('FIGSHARE_STAGE_API_KEY')
-
-    if not figshare_api_key or not figshare_stage_api_key:
-        settings_file = 'settings.json'
-        file = Path(settings_file).absolute()
-        if not file.exists():
-            err_msg = "file not found; please see settings_template.json"
-            print(f"WARNING: {file} {err_msg}")
-            raise Exception(f"{settings_file} {err_msg}")
-
-        with open(file) as fin:
-            settings = json.load(fin)
-
-    if not figshare_api_key:
-        print("WARNING: FIGSHARE_API_KEY not set as ENV variable. "
-              "Obtaining from settings.json")
-
-        figshare_api_key = settings.get('figshare_api_key')
-    else:
-        print("FIGSHARE_API_KEY set as ENV variable.")
-
-    if not figshare_stage_api_key:
-        print("WARNING: FIGSHARE_STAGE_API_KEY not set as ENV variable. "
-              "Obtaining from settings.json")
-
-        figshare_stage_api_key = settings.get('figshare_stage_api_key')
+    app.include_router(readme.router)
+    app.include_router(metrics.router)
+
+
+def startup():
+    """Load settings and configure the app. Called on app startup"""
+    global settings
+    new_settings = load_settings()
+    configure_api(new_settings)
+    configure_templates(new_settings)
+    configure_compression(new_settings)
+    configure_cache(new_settings)
+    configure_rate_limit(new_settings)
+    configure_prefetch(new_settings)
+    configure_sync(new_settings)
+    configure_storage()
+    configure_journal(new_settings)
+    configure_history(new_settings)
+    configure_search(new_settings)
+    settings = new_settings
+
+
+def configure_api(config: Settings):
+    figshare.api_key = config.figshare_api_key
+    figshare.stage_api_key = config.figshare_stage_api_key
+
+
+def configure_templates(config: Settings):
+    # Compiled before /ready reports ready, so requests never compile
+    # templates and see a partial asset manifest
+    if config.gzip_assets:
+        compress_assets()
+    precompile_templates(intake_form.templates,
+                         cache_dir=config.template_cache)
+
+
+def configure_compression(config: Settings):
+    compression.enabled = config.compression
+    if config.compression_min_size is not None:
+        compression.minimum_size = config.compression_min_size
+
+
+def configure_cache(config: Settings):
+    cache = figshare.metadata_cache
+    if config.cache_maxsize is not None:
+        cache.maxsize = config.cache_maxsize
+    if config.cache_ttl is not None:
+        cache.ttl = config.cache_ttl
+    if config.cache_error_ttl is not None:
+        cache.error_ttl = config.cache_error_ttl
+
+    if config.draft_validity is not None:
+        intake_form.draft_validations.ttl = config.draft_validity
+
+    # Share metadata cache across worker processes
+    if config.shared_cache:
+        figshare.use_shared_cache(config.shared_cache)
+
+
+def configure_rate_limit(config: Settings):
+    if config.rate_limit is not None:
+        ratelimit.rates[False] = config.rate_limit
+    if config.rate_limit_stage is not None:
+        ratelimit.rates[True] = config.rate_limit_stage
+    if config.rate_limit_burst is not None:
+        ratelimit.burst = config.rate_limit_burst
+
+    # Worker processes share the rate limit of each API token
+    if config.shared_cache:
+        ratelimit.use_shared_store(config.shared_cache)
+
+
+def configure_prefetch(config: Settings):
+    if config.prefetch_interval is not None:
+        prefetch.interval = config.prefetch_interval
+    if config.prefetch_rate is not None:
+        prefetch.rate = config.prefetch_rate
+    if config.prefetch_stage:
+        prefetch.stages = (False, True)
+    if config.shared_cache:
+        prefetch.lock_file = f"{config.shared_cache}.prefetch.lock"
+
+
+def configure_sync(config: Settings):
+    if config.sync_interval is not None:
+        sync.interval = config.sync_interval
+    if config.sync_watermark_file:
+        sync.watermark_file = config.sync_watermark_file
+    if config.shared_cache:
+        sync.lock_file = f"{config.shared_cache}.sync.lock"
+
+
+def configure_storage():
+    # Records from intake.json (TinyDB, used before the SQLite store) are
+    # copied to the new database on first start
+    migrate.migrate_legacy(intake_form.tinydb_file,
+                           intake_form.intake_db_file)
+
+
+def configure_journal(config: Settings):
+    # Journaled submissions are only visible to the worker that received them
+    journal.enabled = config.journal
+    if config.journal_interval is not None:
+        journal.interval = config.journal_interval
+    if journal.enabled:
+        try:
+            # Recovers submissions not yet compacted before a crash
+            journal.get_journal(intake_form.intake_db_file)
+        except journal.JournalInUseError as err:
+            print(f"WARNING: {err}; writing submissions directly")
+            journal.enabled = False
+
+
+def configure_history(config: Settings):
+    history.enabled = config.history
+    if config.history_max_deltas is not None:
+        history.max_deltas = config.history_max_deltas
+
+
+def configure_search(config: Settings):
+    search.enabled = config.search
+    if search.enabled:
+        # Filled or refreshed before the first search or write
+        search.get_index(intake_form.intake_db_file)
+
+
+@app.get('/ready')
+async def get_ready() -> dict:
+    """
+    Readiness probe: 200 once startup is complete, 503 before
+
+    \f
+    :return: Readiness status
+    """
+    if settings is None:
+        raise HTTPException(status_code=503, detail="FastAPI: Starting up")
+    return {'ready': True}
+
+
+def serve():
+    """
+    Run the app. With ``REM_WORKERS`` set, run that many worker processes
+    without reload (production); otherwise a single reloading process.
+    Workers share the metadata cache through ``REM_SHARED_CACHE``
+    (default: rem_cache.db)
+    """
+    import uvicorn
+
+    config = Settings()
+    if config.workers:
+        # Inherited by the worker processes
+        os.environ.setdefault('REM_SHARED_CACHE', 'rem_cache.db')
+        uvicorn.run('main:app', host=config.host, port=config.port,
+                    workers=config.workers, proxy_headers=True)
     else:
-        print("FIGSHARE_STAGE_API_KEY set as ENV variable")
+        uvicorn.run('main:app', host=config.host, port=config.port,
+                    reload=True)
 
-    figshare.api_key = figshare_api_key
-    figshare.stage_api_key = figshare_stage_api_key
 
+configure()
 
 if __name__ == "__main__":
-    configure()
-    uvicorn.run('main:app', port=8000, reload=True)
-else:
-    configure()
+    # Fail fast on missing or invalid settings
+    load_settings()
+    serve()
@@ -0,0 +1,254 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from jinja2 import FileSystemBytecodeCache
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import StreamingResponse
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+from starlette.types import Receive, Scope, Send
+
+from .compression import accepts
+
+# Directory of templates and static assets
+template_dir = 'templates'
+
+# Static asset directories (relative to ``template_dir``) to fingerprint
+asset_dirs = ('styles', 'img')
+
+# URL prefix where fingerprinted assets are mounted
+asset_prefix = '/assets'
+
+# File types worth storing as pre-gzipped copies
+gzip_suffixes = ('.css', '.js', '.svg', '.html')
+
+# Streamed pages are sent in chunks of about this many characters. The
+# document head is sent as soon as it is rendered
+stream_chunk_size = 4096
+
+immutable_cache_control = 'public, max-age=31536000, immutable'
+revalidate_cache_control = 'no-cache'
+
+
+class AssetManifest:
+    """
+    Map static asset paths to content-hashed (fingerprinted) paths
+
+    e.g., ``styles/css/styles.css`` -> ``styles/css/styles.1a2b3c4d5e6f.css``
+
+    :param directory: Directory of static assets
+    :param subdirs: Subdirectories to include
+    """
+
+    def __init__(self, directory: str = template_dir,
+                 subdirs: tuple = asset_dirs):
+        self.directory = directory
+        self.subdirs = subdirs
+        self._fingerprinted: Optional[Dict[str, str]] = None
+        self._original: Dict[str, str] = {}
+
+    def build(self):
+        """Compute content hashes for all static assets"""
+        fingerprinted = {}
+        original = {}
+        root = Path(self.directory)
+        for subdir in self.subdirs:
+            for file in sorted((root / subdir).rglob('*')):
+                if not file.is_file() or file.suffix == '.gz':
+                    continue
+                digest = hashlib.sha256(file.read_bytes()).hexdigest()[:12]
+                path = str(file.relative_to(root))
+                stem, suffix = os.path.splitext(path)
+                hashed = f"{stem}.{digest}{suffix}"
+                fingerprinted[path] = hashed
+                original[hashed] = path
+        self._fingerprinted = fingerprinted
+        self._original = original
+
+    def fingerprint(self, path: str) -> str:
+        """
+        Return fingerprinted path for a static asset
+
+        :param path: Asset path relative to ``directory``
+
+        :return: Fingerprinted path, or ``path`` if not a known asset
+        """
+        if self._fingerprinted is None:
+            self.build()
+        path = os.path.normpath(path.lstrip('/'))
+        return self._fingerprinted.get(path, path)
+
+    def original(self, path: str) -> Optional[str]:
+        """
+        Return asset path for a fingerprinted path
+
+        :param path: Fingerprinted path relative to ``directory``
+
+        :return: Asset path, or None if ``path`` is not fingerprinted
+        """
+        if self._fingerprinted is None:
+            self.build()
+        return self._original.get(path)
+
+
+manifest = AssetManifest()
+
+
+def asset_url(path: str) -> str:
+    """
+    Jinja2 global returning the fingerprinted URL for a static asset
+
+    :param path: Asset path relative to ``template_dir``
+
+    :return: URL of fingerprinted asset
+    """
+    return f"{asset_prefix}/{manifest.fingerprint(path)}"
+
+
+class AssetFiles(StaticFiles):
+    """
+    ``StaticFiles`` serving fingerprinted assets with far-future
+    ``Cache-Control``, and pre-gzipped copies when accepted by the client.
+
+    Non-fingerprinted paths are served with ``Cache-Control: no-cache`` so
+    they are revalidated through ``ETag``/``If-None-Match`` (304).
+    """
+
+    def __init__(self, *args, asset_manifest: AssetManifest = manifest,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = asset_manifest
+
+    async def __call__(self, scope: Scope, receive: Receive,
+                       send: Send) -> None:
+        scope = dict(scope)
+        asset = scope['rem.asset'] = {}
+
+        async def _send(message):
+            if message['type'] == 'http.response.start' and \
+                    message['status'] in (200, 304):
+                headers = MutableHeaders(scope=message)
+                if asset.get('immutable'):
+                    headers['Cache-Control'] = immutable_cache_control
+                else:
+                    headers['Cache-Control'] = revalidate_cache_control
+                if asset.get('gzip'):
+                    headers['Content-Type'] = asset['gzip']
+                    headers['Content-Encoding'] = 'gzip'
+                    headers['Vary'] = 'Accept-Encoding'
+            await send(message)
+
+        await super().__call__(scope, receive, _send)
+
+    def get_path(self, scope: Scope) -> str:
+        path = super().get_path(scope)
+        asset = scope.get('rem.asset')
+        original = self.manifest.original(path)
+        if original is None or asset is None:
+            return path
+
+        asset['immutable'] = True
+        path = original
+        accept_encoding = Headers(scope=scope).get('accept-encoding', '')
+        if accepts(accept_encoding, 'gzip') and \
+                os.path.isfile(os.path.join(self.directory, f"{path}.gz")):
+            media_type = mimetypes.guess_type(path)[0] or 'text/plain'
+            if media_type.startswith('text/'):
+                media_type += '; charset=utf-8'
+            asset['gzip'] = media_type
+            path = f"{path}.gz"
+        return path
+
+
+def compress_assets(directory: str = template_dir,
+                    subdirs: tuple = asset_dirs) -> int:
+    """
+    Write pre-gzipped copies (``.gz``) of text static assets
+
+    Existing copies are only rewritten when the asset is newer.
+
+    :param directory: Directory of static assets
+    :param subdirs: Subdirectories to include
+
+    :return: Number of files compressed
+    """
+    count = 0
+    for subdir in subdirs:
+        for file in Path(directory, subdir).rglob('*'):
+            if not file.is_file() or file.suffix not in gzip_suffixes:
+                continue
+            gz_file = file.with_name(f"{file.name}.gz")
+            if gz_file.exists() and \
+                    gz_file.stat().st_mtime >= file.stat().st_mtime:
+                continue
+            gz_file.write_bytes(gzip.compress(file.read_bytes(),
+                                              compresslevel=9))
+            count += 1
+    return count
+
+
+def precompile_templates(templates: Jinja2Templates,
+                         cache_dir: Optional[str] = None) -> int:
+    """
+    Compile all HTML templates ahead of the first request
+
+    :param templates: Templates to compile
+    :param cache_dir: Directory for on-disk Jinja2 bytecode cache shared
+                      across workers and restarts. Default: No disk cache
+
+    :return: Number of templates compiled
+    """
+    env = templates.env
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    # Templates are not edited in place while the app is running
+    env.auto_reload = False
+
+    names = env.list_templates(filter_func=lambda name: name.endswith('.html'))
+    for name in names:
+        env.get_template(name)
+    manifest.build()
+    return len(names)
+
+
+def stream_template(templates: Jinja2Templates, name: str, context: dict,
+                    status_code: int = 200) -> StreamingResponse:
+    """
+    Render HTML template as a stream, so the page head (with stylesheet
+    links) reaches the browser while the rest is rendered
+
+    The template is loaded before the response starts, so a missing
+    template still fails the request.
+
+    :param templates: Templates to render from
+    :param name: Template name
+    :param context: Template context, including ``request``
+    :param status_code: HTTP status code
+
+    :return: Streaming HTML response
+    """
+    template = templates.get_template(name)
+
+    def _chunks() -> Iterator[str]:
+        buffer = []
+        size = 0
+        head_sent = False
+        for text in template.generate(context):
+            buffer.append(text)
+            size += len(text)
+            if size >= stream_chunk_size or \
+                    (not head_sent and '</head>' in text):
+                head_sent = True
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield ''.join(buffer)
+
+    return StreamingResponse(_chunks(), status_code=status_code,
+                             media_type='text/html')
@@ -0,0 +1,362 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import monotonic, time
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    In-process cache with per-entry time-to-live and LRU eviction. Safe to
+    use from the event loop and worker threads at the same time
+
+    :param maxsize: Maximum number of entries to hold
+    :param ttl: Default time-to-live in seconds for an entry
+    :param error_ttl: Time-to-live in seconds for cached failures
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 600.0,
+                 error_ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, record=False)[0]
+
+    def get(self, key: Hashable, record: bool = True) -> Tuple[bool, Any]:
+        """
+        Retrieve entry from cache
+
+        :param key: Cache key
+        :param record: Count the lookup towards hit/miss statistics
+
+        :return: Whether the entry was found and the cached value
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= monotonic():
+                del self._data[key]
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+
+        if entry is None:
+            if record:
+                self.misses += 1
+            return False, None
+
+        if record:
+            self.hits += 1
+        return True, entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Add entry to cache, evicting the least recently used if full
+
+        :param key: Cache key
+        :param value: Value to cache
+        :param ttl: Time-to-live in seconds. Default: ``self.ttl``
+        """
+        if self.maxsize <= 0:
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Remove all entries with keys matching ``predicate``
+
+        :param predicate: Function returning True for keys to remove
+
+        :return: Number of entries removed
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        """Remove all entries and reset statistics"""
+        with self._lock:
+            self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """Return cache size and hit/miss statistics"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+
+class SQLiteCache:
+    """
+    Cache shared by processes through a SQLite database, with the interface
+    of ``TTLCache``
+
+    Entries expire by wall-clock time and the least recently used entries
+    are evicted beyond ``maxsize``. Hit/miss statistics are per process.
+    Keys are tuples of JSON values.
+
+    ``get`` and ``set`` run on the event loop, so they wait at most
+    ``timeout`` seconds for a database locked by another process or
+    thread, and use an in-process ``TTLCache`` (``fallback``) if it stays
+    locked. ``invalidate`` and ``clear`` must reach the shared entries, so
+    they wait up to ``write_timeout`` seconds on a connection of their own
+    and should run in a thread.
+
+    :param db_file: Filename for cache database
+    :param maxsize: Maximum number of entries to hold
+    :param ttl: Default time-to-live in seconds for an entry
+    :param error_ttl: Time-to-live in seconds for cached failures
+    :param encode: Function serializing values to text
+    :param decode: Function deserializing values from text
+    :param timeout: Seconds ``get`` and ``set`` wait for a locked database
+    :param write_timeout: Seconds ``invalidate`` and ``clear`` wait for a
+                          locked database
+    """
+
+    schema = [
+        """CREATE TABLE IF NOT EXISTS cache (
+               key TEXT PRIMARY KEY,
+               value TEXT NOT NULL,
+               expires REAL NOT NULL,
+               accessed REAL NOT NULL
+           )""",
+        """CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)""",
+    ]
+
+    def __init__(self, db_file: str, maxsize: int = 512, ttl: float = 600.0,
+                 error_ttl: float = 30.0,
+                 encode: Callable[[Any], str] = json.dumps,
+                 decode: Callable[[str], Any] = json.loads,
+                 timeout: float = 0.1, write_timeout: float = 30.0):
+        self.db_file = db_file
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.encode = encode
+        self.decode = decode
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        self.hits = 0
+        self.misses = 0
+        # Number of lookups and writes that found the database locked
+        self.fallbacks = 0
+        self.fallback = TTLCache(maxsize=maxsize, ttl=ttl,
+                                 error_ttl=error_ttl)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connect(self, timeout: float) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, timeout=timeout,
+                               isolation_level=None,
+                               check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.schema:
+                conn.execute(statement)
+        except sqlite3.OperationalError:
+            conn.close()
+            raise
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not shared with forked processes
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = self._connect(self.timeout)
+            self._pid = os.getpid()
+        return self._conn
+
+    def _acquire(self) -> bool:
+        """Take the connection lock, waiting at most ``timeout`` seconds"""
+        if self._lock.acquire(timeout=self.timeout):
+            return True
+        self._fall_back(sqlite3.OperationalError("connection is busy"))
+        return False
+
+    def _fall_back(self, err: sqlite3.OperationalError):
+        self.fallbacks += 1
+        if self.fallbacks == 1:
+            print(f"WARNING: Shared cache {self.db_file} is locked, "
+                  f"using in-process cache ({err})")
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return json.dumps(list(key) if isinstance(key, tuple) else key)
+
+    @staticmethod
+    def _load_key(text: str) -> Hashable:
+        key = json.loads(text)
+        return tuple(key) if isinstance(key, list) else key
+
+    def __len__(self) -> int:
+        if not self._acquire():
+            return len(self.fallback)
+        try:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM cache WHERE expires > ?",
+                (time(),)).fetchone()[0]
+        except sqlite3.OperationalError as err:
+            self._fall_back(err)
+            return len(self.fallback)
+        finally:
+            self._lock.release()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, record=False)[0]
+
+    def get(self, key: Hashable, record: bool = True) -> Tuple[bool, Any]:
+        """
+        Retrieve entry from cache
+
+        :param key: Cache key
+        :param record: Count the lookup towards hit/miss statistics
+
+        :return: Whether the entry was found and the cached value
+        """
+        now = time()
+        row = None
+        if self._acquire():
+            try:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT value, expires FROM cache WHERE key = ?",
+                    (self._key(key),)).fetchone()
+                if row is not None and row[1] <= now:
+                    row = None
+                    conn.execute("DELETE FROM cache WHERE key = ? "
+                                 "AND expires <= ?", (self._key(key), now))
+                elif row is not None:
+                    conn.execute("UPDATE cache SET accessed = ? "
+                                 "WHERE key = ?", (now, self._key(key)))
+            except sqlite3.OperationalError as err:
+                # Readers are not blocked by a writer (WAL), so a row
+                # read before the error is still a hit; it is only not
+                # marked as recently used
+                if row is None:
+                    self._fall_back(err)
+            finally:
+                self._lock.release()
+
+        if row is None:
+            # Entries set while the database was locked
+            hit, value = self.fallback.get(key, record=False)
+            if record:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            return hit, value
+
+        if record:
+            self.hits += 1
+        return True, self.decode(row[0])
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Add entry to cache, evicting the least recently used if full
+
+        :param key: Cache key
+        :param value: Value to cache
+        :param ttl: Time-to-live in seconds. Default: ``self.ttl``
+        """
+        if self.maxsize <= 0:
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        now = time()
+        text = self.encode(value)
+        if self._acquire():
+            try:
+                conn = self._connection()
+                conn.execute("INSERT OR REPLACE INTO cache "
+                             "(key, value, expires, accessed) "
+                             "VALUES (?, ?, ?, ?)",
+                             (self._key(key), text, now + ttl, now))
+                excess = conn.execute("SELECT COUNT(*) FROM cache")\
+                    .fetchone()[0] - self.maxsize
+                if excess > 0:
+                    conn.execute("DELETE FROM cache WHERE key IN (SELECT key "
+                                 "FROM cache ORDER BY accessed LIMIT ?)",
+                                 (excess,))
+                return
+            except sqlite3.OperationalError as err:
+                self._fall_back(err)
+            finally:
+                self._lock.release()
+        self.fallback.maxsize = self.maxsize
+        self.fallback.set(key, value, ttl=ttl)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Remove all entries with keys matching ``predicate``
+
+        :param predicate: Function returning True for keys to remove
+
+        :return: Number of entries removed
+        """
+        removed = self.fallback.invalidate(predicate)
+        # Waiting for the database does not hold up get and set
+        conn = self._connect(self.write_timeout)
+        try:
+            keys = [text for text, in conn.execute("SELECT key FROM cache")
+                    if predicate(self._load_key(text))]
+            conn.executemany("DELETE FROM cache WHERE key = ?",
+                             [(text,) for text in keys])
+        finally:
+            conn.close()
+        return removed + len(keys)
+
+    def clear(self):
+        """Remove all entries and reset statistics"""
+        self.fallback.clear()
+        conn = self._connect(self.write_timeout)
+        try:
+            conn.execute("DELETE FROM cache")
+        finally:
+            conn.close()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        """Return cache size and hit/miss statistics"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'fallbacks': self.fallbacks,
+        }
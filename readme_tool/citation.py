@@ -0,0 +1,102 @@
+import re
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+# "Authors (Year): Rest of citation"
+author_year_pattern = re.compile(r'^(?P<authors>.*?)\s*\((?P<year>\d{4})\):\s*'
+                                 r'(?P<rest>.*)$', re.DOTALL)
+
+# Trailing DOI link, e.g. "https://doi.org/10.25422/azu.data.12966581.v1"
+doi_pattern = re.compile(r'\s*(?P<url>https?://(?:dx\.)?doi\.org/'
+                         r'(?P<doi>\S+?))\.?\s*$')
+
+# Sentence boundary between title, publisher and item type
+sentence_pattern = re.compile(r'(?<=[.?!])\s+')
+
+author_sep_pattern = re.compile(r'\s*;\s*')
+
+end_punctuation = ('.', '?', '!')
+
+
+class Citation(NamedTuple):
+    """Components of a Figshare citation string"""
+    authors: Tuple[str, ...]
+    year: Optional[str]
+    title: str
+    publisher: str
+    item_type: str
+    doi: str
+    doi_url: str
+    raw: str
+
+    def preferred_citation(self) -> List[str]:
+        """
+        Return citation as separate lines for the README:
+        authors and year, title, publisher, item type and DOI link
+
+        :return: List of citation lines
+        """
+        if self.year is None:
+            return [self.raw]
+
+        lines = [f"{'; '.join(self.authors)} ({self.year})."]
+        lines += [_end_sentence(text) for text in
+                  [self.title, self.publisher, self.item_type] if text]
+        if self.doi_url:
+            lines.append(self.doi_url)
+        return lines
+
+
+def _end_sentence(text: str) -> str:
+    return text if text.endswith(end_punctuation) else f"{text}."
+
+
+def _strip_period(text: str) -> str:
+    return text[:-1] if text.endswith('.') else text
+
+
+@lru_cache(maxsize=2048)
+def parse_citation(citation: str) -> Citation:
+    """
+    Parse a Figshare citation string, e.g.
+    ``Ly, Chun; Doe, Jane (2020): Title. University of Arizona. Dataset.
+    https://doi.org/10.25422/azu.data.12966581.v1``
+
+    The title may contain periods: the last two sentences before the DOI
+    link are the publisher and item type. Results are memoized by
+    citation string.
+
+    :param citation: Figshare citation
+
+    :return: Parsed citation. ``year`` is None if the citation could
+             not be parsed
+    """
+    citation = ' '.join(citation.split())
+    match = author_year_pattern.match(citation)
+    if match is None:
+        return Citation((), None, '', '', '', '', '', citation)
+
+    authors = tuple(name for name in
+                    author_sep_pattern.split(match.group('authors').strip())
+                    if name)
+    rest = match.group('rest')
+
+    doi = doi_url = ''
+    doi_match = doi_pattern.search(rest)
+    if doi_match is not None:
+        doi = doi_match.group('doi')
+        doi_url = doi_match.group('url')
+        rest = rest[:doi_match.start()]
+
+    sentences = [text for text in sentence_pattern.split(rest.strip())
+                 if text]
+    title = publisher = item_type = ''
+    if len(sentences) >= 3:
+        title = ' '.join(sentences[:-2])
+        publisher, item_type = sentences[-2:]
+    elif sentences:
+        title = ' '.join(sentences)
+
+    return Citation(authors, match.group('year'), _strip_period(title),
+                    _strip_period(publisher), _strip_period(item_type),
+                    doi, doi_url, citation)
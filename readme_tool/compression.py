@@ -0,0 +1,233 @@
+import zlib
+from typing import List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Brotli is optional; without it, responses are only gzipped
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Compress responses. Set on app startup
+enabled = True
+
+# Responses smaller than this many bytes are sent uncompressed. The start
+# of streamed responses is held back until this many bytes are available
+minimum_size = 1024
+
+# Compression levels, favoring speed over size for dynamic responses
+gzip_level = 6
+brotli_quality = 4
+
+# Media types that are compressed
+compressible_types = ('text/html', 'text/plain', 'text/markdown',
+                      'application/json', 'application/x-ndjson')
+
+
+def parse_accept_encoding(value: str) -> List[Tuple[str, float]]:
+    """
+    Parse ``Accept-Encoding`` header
+
+    :return: Encodings and quality values, in header order
+    """
+    encodings = []
+    for item in value.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings.append((name.strip().lower(), quality))
+    return encodings
+
+
+def accepts(accept_encoding: str, encoding: str) -> bool:
+    """
+    Return whether ``encoding`` is accepted with a non-zero quality
+
+    :param accept_encoding: ``Accept-Encoding`` header
+    :param encoding: Content coding (e.g., ``gzip``)
+    """
+    accepted = dict(parse_accept_encoding(accept_encoding))
+    return accepted.get(encoding, accepted.get('*', 0.0)) > 0
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Return preferred supported encoding (``br`` or ``gzip``) accepted by
+    the client, or None. Brotli is preferred on equal quality
+
+    :param accept_encoding: ``Accept-Encoding`` header
+    """
+    accepted = dict(parse_accept_encoding(accept_encoding))
+    wildcard = accepted.get('*', 0.0)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best, best_quality = None, 0.0
+    for name in candidates:
+        quality = accepted.get(name, wildcard)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def encode_etag(etag: str, encoding: str) -> str:
+    """
+    Return ETag of the ``encoding`` coded representation, e.g.,
+    ``"abc"`` -> ``"abc-gzip"``
+    """
+    if etag.endswith('"'):
+        return f'{etag[:-1]}-{encoding}"'
+    return etag
+
+
+def decode_etag(etag: str) -> str:
+    """Return ETag of the uncompressed representation (see ``encode_etag``)"""
+    for suffix in ('-gzip"', '-br"'):
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+class _Compressor:
+    """Streaming compressor for ``gzip`` or ``br``"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """Compress ``data``, flushing it so the client can decode it now"""
+        if self.encoding == 'br':
+            output = self._brotli.process(data)
+            return output + (self._brotli.finish() if final
+                             else self._brotli.flush())
+        output = self._zlib.compress(data)
+        return output + self._zlib.flush(zlib.Z_FINISH if final
+                                         else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """
+    Compress HTML and JSON responses with Brotli or gzip, as negotiated
+    from ``Accept-Encoding``
+
+    Responses are compressed if at least ``minimum_size`` bytes. Streamed
+    responses are compressed chunk by chunk once that much is available,
+    and each chunk is flushed so the browser receives it without waiting
+    for the rest. Responses that already have a ``Content-Encoding`` are
+    left as they are.
+
+    Compressed responses get their own ``ETag`` for each encoding (see
+    ``encode_etag``). The app sees ``If-None-Match`` with the ETags of the
+    uncompressed representation.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive,
+                       send: Send) -> None:
+        if not enabled or scope['type'] != 'http' or \
+                scope.get('method') == 'HEAD':
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        # ETags of compressed representations, by uncompressed ETag
+        encoded_tags = {}
+        if_none_match = request_headers.get('if-none-match')
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            encoded_tags = {decode_etag(tag): tag for tag in tags
+                            if decode_etag(tag) != tag}
+            if encoded_tags:
+                scope = dict(scope)
+                scope['headers'] = [
+                    (key, value) for key, value in scope['headers']
+                    if key != b'if-none-match'
+                ] + [(b'if-none-match', ', '.join(
+                    decode_etag(tag) for tag in tags).encode('latin-1'))]
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        buffered: List[bytes] = []
+        buffered_size = 0
+
+        async def _send(message: Message):
+            nonlocal start, compressor, buffered, buffered_size
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                media_type = headers.get('content-type', '').split(';')[0]
+                if message['status'] == 304:
+                    etag = headers.get('etag')
+                    if etag in encoded_tags:
+                        # Matched a compressed representation
+                        mutable = MutableHeaders(scope=message)
+                        mutable['ETag'] = encoded_tags[etag]
+                        mutable.add_vary_header('Accept-Encoding')
+                elif media_type.strip() in compressible_types and \
+                        'content-encoding' not in headers:
+                    MutableHeaders(scope=message).add_vary_header(
+                        'Accept-Encoding')
+                    # Compression is decided once minimum_size bytes of
+                    # the body are available
+                    start = message
+                    return
+                await send(message)
+                return
+
+            if message['type'] != 'http.response.body' or start is None:
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if compressor is None:
+                buffered.append(body)
+                buffered_size += len(body)
+                if more_body and buffered_size < minimum_size:
+                    return
+                body = b''.join(buffered)
+                buffered = []
+                if not more_body and buffered_size < minimum_size:
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': body})
+                    start = None
+                    return
+                compressor = _Compressor(encoding)
+                headers = MutableHeaders(scope=start)
+                headers['Content-Encoding'] = encoding
+                if 'content-length' in headers:
+                    del headers['Content-Length']
+                etag = headers.get('etag')
+                if etag:
+                    headers['ETag'] = encode_etag(etag, encoding)
+                if not more_body:
+                    body = compressor.compress(body, final=True)
+                    headers['Content-Length'] = str(len(body))
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+                await send(start)
+
+            await send({'type': 'http.response.body',
+                        'body': compressor.compress(body, final=not more_body),
+                        'more_body': more_body})
+
+        await self.app(scope, receive, _send)
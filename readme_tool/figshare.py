@@ -1,15 +1,97 @@
-from typing import Union, Optional
-import requests
+import asyncio
+import json
+from typing import AsyncIterator, List, Union, Optional
 
-from ldcoolp_figshare import FigshareInstituteAdmin
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
-from fastapi import APIRouter, HTTPException
+from . import __version__ as rem_version
+from . import metrics, ratelimit
+from .cache import SQLiteCache, TTLCache
+from .citation import parse_citation
+from .figshare_client import get_client, base_urls
+from .http_cache import conditional, http_date, metadata_cache_control, \
+    strong_etag
+from .resilience import CircuitOpenError
 
 router = APIRouter()
 
 api_key: Optional[str] = None
 stage_api_key: Optional[str] = None
 
+# Cache of get_figshare results keyed by
+# (article_id, curation_id, stage, allow_approved)
+metadata_cache = TTLCache(maxsize=512, ttl=600.0, error_ttl=30.0)
+metrics.register_cache('figshare_metadata', metadata_cache)
+
+
+def dump_cache_value(value: Union[dict, HTTPException]) -> str:
+    """Serialize ``get_figshare`` result or cached error for a shared cache"""
+    if isinstance(value, HTTPException):
+        value = {'__error__': {'status_code': value.status_code,
+                               'detail': value.detail}}
+    return json.dumps(value)
+
+
+def load_cache_value(text: str) -> Union[dict, HTTPException]:
+    """Deserialize value stored with ``dump_cache_value``"""
+    value = json.loads(text)
+    if '__error__' in value:
+        return HTTPException(**value['__error__'])
+    return value
+
+
+def use_shared_cache(db_file: str):
+    """
+    Replace ``metadata_cache`` with a cache shared by worker processes
+
+    :param db_file: Filename for cache database
+    """
+    global metadata_cache
+    metadata_cache = SQLiteCache(db_file, maxsize=metadata_cache.maxsize,
+                                 ttl=metadata_cache.ttl,
+                                 error_ttl=metadata_cache.error_ttl,
+                                 encode=dump_cache_value,
+                                 decode=load_cache_value)
+    metrics.register_cache('figshare_metadata', metadata_cache)
+
+
+# Limits for /metadata/batch requests
+max_batch_size = 200
+max_batch_concurrency = 16
+
+
+def _client_stat(func) -> dict:
+    return {('stage' if stage else 'production',): func(get_client(stage))
+            for stage in base_urls}
+
+
+breaker_states = {'closed': 0, 'half_open': 1, 'open': 2}
+metrics.gauge('rem_figshare_circuit_state',
+              'Figshare circuit breaker state (0: closed, 1: half-open, 2: open)',
+              ('stage',),
+              lambda: _client_stat(lambda c: breaker_states[c.breaker.state]))
+metrics.gauge('rem_figshare_circuit_rejected',
+              'Figshare calls rejected by open circuit breaker', ('stage',),
+              lambda: _client_stat(lambda c: c.breaker.rejected))
+metrics.gauge('rem_figshare_coalesced',
+              'Figshare calls coalesced into an in-flight call', ('stage',),
+              lambda: _client_stat(lambda c: c.flights.coalesced))
+
+
+class MetadataItem(BaseModel):
+    article_id: int
+    curation_id: Optional[int] = None
+
+
+class MetadataBatch(BaseModel):
+    items: List[MetadataItem]
+    stage: bool = False
+    allow_approved: bool = False
+    concurrency: int = 8
+
 
 def figshare_metadata_readme(figshare_dict: dict) -> dict:
     """
@@ -30,12 +112,8 @@ def figshare_metadata_readme(figshare_dict: dict) -> dict:
     else:
         readme_dict['article_id'] = figshare_dict['id']
 
-    single_str_citation = figshare_dict['citation']
-
-    # Handle period in author list.  Assume no period in dataset title
-    author_list = ([single_str_citation.split('):')[0] + ').'])
-    author_list += [str_row + '.' for str_row in
-                    single_str_citation.split('): ')[1].split('. ')]
+    citation = parse_citation(figshare_dict['citation'])
+    author_list = citation.preferred_citation()
 
     readme_dict.update({
         'title': figshare_dict['title'],
@@ -49,10 +127,32 @@ def figshare_metadata_readme(figshare_dict: dict) -> dict:
     return readme_dict
 
 
+@router.get('/figshare/stats/')
+async def get_stats() -> dict:
+    """
+    API call for Figshare metadata cache, request coalescing and
+    circuit breaker statistics
+
+    \f
+    :return: Cache, single-flight and circuit breaker statistics
+    """
+    return {
+        'cache': metadata_cache.stats(),
+        'single_flight': {
+            'stage' if stage else 'production': get_client(stage).flights.stats()
+            for stage in base_urls
+        },
+        'circuit_breaker': {
+            'stage' if stage else 'production': get_client(stage).breaker.stats()
+            for stage in base_urls
+        },
+    }
+
+
 @router.get('/figshare/{article_id}/')
-def get_figshare(article_id: int, curation_id: Optional[int] = None,
-                 stage: bool = False,
-                 allow_approved: bool = False) -> Union[dict, HTTPException]:
+async def get_figshare(article_id: int, curation_id: Optional[int] = None,
+                       stage: bool = False,
+                       allow_approved: bool = False) -> Union[dict, HTTPException]:
     """
     API call to retrieve Figshare metadata
 
@@ -66,18 +166,54 @@ def get_figshare(article_id: int, curation_id: Optional[int] = None,
     :return: Figshare API response
     """
 
-    if not stage:
-        base_url = "https://api.figshare.com"
-    else:
-        base_url = "https://api.figsh.com"
+    key = (article_id, curation_id, stage, allow_approved)
+    hit, value = metadata_cache.get(key)
+    if not hit:
+        import httpx  # Deferred, see figshare_client
 
-    token = api_key if not stage else stage_api_key
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'token {token}'
-    }
+        try:
+            value = await fetch_figshare(article_id, curation_id=curation_id,
+                                         stage=stage,
+                                         allow_approved=allow_approved)
+        except HTTPException as err:
+            # Cache client errors (e.g., 401 not pending) for a short time
+            if 400 <= err.status_code < 500 and err.status_code != 429:
+                metadata_cache.set(key, err, ttl=metadata_cache.error_ttl)
+            raise err
+        except (CircuitOpenError, httpx.HTTPError) as err:
+            raise HTTPException(
+                status_code=503,
+                detail=f"FastAPI: Figshare is unavailable ({err})"
+            )
+
+        metadata_cache.set(key, value)
+        if curation_id is None:
+            metadata_cache.set((article_id, value['id'], stage,
+                                allow_approved), value)
+
+    if isinstance(value, HTTPException):
+        raise HTTPException(status_code=value.status_code,
+                            detail=value.detail)
+    return value
+
+
+async def fetch_figshare(article_id: int, curation_id: Optional[int] = None,
+                         stage: bool = False,
+                         allow_approved: bool = False) -> dict:
+    """
+    Retrieve Figshare curation metadata from the Figshare API (uncached)
+
+    :param article_id: Figshare article ID
+    :param curation_id: Figshare curation ID
+    :param stage: Figshare stage or production API.
+                  Stage is available for Figshare institutions
+    :param allow_approved: Return curation even if it is not pending
 
-    fs_admin = FigshareInstituteAdmin(token=token, stage=stage)
+    :return: Figshare API response
+    """
+
+    token = api_key if not stage else stage_api_key
+    fs_client = get_client(stage)
 
     if curation_id is None:
         status = ''
@@ -85,8 +221,8 @@ def get_figshare(article_id: int, curation_id: Optional[int] = None,
             status = 'pending'
 
         curation_response = \
-            fs_admin.get_curation_list(article_id, status=status,
-                                       process=False)
+            await fs_client.get_curation_list(token, article_id,
+                                              status=status)
         if curation_response.status_code != 200:
             raise HTTPException(
                 status_code=curation_response.status_code,
@@ -100,9 +236,8 @@ def get_figshare(article_id: int, curation_id: Optional[int] = None,
                       f"(status={curation_json[0]['status']})")
                 curation_id = curation_json[0]['id']
             else:
-                art_response = requests.get(
-                    f"{base_url}/v2/articles/{article_id}",
-                    headers=headers)
+                art_response = await fs_client.get_article(token,
+                                                           article_id)
                 if art_response.status_code != 200:
                     raise HTTPException(
                         status_code=art_response.status_code,
@@ -116,7 +251,7 @@ def get_figshare(article_id: int, curation_id: Optional[int] = None,
                     )
 
     if curation_id is not None:
-        response = fs_admin.get_curation_details(curation_id, process=False)
+        response = await fs_client.get_curation_details(token, curation_id)
         if response.status_code != 200:
             raise HTTPException(
                 status_code=response.status_code,
@@ -136,29 +271,127 @@ def get_figshare(article_id: int, curation_id: Optional[int] = None,
                 return r_json
 
 
+@router.delete('/figshare/cache/{article_id}/')
+async def clear_cache(article_id: int) -> dict:
+    """
+    API call to remove cached Figshare metadata for an article
+
+    \f
+    :param article_id: Figshare article ID
+
+    :return: Number of cache entries removed
+    """
+    # Waits for the shared cache database, if locked
+    removed = await run_in_threadpool(metadata_cache.invalidate,
+                                      lambda key: key[0] == article_id)
+    return {'article_id': article_id, 'removed': removed}
+
+
 @router.get('/metadata/{article_id}/')
 async def get_readme_metadata(article_id: int,
                               curation_id: Optional[int] = None,
                               stage: bool = False,
-                              allow_approved: bool = False) -> dict:
+                              allow_approved: bool = False,
+                              request: Request = None,
+                              response: Response = None) \
+        -> Union[dict, Response]:
     """
     API call for README metadata based on Figshare response
 
+    Responses have an ETag derived from the curation's modified date.
+    Requests with a matching ``If-None-Match`` receive a 304 response.
+
     \f
     :param article_id: Figshare article ID
     :param curation_id: Figshare curation ID
     :param stage: Figshare stage or production API.
                   Stage is available for Figshare institutions
     :param allow_approved: Return 200 responses even if curation is not pending
+    :param request: HTTP request (set by FastAPI)
+    :param response: HTTP response (set by FastAPI)
 
     :return: README metadata API response
     """
 
     try:
-        figshare_dict = get_figshare(article_id, curation_id=curation_id,
-                                     stage=stage,
-                                     allow_approved=allow_approved)
-        readme_dict = figshare_metadata_readme(figshare_dict)
-        return readme_dict
+        figshare_dict = await get_figshare(article_id, curation_id=curation_id,
+                                           stage=stage,
+                                           allow_approved=allow_approved)
     except HTTPException as e:
         raise e
+
+    if request is not None:
+        modified_date = figshare_dict.get('modified_date')
+        if modified_date:
+            etag = strong_etag(rem_version, figshare_dict['id'],
+                               modified_date, stage)
+        else:
+            etag = strong_etag(rem_version, figshare_dict, stage)
+        not_modified = conditional(request, response, etag,
+                                   metadata_cache_control,
+                                   http_date(modified_date))
+        if not_modified is not None:
+            return not_modified
+
+    readme_dict = figshare_metadata_readme(figshare_dict)
+    return readme_dict
+
+
+async def _batch_item(item: MetadataItem, batch: MetadataBatch,
+                      semaphore: asyncio.Semaphore) -> dict:
+    """Retrieve README metadata for one item of a batch request"""
+    result = {'article_id': item.article_id, 'curation_id': item.curation_id}
+    async with semaphore:
+        try:
+            # Yield to interactive page loads at the rate limiter
+            with ratelimit.priority_scope('batch'):
+                metadata = await get_readme_metadata(
+                    item.article_id, curation_id=item.curation_id,
+                    stage=batch.stage, allow_approved=batch.allow_approved)
+            result.update({'status_code': 200, 'metadata': metadata})
+        except HTTPException as err:
+            result.update({'status_code': err.status_code,
+                           'detail': err.detail})
+        except Exception as err:
+            result.update({'status_code': 502,
+                           'detail': f"FastAPI: Figshare request failed ({err})"})
+    return result
+
+
+@router.post('/metadata/batch')
+async def post_readme_metadata_batch(batch: MetadataBatch,
+                                     stream: bool = False) \
+        -> Union[List[dict], StreamingResponse]:
+    """
+    API call for README metadata for many articles at once
+
+    Articles are retrieved concurrently (up to ``concurrency`` at a time).
+    Each result includes ``status_code`` and either ``metadata`` or
+    ``detail`` for the error.
+
+    \f
+    :param batch: Articles (``article_id`` and optional ``curation_id``),
+                  Figshare ``stage``, ``allow_approved`` and ``concurrency``
+    :param stream: Stream results as JSON Lines in order of completion.
+                   Otherwise, return a list in request order
+
+    :return: README metadata results
+    """
+    if len(batch.items) > max_batch_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"FastAPI: Batch is limited to {max_batch_size} items"
+        )
+
+    concurrency = max(1, min(batch.concurrency, max_batch_concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [_batch_item(item, batch, semaphore) for item in batch.items]
+
+    if not stream:
+        return list(await asyncio.gather(*tasks))
+
+    async def _stream() -> AsyncIterator[str]:
+        for task in asyncio.as_completed(tasks):
+            yield json.dumps(await task) + '\n'
+
+    return StreamingResponse(_stream(), media_type='application/x-ndjson')
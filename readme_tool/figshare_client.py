@@ -0,0 +1,293 @@
+import asyncio
+from time import perf_counter
+from typing import TYPE_CHECKING, Optional, Dict, Set, Union
+
+from . import ratelimit
+from .metrics import figshare_seconds
+from .resilience import CircuitBreaker, RetryPolicy, retry_statuses
+from .singleflight import SingleFlight
+
+# httpx is imported on first use to keep app startup fast
+if TYPE_CHECKING:
+    import httpx
+
+# Figshare API hosts for production (stage=False) and stage (stage=True)
+base_urls = {
+    False: "https://api.figshare.com",
+    True: "https://api.figsh.com",
+}
+
+# Keep-alive pool sizing for each Figshare host (``httpx.Limits``)
+pool_limits = {'max_connections': 20, 'max_keepalive_connections': 10,
+               'keepalive_expiry': 60.0}
+
+# Per-call timeouts in seconds (``httpx.Timeout`` arguments or instance)
+timeout: Union[dict, "httpx.Timeout"] = {'timeout': 10.0, 'connect': 5.0}
+
+# Retries for connection errors, timeouts and 429/5xx responses
+retry_policy = RetryPolicy(retries=2, backoff_base=0.2, backoff_max=2.0)
+
+# Circuit breaker settings for each Figshare host
+breaker_threshold = 5
+breaker_reset_timeout = 30.0
+
+# Optional transport override (e.g., ``httpx.ASGITransport`` for testing)
+transport: Optional["httpx.AsyncBaseTransport"] = None
+
+_clients: Dict[bool, "FigshareClient"] = {}
+
+
+class FigshareClient:
+    """
+    Asynchronous client for the Figshare institution API
+
+    A single ``httpx.AsyncClient`` (and its keep-alive connection pool) is
+    kept for each Figshare host for the lifetime of the app.
+
+    :param stage: Figshare stage or production API
+    """
+
+    def __init__(self, stage: bool = False):
+        self.stage = stage
+        self.base_url = base_urls[stage]
+        self._session: Optional["httpx.AsyncClient"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: Set[asyncio.Future] = set()
+        self.flights = SingleFlight()
+        # Rate limit priority of each in-flight call
+        self._priorities: Dict[tuple, ratelimit.SharedPriority] = {}
+        self.breaker = CircuitBreaker(failure_threshold=breaker_threshold,
+                                      reset_timeout=breaker_reset_timeout)
+
+    def _get_session(self) -> "httpx.AsyncClient":
+        """Return pooled ``httpx.AsyncClient``, creating it on first use"""
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        # Pooled connections are bound to the event loop that opened them
+        if self._session is None or self._loop is not loop:
+            if self._session is not None:
+                self._close_stale(self._session, self._loop)
+            self._session = httpx.AsyncClient(
+                base_url=self.base_url, limits=httpx.Limits(**pool_limits),
+                timeout=httpx.Timeout(**timeout)
+                if isinstance(timeout, dict) else timeout,
+                transport=transport)
+            self._loop = loop
+        return self._session
+
+    def _close_stale(self, session: "httpx.AsyncClient",
+                     loop: Optional[asyncio.AbstractEventLoop]):
+        """
+        Close ``session`` left over from event loop ``loop``. It is closed
+        on its own loop if that is still running in another thread, and
+        otherwise from the current loop as far as the old loop allows
+        """
+        async def _aclose():
+            try:
+                await session.aclose()
+            except RuntimeError:
+                # Transports of a closed event loop cannot be closed cleanly
+                pass
+
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(_aclose(), loop)
+            return
+        task = asyncio.ensure_future(_aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def get(self, token: Optional[str], path: str,
+                  params: Optional[dict] = None,
+                  endpoint: str = 'other') -> "httpx.Response":
+        """
+        Perform GET request against the Figshare API.
+        Concurrent identical requests share one upstream call, sent when
+        the rate limiter for ``token`` allows it, at the highest priority
+        of the callers.
+
+        Connection errors, timeouts and 429/5xx responses are retried with
+        jittered backoff. Repeated failures open the circuit breaker, after
+        which calls fail fast with ``CircuitOpenError``.
+
+        :param token: Figshare API token
+        :param path: API endpoint (e.g., ``/v2/articles/12345``)
+        :param params: Query parameters
+        :param endpoint: Endpoint label for metrics
+
+        :return: Figshare API response
+        """
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'token {token}'
+
+        key = (token, path, tuple(sorted((params or {}).items())))
+        name = ratelimit.priority.get()
+        shared = self._priorities.get(key)
+        if shared is not None:
+            # Joining an in-flight call
+            shared.raise_to(name)
+
+        def _start():
+            flight_priority = ratelimit.SharedPriority(name)
+            self._priorities[key] = flight_priority
+            return self._flight(key, flight_priority, token, path, params,
+                                headers, endpoint)
+
+        return await self.flights.do(key, _start)
+
+    async def _flight(self, key: tuple,
+                      flight_priority: "ratelimit.SharedPriority",
+                      token: Optional[str], path: str,
+                      params: Optional[dict], headers: dict,
+                      endpoint: str) -> "httpx.Response":
+        ratelimit.shared_priority.set(flight_priority)
+        try:
+            return await self._get_with_retry(token, path, params, headers,
+                                              endpoint)
+        finally:
+            if self._priorities.get(key) is flight_priority:
+                del self._priorities[key]
+
+    async def _get_with_retry(self, token: Optional[str], path: str,
+                              params: Optional[dict],
+                              headers: dict,
+                              endpoint: str) -> "httpx.Response":
+        self.breaker.before_call()
+        # Every exit records a result, so a half-open trial cannot get stuck
+        try:
+            response = await self._send(token, path, params, headers,
+                                        endpoint)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled: no result from Figshare
+            self.breaker.release()
+            raise
+        if response.status_code in retry_statuses:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def _send(self, token: Optional[str], path: str,
+                    params: Optional[dict], headers: dict,
+                    endpoint: str) -> "httpx.Response":
+        """Send request, with retries. Returns the last response"""
+        import httpx
+
+        stage = str(self.stage).lower()
+        attempt = 0
+        while True:
+            await ratelimit.acquire(token, self.stage)
+            t0 = perf_counter()
+            try:
+                response = await self._get_session().get(path, params=params,
+                                                         headers=headers)
+            except httpx.TransportError as err:
+                figshare_seconds.observe(perf_counter() - t0, endpoint, stage,
+                                         type(err).__name__)
+                if attempt >= retry_policy.retries:
+                    raise
+                retry_after = None
+            else:
+                figshare_seconds.observe(perf_counter() - t0, endpoint, stage,
+                                         str(response.status_code))
+                if response.status_code not in retry_statuses or \
+                        attempt >= retry_policy.retries:
+                    return response
+                retry_after = response.headers.get('Retry-After')
+
+            await asyncio.sleep(retry_policy.delay(attempt, retry_after))
+            attempt += 1
+
+    async def get_curation_list(self, token: Optional[str],
+                                article_id: Optional[int] = None,
+                                status: str = '', offset: int = 0,
+                                limit: int = 1000, order: str = '',
+                                order_direction: str = ''
+                                ) -> "httpx.Response":
+        """
+        Retrieve list of curation records for ``article_id``
+
+        :param token: Figshare API token
+        :param article_id: Figshare article ID. Default: All records
+        :param status: Filter by status of review. Options are:
+               ['', 'pending', 'approved', 'rejected', 'closed']
+        :param offset: Number of records to skip
+        :param limit: Maximum number of records
+        :param order: Sort field. Options are:
+               ['', 'created_date', 'modified_date']
+        :param order_direction: Sort direction. Options are:
+               ['', 'asc', 'desc']
+
+        :return: Figshare API response
+        """
+        params = {'offset': offset, 'limit': limit}
+        if article_id is not None:
+            params['article_id'] = article_id
+        if status:
+            params['status'] = status
+        if order:
+            params['order'] = order
+        if order_direction:
+            params['order_direction'] = order_direction
+        return await self.get(token, '/v2/account/institution/reviews',
+                              params=params, endpoint='curation_list')
+
+    async def get_curation_details(self, token: Optional[str],
+                                   curation_id: int) -> "httpx.Response":
+        """
+        Retrieve details about a specified curation, ``curation_id``
+
+        :param token: Figshare API token
+        :param curation_id: Figshare curation ID
+
+        :return: Figshare API response
+        """
+        return await self.get(token,
+                              f'/v2/account/institution/review/{curation_id}',
+                              endpoint='curation_details')
+
+    async def get_article(self, token: Optional[str],
+                          article_id: int) -> "httpx.Response":
+        """
+        Retrieve public article metadata
+
+        :param token: Figshare API token
+        :param article_id: Figshare article ID
+
+        :return: Figshare API response
+        """
+        return await self.get(token, f'/v2/articles/{article_id}',
+                              endpoint='article')
+
+    async def aclose(self):
+        """Close pooled connections"""
+        if self._session is not None:
+            if self._loop is asyncio.get_running_loop():
+                await self._session.aclose()
+            else:
+                self._close_stale(self._session, self._loop)
+            self._session = None
+            self._loop = None
+
+
+def get_client(stage: bool = False) -> FigshareClient:
+    """
+    Return shared ``FigshareClient`` for production or stage API
+
+    :param stage: Figshare stage or production API
+
+    :return: Shared Figshare client
+    """
+    if stage not in _clients:
+        _clients[stage] = FigshareClient(stage=stage)
+    return _clients[stage]
+
+
+async def close_clients():
+    """Close all shared Figshare clients. Called on app shutdown"""
+    for client in _clients.values():
+        await client.aclose()
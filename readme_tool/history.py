@@ -0,0 +1,361 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
+from queue import Empty, LifoQueue
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import journal
+from .storage import get_storage
+
+# Record a revision of README records on each write
+enabled = True
+
+# Maximum number of pooled SQLite connections for each history file
+pool_size = 4
+
+# A full snapshot is stored once the deltas since the previous snapshot
+# add up to ``snapshot_ratio`` times the size of the record, so storage
+# grows with the size of the edits. ``max_deltas`` bounds the number of
+# deltas applied to rebuild a revision
+snapshot_ratio = 1.0
+max_deltas = 100
+
+# Text fields are diffed line by line, and changed lines of up to
+# ``refine_size`` characters character by character. Fields longer than
+# ``max_text_size`` characters are stored whole instead of diffed
+refine_size = 2000
+max_text_size = 200_000
+
+_histories: Dict[str, "History"] = {}
+_histories_lock = threading.Lock()
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(',', ':'))
+
+
+def _char_delta(old: str, new: str, offset: int) -> List[list]:
+    matcher = SequenceMatcher(None, old, new, autojunk=False)
+    return [[offset + i1, offset + i2, new[j1:j2]]
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+            if tag != 'equal']
+
+
+def text_delta(old: str, new: str) -> List[list]:
+    """
+    Return edits turning ``old`` into ``new``. Lines are matched first, so
+    the time grows with the number of lines rather than characters
+
+    :return: ``[start, end, text]`` edits, replacing ``old[start:end]``
+             with ``text``, in order
+    """
+    # Skip the common prefix and suffix before matching
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and \
+            old[-suffix - 1] == new[-suffix - 1]:
+        suffix += 1
+
+    old_mid = old[prefix:len(old) - suffix]
+    new_mid = new[prefix:len(new) - suffix]
+    if len(old_mid) <= refine_size and len(new_mid) <= refine_size:
+        return _char_delta(old_mid, new_mid, prefix)
+
+    old_lines = old_mid.splitlines(keepends=True)
+    new_lines = new_mid.splitlines(keepends=True)
+    old_starts = [0]
+    for line in old_lines:
+        old_starts.append(old_starts[-1] + len(line))
+    new_starts = [0]
+    for line in new_lines:
+        new_starts.append(new_starts[-1] + len(line))
+
+    edits = []
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        start, end = old_starts[i1], old_starts[i2]
+        text = new_mid[new_starts[j1]:new_starts[j2]]
+        if tag == 'replace' and end - start <= refine_size and \
+                len(text) <= refine_size:
+            edits.extend(_char_delta(old_mid[start:end], text,
+                                     prefix + start))
+        else:
+            edits.append([prefix + start, prefix + end, text])
+    return edits
+
+
+def apply_text_delta(old: str, edits: List[list]) -> str:
+    """Apply edits from ``text_delta`` to ``old``"""
+    parts = []
+    position = 0
+    for start, end, text in edits:
+        parts.append(old[position:start])
+        parts.append(text)
+        position = end
+    parts.append(old[position:])
+    return ''.join(parts)
+
+
+def diff(old: dict, new: dict) -> dict:
+    """
+    Return delta turning record ``old`` into ``new``. Text fields store
+    edits; other changed fields, and text longer than ``max_text_size``,
+    store their new value
+
+    :return: Delta with ``set``, ``edit`` and ``unset`` entries, or an
+             empty dict if the records are equal
+    """
+    delta = {}
+    for key, value in new.items():
+        old_value = old.get(key)
+        if key in old and old_value == value:
+            continue
+        if isinstance(old_value, str) and isinstance(value, str) and \
+                max(len(old_value), len(value)) <= max_text_size:
+            delta.setdefault('edit', {})[key] = text_delta(old_value, value)
+        else:
+            delta.setdefault('set', {})[key] = value
+    unset = [key for key in old if key not in new]
+    if unset:
+        delta['unset'] = unset
+    return delta
+
+
+def patch(record: dict, delta: dict) -> dict:
+    """Apply ``delta`` from ``diff`` to ``record``"""
+    record = {**record, **delta.get('set', {})}
+    for key, edits in delta.get('edit', {}).items():
+        record[key] = apply_text_delta(record[key], edits)
+    for key in delta.get('unset', []):
+        record.pop(key, None)
+    return record
+
+
+class History:
+    """
+    Revisions of README records, stored in SQLite (``<db_file>.history``)
+
+    Each revision is stored as a delta against the previous revision, with
+    periodic full snapshots. The latest revision of each record is kept
+    to compute the next delta. The first revision of a record is a
+    snapshot of the whole record, including fields written before history
+    was recorded (e.g., migrated records).
+
+    :param db_file: Filename for README database
+    """
+
+    schema = [
+        """CREATE TABLE IF NOT EXISTS revisions (
+               article_id INTEGER NOT NULL,
+               revision INTEGER NOT NULL,
+               created TEXT NOT NULL,
+               snapshot INTEGER NOT NULL,
+               data TEXT NOT NULL,
+               PRIMARY KEY (article_id, revision)
+           )""",
+        """CREATE TABLE IF NOT EXISTS heads (
+               article_id INTEGER PRIMARY KEY,
+               revision INTEGER NOT NULL,
+               delta_size INTEGER NOT NULL,
+               deltas INTEGER NOT NULL,
+               data TEXT NOT NULL
+           )""",
+    ]
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.path = f'{db_file}.history'
+        self._pool: LifoQueue = LifoQueue(maxsize=pool_size)
+        with self.connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                conn.execute(statement)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection from the pool"""
+        try:
+            conn = self._pool.get_nowait()
+        except Empty:
+            conn = sqlite3.connect(self.path, timeout=30.0,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            if self._pool.full():
+                conn.close()
+            else:
+                self._pool.put_nowait(conn)
+
+    def _stored(self, article_id: int) -> dict:
+        """Return first record for ``article_id``, with journaled fields"""
+        found = get_storage(self.db_file).get(article_id)
+        return {**(found[1] if found is not None else {}),
+                **(journal.pending(self.db_file, article_id) or {})}
+
+    def record(self, fields: dict) -> Optional[int]:
+        """
+        Record a revision after ``fields`` were written to the first record
+        for ``fields['article_id']``
+
+        :param fields: Fields written (merged into the previous revision)
+
+        :return: New revision number, or None if nothing changed
+        """
+        article_id = fields['article_id']
+        created = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                head = conn.execute(
+                    "SELECT revision, delta_size, deltas, data FROM heads "
+                    "WHERE article_id = ?", (article_id,)).fetchone()
+                if head is None:
+                    revision, delta_size, deltas, old = 0, 0, 0, None
+                    new = {**self._stored(article_id), **fields}
+                else:
+                    revision, delta_size, deltas, old = head
+                    old = json.loads(old)
+                    new = {**old, **fields}
+
+                new_data = _dumps(new)
+                revision += 1
+                if old is None:
+                    snapshot, data = True, new_data
+                else:
+                    delta = diff(old, new)
+                    if not delta:
+                        conn.execute("ROLLBACK")
+                        return None
+                    data = _dumps(delta)
+                    delta_size += len(data)
+                    deltas += 1
+                    snapshot = deltas > max_deltas or \
+                        delta_size > snapshot_ratio * len(new_data)
+                    if snapshot:
+                        data = new_data
+                if snapshot:
+                    delta_size, deltas = 0, 0
+
+                conn.execute("INSERT INTO revisions VALUES (?, ?, ?, ?, ?)",
+                             (article_id, revision, created, int(snapshot),
+                              data))
+                conn.execute("INSERT OR REPLACE INTO heads "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             (article_id, revision, delta_size, deltas,
+                              new_data))
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return revision
+
+    def revisions(self, article_id: int, after: int = 0,
+                  limit: int = 100) -> List[dict]:
+        """
+        List revisions of the record for ``article_id``
+
+        :param article_id: Figshare article ID
+        :param after: Only include revisions with a larger number
+        :param limit: Maximum number of revisions
+
+        :return: Revision number, creation time, whether it is a snapshot
+                 and stored size, in order
+        """
+        with self.connection() as conn:
+            rows = conn.execute(
+                "SELECT revision, created, snapshot, LENGTH(data) "
+                "FROM revisions WHERE article_id = ? AND revision > ? "
+                "ORDER BY revision LIMIT ?",
+                (article_id, after, limit)).fetchall()
+        return [{'revision': revision, 'created': created,
+                 'snapshot': bool(snapshot), 'size': size}
+                for revision, created, snapshot, size in rows]
+
+    def get(self, article_id: int, revision: int) -> Optional[Tuple[str, dict]]:
+        """
+        Rebuild revision of the record for ``article_id`` from the closest
+        snapshot and the deltas after it
+
+        :param article_id: Figshare article ID
+        :param revision: Revision number
+
+        :return: Creation time and record, or None if not found
+        """
+        with self.connection() as conn:
+            start = conn.execute(
+                "SELECT MAX(revision) FROM revisions WHERE article_id = ? "
+                "AND revision <= ? AND snapshot = 1",
+                (article_id, revision)).fetchone()[0]
+            if start is None:
+                return None
+            rows = conn.execute(
+                "SELECT revision, created, data FROM revisions "
+                "WHERE article_id = ? AND revision >= ? AND revision <= ? "
+                "ORDER BY revision",
+                (article_id, start, revision)).fetchall()
+        if rows[-1][0] != revision:
+            return None
+
+        _, created, data = rows[0]
+        record = json.loads(data)
+        for _, created, data in rows[1:]:
+            record = patch(record, json.loads(data))
+        return created, record
+
+    def size(self) -> int:
+        """Return total size of stored revisions in bytes"""
+        with self.connection() as conn:
+            return conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) "
+                                "FROM revisions").fetchone()[0]
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                break
+
+
+def get_history(db_file: str) -> History:
+    """
+    Return shared revision history for ``db_file``
+
+    :param db_file: Filename for README database
+    """
+    key = os.path.abspath(db_file)
+    with _histories_lock:
+        history = _histories.get(key)
+        if history is None:
+            history = _histories[key] = History(db_file)
+    return history
+
+
+def record(db_file: str, fields: dict) -> Optional[int]:
+    """
+    Record a revision for fields written to ``db_file``, if enabled
+
+    :return: New revision number, or None
+    """
+    if not enabled:
+        return None
+    return get_history(db_file).record(fields)
+
+
+def close_histories():
+    """Close all shared histories. Called on app shutdown"""
+    with _histories_lock:
+        for history in _histories.values():
+            history.close()
+        _histories.clear()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Cache-Control headers for README metadata and README database reads.
+# Clients revalidate with If-None-Match, which is answered with a 304
+metadata_cache_control = 'private, max-age=60'
+record_cache_control = 'private, no-cache'
+
+
+def strong_etag(*parts) -> str:
+    """
+    Return strong ETag identifying JSON-serializable ``parts``
+
+    :return: Quoted SHA-256 hex digest
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return f'"{hashlib.sha256(payload.encode("utf-8")).hexdigest()}"'
+
+
+def http_date(iso_date: str) -> Optional[str]:
+    """
+    Convert Figshare ISO 8601 timestamp (e.g., ``2021-07-01T00:00:00Z``)
+    to an HTTP date for ``Last-Modified``
+
+    :return: HTTP date, or None if ``iso_date`` cannot be parsed
+    """
+    try:
+        date = datetime.fromisoformat(iso_date.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        return None
+    return format_datetime(date, usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str,
+                    last_modified: Optional[str] = None) -> bool:
+    """
+    Evaluate conditional request headers. ``If-None-Match`` takes
+    precedence over ``If-Modified-Since``
+
+    :param request: HTTP request
+    :param etag: Current ETag of the resource
+    :param last_modified: Current ``Last-Modified`` HTTP date
+
+    :return: Whether a 304 Not Modified response can be sent
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        # Weak comparison, as required for If-None-Match
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return etag in [tag[2:] if tag.startswith('W/') else tag
+                        for tag in tags]
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            return parsedate_to_datetime(last_modified) <= \
+                parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cache_headers(etag: str, cache_control: str,
+                  last_modified: Optional[str] = None) -> dict:
+    """Return ETag, Cache-Control and Last-Modified (if known) headers"""
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if last_modified is not None:
+        headers['Last-Modified'] = last_modified
+    return headers
+
+
+def conditional(request: Optional[Request], response: Optional[Response],
+                etag: str, cache_control: str,
+                last_modified: Optional[str] = None) -> Optional[Response]:
+    """
+    Set caching headers on ``response`` and answer conditional requests
+
+    :param request: HTTP request. None for calls within the app
+    :param response: Response whose headers to set. None for calls within
+                     the app
+    :param etag: Current ETag of the resource
+    :param cache_control: ``Cache-Control`` header value
+    :param last_modified: Current ``Last-Modified`` HTTP date
+
+    :return: 304 response to send, or None to send the full response
+    """
+    headers = cache_headers(etag, cache_control, last_modified)
+    if response is not None:
+        response.headers.update(headers)
+    if request is not None and is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return None
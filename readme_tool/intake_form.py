@@ -1,21 +1,34 @@
-from fastapi import APIRouter, Request, Form, HTTPException
+import json
+
+from fastapi import APIRouter, Request, Response, Form, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.templating import Jinja2Templates
 
 from pydantic import BaseModel
-from typing import Union, Optional
-
-from tinydb import TinyDB, Query
+from starlette.concurrency import run_in_threadpool
+from typing import Union, Optional, Iterator
 
 from . import __version__ as rem_version
-from . import figshare
+from . import figshare, history, journal, metrics, search
+from .assets import asset_url, stream_template
+from .cache import TTLCache
+from .http_cache import conditional, record_cache_control, strong_etag
+from .storage import get_storage
 
 api_version = "v1.0.0"
 tinydb_file = 'intake.json'
+intake_db_file = 'intake.db'
+max_page_size = 1000
+
+# Figshare validations of draft autosaves, keyed by
+# (article_id, curation_id, stage, allow_approved). Saves within ``ttl``
+# seconds of a validation are not re-validated
+draft_validations = TTLCache(maxsize=1024, ttl=300.0)
+metrics.register_cache('draft_validation', draft_validations)
 
 router = APIRouter()
 templates = Jinja2Templates(directory='templates/')
-
-q = Query()  # For TinyDB query
+templates.env.globals['asset_url'] = asset_url
 
 
 class IntakeData(BaseModel):
@@ -29,6 +42,18 @@ class IntakeData(BaseModel):
     notes: str = ''
 
 
+class DraftData(BaseModel):
+    citation: Optional[str] = None
+    summary: Optional[str] = None
+    files: Optional[str] = None
+    materials: Optional[str] = None
+    contributors: Optional[str] = None
+    notes: Optional[str] = None
+
+    class Config:
+        extra = 'forbid'
+
+
 class VersionModel(BaseModel):
     rem_api_version: str = rem_version
     rem_web_api_version: str = api_version
@@ -36,8 +61,9 @@ class VersionModel(BaseModel):
 
 async def jinja_400s(status_code: int) -> dict:
     """
-    Return dict of 401/404 eror
-    :param status_code: HTTP status code. Either 401 (FastAPI) or 404 (Figshare)
+    Return dict of 401/404/503 error
+    :param status_code: HTTP status code. Either 401 (FastAPI), 404 (Figshare)
+                        or 503 (Figshare unavailable)
 
     :return:
     """
@@ -50,6 +76,10 @@ async def jinja_400s(status_code: int) -> dict:
         If you recently made revisions for a new version, you might have not click the
         submit/publish button.<br><br>
         After you submit it for curatorial review, you can then revise your README form responses."""}
+    if status_code == 503:
+        return {'msg': """Sorry, but we are unable to reach ReDATA at the moment!<br><br>
+        Please try again in a few minutes. If this persists, please contact a
+        ReDATA administrator at data-management at arizona.edu."""}
 
 
 @router.get('/version/')
@@ -59,86 +89,300 @@ async def get_version() -> VersionModel:
 
 
 @router.get('/database/')
-async def get_db(db_file: str = tinydb_file) -> TinyDB:
-    """Retrieve TinyDB README database
+async def get_db(db_file: str = intake_db_file, cursor: int = 0,
+                 limit: int = 100,
+                 article_id_min: Optional[int] = None,
+                 article_id_max: Optional[int] = None,
+                 curation_id_min: Optional[int] = None,
+                 curation_id_max: Optional[int] = None,
+                 format: str = 'json') -> Union[dict, StreamingResponse]:
+    """Retrieve README database records in pages ordered by ``doc_id``
 
     \f
-    :param db_file: JSON filename for TinyDB database
-
-    :return: README database
+    :param db_file: Filename for README database. ``.json`` files use TinyDB,
+                    all others use SQLite
+    :param cursor: Only include records with a larger ``doc_id``.
+                   Use ``next_cursor`` from the previous page
+    :param limit: Number of records per page (maximum of 1000)
+    :param article_id_min: Minimum Figshare article ID
+    :param article_id_max: Maximum Figshare article ID
+    :param curation_id_min: Minimum Figshare curation ID
+    :param curation_id_max: Maximum Figshare curation ID
+    :param format: 'json' for a single page, or 'jsonl' to stream all
+                   records after ``cursor`` as JSON Lines
+
+    :return: README database records keyed by ``doc_id`` and ``next_cursor``
+             (None on the last page), or JSON Lines stream
     """
-    db = TinyDB(db_file)
-    return db
+    if format not in ['json', 'jsonl']:
+        raise HTTPException(status_code=400,
+                            detail="FastAPI: format must be json or jsonl")
+
+    # Include journaled submissions
+    await run_in_threadpool(journal.compact, db_file)
+    storage = await run_in_threadpool(get_storage, db_file)
+    limit = max(1, min(limit, max_page_size))
+    filters = {
+        'article_ids': (article_id_min, article_id_max),
+        'curation_ids': (curation_id_min, curation_id_max),
+    }
+
+    if format == 'jsonl':
+        def _stream(after: int) -> Iterator[str]:
+            while True:
+                batch = storage.scan(after=after, limit=limit, **filters)
+                for doc_id, record in batch:
+                    yield json.dumps({'doc_id': doc_id,
+                                      'record': record}) + '\n'
+                if len(batch) < limit:
+                    break
+                after = batch[-1][0]
+
+        return StreamingResponse(_stream(cursor),
+                                 media_type='application/x-ndjson')
+
+    page = await run_in_threadpool(storage.scan, after=cursor, limit=limit,
+                                   **filters)
+    return {
+        'records': dict(page),
+        'next_cursor': page[-1][0] if len(page) == limit else None,
+    }
 
 
 @router.get('/database/read/{article_id}')
 async def get_data(article_id: int, curation_id: Optional[int] = None,
-                   index: bool = False, db_file: str = tinydb_file)\
-        -> Union[dict, int]:
-    """Retrieve record from TinyDB README database
+                   index: bool = False, db_file: str = intake_db_file,
+                   request: Request = None, response: Response = None)\
+        -> Union[dict, int, Response]:
+    """Retrieve record from README database
+
+    Responses have an ETag derived from the record content. Requests with
+    a matching ``If-None-Match`` receive a 304 response.
 
     \f
     :param article_id: Figshare article ID
     :param curation_id: Figshare curation ID
     :param index: Indicate whether to return ``doc_id`` (True) or record (False).
-    :param db_file: JSON filename for TinyDB database
+    :param db_file: Filename for README database
+    :param request: HTTP request (set by FastAPI)
+    :param response: HTTP response (set by FastAPI)
 
-    :return: TinyDB record or ``doc_id``
+    :return: README record or ``doc_id``
     """
-    db0 = await get_db(db_file=db_file)
-    if curation_id is None:
-        article_query = q['article_id'] == article_id
-    else:
-        article_query = (q['article_id'] == article_id) & \
-                        (q['curation_id'] == curation_id)
-
-    match = db0.search(article_query)
-    if curation_id is not None and len(match) == 0:
+    result = await run_in_threadpool(_get_data, article_id, curation_id, index,
+                                     db_file)
+    if request is not None:
+        not_modified = conditional(request, response, strong_etag(result),
+                                   record_cache_control)
+        if not_modified is not None:
+            return not_modified
+    return result
+
+
+def _get_data(article_id: int, curation_id: Optional[int], index: bool,
+              db_file: str) -> Union[dict, int]:
+    storage = get_storage(db_file)
+
+    # Submissions journaled but not yet written apply to the first record
+    pending = journal.pending(db_file, article_id)
+    if pending is not None:
+        if not index and curation_id in (None, pending.get('curation_id')):
+            match = storage.get(article_id)
+            return {**(match[1] if match else {}), **pending}
+        journal.compact(db_file)
+
+    match = storage.get(article_id, curation_id=curation_id)
+    if curation_id is not None and match is None:
         print(f"Performing article_id only search: {article_id}")
-        article_query = q['article_id'] == article_id
-        match = db0.search(article_query)
+        match = storage.get(article_id)
 
-    if len(match) == 0:
+    if match is None:
         raise HTTPException(
             status_code=404,
             detail="FastAPI: Record not found",
         )
 
+    doc_id, record = match
     if not index:
-        return match[0]
+        return record
     else:
-        return db0.get(article_query).doc_id
+        return doc_id
+
+
+def _written(db_file: str, fields: dict, before: str,
+             doc_id: Optional[int] = None):
+    """
+    Record revision and update search index after a write. Both cover the
+    first record for ``article_id``, which reads return, so writes to
+    other records are skipped
+
+    :param db_file: Filename for README database
+    :param fields: Fields written
+    :param before: Database version before the write
+    :param doc_id: ``doc_id`` of record written. Default: First record
+    """
+    if doc_id is not None:
+        first = get_storage(db_file).get(fields['article_id'])
+        if first is None or first[0] != doc_id:
+            search.advance(db_file, before)
+            return
+    history.record(db_file, fields)
+    search.index(db_file, fields, before)
 
 
 @router.post('/database/create')
-async def add_data(response: IntakeData, db_file: str = tinydb_file):
+async def add_data(response: IntakeData, db_file: str = intake_db_file):
     """
-    Add record to TinyDB README database
+    Add record to README database
 
     \f
     :param response: Record to include
-    :param db_file: JSON filename for TinyDB database
+    :param db_file: Filename for README database
     """
-    db0 = await get_db(db_file)
-    db0.insert(response.dict())
+    await run_in_threadpool(_add, response.dict(), db_file)
+
+
+def _add(record: dict, db_file: str):
+    storage = get_storage(db_file)
+    with storage.key_lock(record['article_id']):
+        before = storage.version()
+        doc_id = storage.insert(record)
+        _written(db_file, record, before, doc_id)
 
 
 @router.post('/database/update/{doc_id}')
 async def update_data(doc_id: int, response: IntakeData,
-                      db_file: str = tinydb_file):
+                      db_file: str = intake_db_file):
     """
-    Update record in TinyDB README database
+    Update record in README database
 
     \f
     :param doc_id: ``doc_id`` identifier from ``get_data`` to update
     :param response: Record to use for update
-    :param db_file: JSON filename for TinyDB database
+    :param db_file: Filename for README database
+    """
+    await run_in_threadpool(_update, doc_id, response.dict(), db_file)
+
+
+def _update(doc_id: int, record: dict, db_file: str):
+    storage = get_storage(db_file)
+    with storage.key_lock(record['article_id']):
+        before = storage.version()
+        storage.update(doc_id, record)
+        _written(db_file, record, before, doc_id)
+
 
-    :return: README database
+@router.post('/database/upsert')
+async def upsert_data(response: IntakeData,
+                      db_file: str = intake_db_file) -> int:
     """
-    db0 = await get_db(db_file)
-    db0.update(response.dict(), doc_ids=[doc_id])
-    return db0
+    Update record for ``article_id`` in README database, or add it if none
+    exists, in a single atomic write
+
+    \f
+    :param response: Record to use for update or include
+    :param db_file: Filename for README database
+
+    :return: ``doc_id`` of updated or new record
+    """
+    return await run_in_threadpool(_upsert, response.dict(), db_file)
+
+
+def _upsert(record: dict, db_file: str) -> int:
+    storage = get_storage(db_file)
+    # Revisions are recorded in the order records are written
+    with storage.key_lock(record['article_id']):
+        before = storage.version()
+        doc_id = storage.upsert(record)
+        _written(db_file, record, before)
+    return doc_id
+
+
+@router.get('/database/search')
+async def get_search(q: str, db_file: str = intake_db_file, offset: int = 0,
+                     limit: int = 20) -> dict:
+    """
+    Search README records by their text fields, best matches first
+
+    Records match when they contain all search terms. Terms ending with
+    ``*`` match as prefixes (e.g., ``contrib*``).
+
+    \f
+    :param q: Search terms
+    :param db_file: Filename for README database
+    :param offset: Number of hits to skip. Use ``next_offset`` from the
+                   previous page
+    :param limit: Number of hits per page (maximum of 1000)
+
+    :return: Total number of hits, hits with ``article_id``,
+             ``curation_id``, ``score`` and ``snippet``, and ``next_offset``
+             (None on the last page)
+    """
+    limit = max(1, min(limit, max_page_size))
+    offset = max(offset, 0)
+    index = await run_in_threadpool(search.get_index, db_file)
+    try:
+        total, hits = await run_in_threadpool(index.search, q,
+                                              offset=offset, limit=limit)
+    except search.QueryError as err:
+        raise HTTPException(status_code=400, detail=f"FastAPI: {err}")
+    return {
+        'total': total,
+        'hits': hits,
+        'next_offset': offset + limit if offset + limit < total else None,
+    }
+
+
+@router.get('/database/history/{article_id}')
+async def get_history(article_id: int, db_file: str = intake_db_file,
+                      cursor: int = 0, limit: int = 100) -> dict:
+    """
+    List revisions of the README record for ``article_id``, oldest first
+
+    \f
+    :param article_id: Figshare article ID
+    :param db_file: Filename for README database
+    :param cursor: Only include revisions with a larger number.
+                   Use ``next_cursor`` from the previous page
+    :param limit: Number of revisions per page (maximum of 1000)
+
+    :return: Revisions and ``next_cursor`` (None on the last page)
+    """
+    limit = max(1, min(limit, max_page_size))
+    revisions = await run_in_threadpool(
+        lambda: history.get_history(db_file).revisions(article_id,
+                                                       after=cursor,
+                                                       limit=limit))
+    if not revisions and cursor == 0:
+        raise HTTPException(status_code=404,
+                            detail="FastAPI: No revisions found")
+    return {
+        'revisions': revisions,
+        'next_cursor': revisions[-1]['revision']
+        if len(revisions) == limit else None,
+    }
+
+
+@router.get('/database/history/{article_id}/{revision}')
+async def get_revision(article_id: int, revision: int,
+                       db_file: str = intake_db_file) -> dict:
+    """
+    Retrieve a revision of the README record for ``article_id``
+
+    \f
+    :param article_id: Figshare article ID
+    :param revision: Revision number from ``get_history``
+    :param db_file: Filename for README database
+
+    :return: Revision number, creation time and record
+    """
+    result = await run_in_threadpool(
+        lambda: history.get_history(db_file).get(article_id, revision))
+    if result is None:
+        raise HTTPException(status_code=404,
+                            detail="FastAPI: Revision not found")
+    created, record = result
+    return {'revision': revision, 'created': created, 'record': record}
 
 
 @router.get('/form/{article_id}/')
@@ -146,8 +390,8 @@ async def get_form(article_id: int, request: Request,
                    curation_id: Optional[int] = None,
                    stage: bool = False,
                    allow_approved: bool = False,
-                   db_file: str = tinydb_file) \
-        -> templates.TemplateResponse:
+                   db_file: str = intake_db_file) \
+        -> StreamingResponse:
     """
     Return README form with Figshare metadata and README metadata if available
 
@@ -158,7 +402,7 @@ async def get_form(article_id: int, request: Request,
     :param stage: Figshare stage or production API.
                   Stage is only available for Figshare institutions
     :param allow_approved: Return 200 responses even if curation is not pending
-    :param db_file: JSON filename for TinyDB database
+    :param db_file: Filename for README database
 
     :return: HTML content through ``jinja2`` template
     """
@@ -169,9 +413,8 @@ async def get_form(article_id: int, request: Request,
                                          allow_approved=allow_approved)
     except HTTPException as err:
         msg = await jinja_400s(err.status_code)
-        return templates.TemplateResponse('404.html',
-                                          context={'request': request,
-                                                   'err': msg})
+        return stream_template(templates, '404.html',
+                               context={'request': request, 'err': msg})
 
     try:
         submit_dict = await get_data(article_id, db_file=db_file)
@@ -180,10 +423,10 @@ async def get_form(article_id: int, request: Request,
             ['citation', 'summary', 'files', 'materials', 'contributors', 'notes'], ''
         )
 
-    return templates.TemplateResponse('intake.html',
-                                      context={'request': request,
-                                               'submit_dict': submit_dict,
-                                               'fs': fs_metadata})
+    return stream_template(templates, 'intake.html',
+                           context={'request': request,
+                                    'submit_dict': submit_dict,
+                                    'fs': fs_metadata})
 
 
 @router.post('/form/{article_id}/')
@@ -197,10 +440,10 @@ async def post_form(article_id: int, request: Request,
                     notes: Optional[str] = Form(''),
                     stage: bool = False,
                     allow_approved: bool = False,
-                    db_file: str = tinydb_file) \
-        -> templates.TemplateResponse:
+                    db_file: str = intake_db_file) \
+        -> StreamingResponse:
     """
-    Submit data to incorporate in TinyDB database
+    Submit data to incorporate in README database
 
     \f
     :param article_id: Figshare `article_id`
@@ -215,7 +458,7 @@ async def post_form(article_id: int, request: Request,
     :param stage: Figshare stage or production API.
                   Stage is only available for Figshare institutions
     :param allow_approved: Return 200 responses even if curation is not pending
-    :param db_file: JSON filename for TinyDB database
+    :param db_file: Filename for README database
     :return: HTML content through ``jinja2`` template
     """
 
@@ -226,9 +469,8 @@ async def post_form(article_id: int, request: Request,
                                          allow_approved=allow_approved)
     except HTTPException as err:
         msg = await jinja_400s(err.status_code)
-        return templates.TemplateResponse('404.html',
-                                          context={'request': request,
-                                                   'err': msg})
+        return stream_template(templates, '404.html',
+                               context={'request': request, 'err': msg})
 
     result = {
         'citation': citation,
@@ -253,16 +495,89 @@ async def post_form(article_id: int, request: Request,
         'curation_id': fs_metadata['curation_id'],
         **result}
 
-    try:
-        doc_id = await get_data(article_id, index=True, db_file=db_file)
-        await update_data(doc_id, IntakeData(**post_data), db_file=db_file)
-    except HTTPException:
-        await add_data(IntakeData(**post_data), db_file=db_file)
-
-    return templates.TemplateResponse('receive.html',
-                                      context={'request': request,
-                                               'result': result,
-                                               'fields': fields,
-                                               'fs_metadata': fs_metadata,
-                                               }
-                                      )
+    if journal.enabled:
+        await run_in_threadpool(_submit, IntakeData(**post_data).dict(),
+                                db_file)
+    else:
+        await upsert_data(IntakeData(**post_data), db_file=db_file)
+
+    return stream_template(templates, 'receive.html',
+                           context={'request': request,
+                                    'result': result,
+                                    'fields': fields,
+                                    'fs_metadata': fs_metadata,
+                                    }
+                           )
+
+
+def _submit(record: dict, db_file: str):
+    storage = get_storage(db_file)
+    with storage.key_lock(record['article_id']):
+        before = storage.version()
+        journal.get_journal(db_file).submit(record)
+        _written(db_file, record, before)
+
+
+def _save_draft(record: dict, db_file: str):
+    storage = get_storage(db_file)
+    article_id = record['article_id']
+    with storage.key_lock(article_id):
+        # New records get all fields
+        if journal.pending(db_file, article_id) is None and \
+                storage.get(article_id) is None:
+            record = {**IntakeData(article_id=article_id).dict(), **record}
+
+        before = storage.version()
+        if journal.enabled:
+            journal.get_journal(db_file).submit(record)
+        else:
+            storage.upsert(record)
+        _written(db_file, record, before)
+
+
+@router.patch('/form/{article_id}/draft')
+async def patch_draft(article_id: int, draft: DraftData,
+                      curation_id: Optional[int] = None,
+                      stage: bool = False,
+                      allow_approved: bool = False,
+                      db_file: str = intake_db_file) -> dict:
+    """
+    Autosave changed form fields without submitting the form
+
+    Only fields included in the request are updated. Figshare metadata is
+    validated on the first save and again after ``draft_validations.ttl``
+    seconds.
+
+    \f
+    :param article_id: Figshare ``article_id``
+    :param draft: Changed form fields
+    :param curation_id: Figshare ``curation_id``
+    :param stage: Figshare stage or production API.
+                  Stage is only available for Figshare institutions
+    :param allow_approved: Accept saves even if curation is not pending
+    :param db_file: Filename for README database
+
+    :return: ``article_id``, ``curation_id`` and names of saved fields
+    """
+    fields = {key: value for key, value in draft.dict().items()
+              if value is not None}
+    if not fields:
+        raise HTTPException(status_code=400,
+                            detail="FastAPI: No form fields to save")
+
+    key = (article_id, curation_id, stage, allow_approved)
+    hit, fs_curation_id = draft_validations.get(key)
+    if not hit:
+        fs_metadata = await \
+            figshare.get_readme_metadata(article_id, curation_id=curation_id,
+                                         stage=stage,
+                                         allow_approved=allow_approved)
+        fs_curation_id = fs_metadata.get('curation_id', curation_id)
+        draft_validations.set(key, fs_curation_id)
+
+    record = {'article_id': article_id, 'curation_id': fs_curation_id,
+              **fields}
+    await run_in_threadpool(_save_draft, record, db_file)
+
+    return {'article_id': article_id, 'curation_id': fs_curation_id,
+            'saved': sorted(fields)}
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from . import search
+from .locks import OwnerLock
+from .storage import get_storage
+
+# Journal form submissions instead of writing the README database directly
+enabled = False
+
+# Seconds between compactions of journals into the README database
+interval = 5.0
+
+_journals: Dict[str, "SubmissionJournal"] = {}
+_journals_lock = threading.Lock()
+_task: Optional[asyncio.Task] = None
+
+
+class JournalInUseError(RuntimeError):
+    """Journal opened by another process"""
+
+
+class Journal:
+    """
+    Append-only file of JSON entries with group commit
+
+    ``append`` returns once the entry is on disk. Concurrent appends share
+    a single ``fsync``: the first waiting writer flushes all entries written
+    so far while the others wait. ``cond`` guards the journal state.
+
+    :param path: Journal filename
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'ab')
+        self.cond = threading.Condition()
+        self._written = 0
+        self._durable = 0
+        self._flushing = False
+        self.fsyncs = 0
+
+    def append(self, entry: dict, apply=None) -> int:
+        """
+        Append entry and wait until it is durable
+
+        :param entry: JSON-serializable entry
+        :param apply: Function called with ``entry`` in journal order,
+                      before waiting on the flush
+
+        :return: Sequence number of entry
+        """
+        line = json.dumps(entry).encode('utf-8') + b'\n'
+        with self.cond:
+            self._file.write(line)
+            self._written += 1
+            seq = self._written
+            if apply is not None:
+                apply(entry)
+
+            while self._durable < seq:
+                if self._flushing:
+                    self.cond.wait()
+                    continue
+                # Lead a group commit of everything written so far
+                self._flushing = True
+                target = self._written
+                self._file.flush()
+                self.cond.release()
+                try:
+                    os.fsync(self._file.fileno())
+                finally:
+                    self.cond.acquire()
+                    self._flushing = False
+                    self.cond.notify_all()
+                self._durable = target
+                self.fsyncs += 1
+        return seq
+
+    def rotate(self, path: str):
+        """
+        Move entries to ``path`` and continue with an empty journal
+
+        :param path: Filename for current entries
+        """
+        with self.cond:
+            while self._flushing:
+                self.cond.wait()
+            # Entries still waiting on a flush are in the rotated file
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._durable = self._written
+            self.cond.notify_all()
+            self._file.close()
+            os.replace(self.path, path)
+            self._file = open(self.path, 'ab')
+
+    def close(self):
+        with self.cond:
+            while self._flushing:
+                self.cond.wait()
+            self._file.close()
+
+
+def read_entries(path: str) -> Iterator[dict]:
+    """
+    Iterate over entries of a journal file. An incomplete last entry
+    (interrupted write) is skipped
+
+    :param path: Journal filename
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as fin:
+        for line in fin:
+            if not line.endswith(b'\n'):
+                break
+            yield json.loads(line)
+
+
+class SubmissionJournal:
+    """
+    Journal of README form submissions for a README database
+
+    Submissions are appended to ``<db_file>.journal`` and applied to the
+    database in batches by ``compact``. Until then, ``pending`` returns
+    them for reads. Pending submissions are only visible to the process
+    that journaled them, so the journal is owned by one process at a time
+    through ``<db_file>.journal.lock``.
+
+    :param db_file: Filename for README database
+    :raises JournalInUseError: Journal is open in another process
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.path = f'{db_file}.journal'
+        self.compacting_path = f'{self.path}.compacting'
+        self._owner = OwnerLock(f'{self.path}.lock')
+        if not self._owner.acquire():
+            raise JournalInUseError(
+                f"Journal {self.path} is open in another process")
+        try:
+            replay(db_file)
+            self.journal = Journal(self.path)
+        except BaseException:
+            self._owner.release()
+            raise
+        self._pending: Dict[int, dict] = {}
+        self._compacting: Dict[int, dict] = {}
+        self._compact_lock = threading.Lock()
+
+    def _apply(self, entry: dict):
+        record = entry['record']
+        pending = self._pending.setdefault(record['article_id'], {})
+        pending.update(record)
+
+    def submit(self, record: dict) -> int:
+        """
+        Durably record submission, to be upserted into the README database
+
+        :param record: Record to use for update or include
+
+        :return: Sequence number of submission
+        """
+        return self.journal.append({'op': 'upsert', 'record': record},
+                                   apply=self._apply)
+
+    def pending(self, article_id: int) -> Optional[dict]:
+        """
+        Return fields submitted for ``article_id`` that are not yet in the
+        README database
+
+        :param article_id: Figshare article ID
+
+        :return: Fields to merge into the first record for ``article_id``
+        """
+        with self.journal.cond:
+            compacting = self._compacting.get(article_id)
+            pending = self._pending.get(article_id)
+        if compacting is None and pending is None:
+            return None
+        return {**(compacting or {}), **(pending or {})}
+
+    def compact(self) -> int:
+        """
+        Apply journaled submissions to the README database
+
+        :return: Number of records written
+        """
+        with self._compact_lock:
+            # Retry a failed compaction before rotating the journal again
+            if not self._compacting:
+                with self.journal.cond:
+                    if not self._pending:
+                        return 0
+                    self.journal.rotate(self.compacting_path)
+                    self._compacting, self._pending = self._pending, {}
+
+            records = list(self._compacting.values())
+            store = get_storage(self.db_file)
+            before = store.version()
+            # The journal is removed once the records are on disk
+            store.upsert_many(records, durable=True)
+            # Journaled fields were indexed when submitted
+            search.advance(self.db_file, before)
+            os.remove(self.compacting_path)
+            with self.journal.cond:
+                self._compacting = {}
+            return len(records)
+
+    def close(self):
+        try:
+            self.compact()
+            self.journal.close()
+        finally:
+            self._owner.release()
+
+
+def replay(db_file: str) -> int:
+    """
+    Apply journaled submissions left by a previous run (e.g., after a crash)
+    to the README database and remove the journal. Only call while no
+    other process has the journal open
+
+    :param db_file: Filename for README database
+
+    :return: Number of submissions replayed
+    """
+    paths = [f'{db_file}.journal.compacting', f'{db_file}.journal']
+    records: List[dict] = [entry['record'] for path in paths
+                           for entry in read_entries(path)
+                           if entry.get('op') == 'upsert']
+    if records:
+        get_storage(db_file).upsert_many(records, durable=True)
+        print(f"journal: Replayed {len(records)} submissions into {db_file}")
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return len(records)
+
+
+def get_journal(db_file: str) -> SubmissionJournal:
+    """
+    Return shared submission journal for ``db_file``
+
+    :param db_file: Filename for README database
+    """
+    key = os.path.abspath(db_file)
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            journal = _journals[key] = SubmissionJournal(db_file)
+    return journal
+
+
+def pending(db_file: str, article_id: int) -> Optional[dict]:
+    """
+    Return journaled fields for ``article_id`` not yet in ``db_file``,
+    or None if there are none or journaling is disabled
+    """
+    journal = _journals.get(os.path.abspath(db_file))
+    if journal is None:
+        return None
+    return journal.pending(article_id)
+
+
+def compact(db_file: str) -> int:
+    """Apply journaled submissions for ``db_file``, if any"""
+    journal = _journals.get(os.path.abspath(db_file))
+    return journal.compact() if journal is not None else 0
+
+
+def compact_all() -> int:
+    """Apply journaled submissions for all README databases"""
+    return sum(journal.compact() for journal in list(_journals.values()))
+
+
+def close_journals():
+    """Compact and close all journals"""
+    with _journals_lock:
+        for journal in _journals.values():
+            journal.close()
+        _journals.clear()
+
+
+async def _run():
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(compact_all)
+        except Exception as err:
+            print(f"WARNING: journal: compaction failed ({err!r})")
+
+
+async def start():
+    """Start background compaction task. Called on app startup"""
+    global _task
+    if enabled and interval > 0 and _task is None:
+        _task = asyncio.ensure_future(_run())
+
+
+async def stop():
+    """Stop background compaction and compact journals. Called on shutdown"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    close_journals()
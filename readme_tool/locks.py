@@ -0,0 +1,103 @@
+import os
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only apply within the process
+    fcntl = None
+
+
+class FileLock:
+    """
+    Reentrant lock shared by threads and processes through a lock file
+
+    Processes are serialized with ``flock`` on ``path``; threads in a
+    process with an ``RLock``. Used as a context manager. ``depth`` is the
+    number of nested acquisitions by the owning thread.
+
+    :param path: Lock filename
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self.depth = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquire the lock
+
+        :param blocking: Wait for the lock if held by another process
+
+        :return: Whether the lock was acquired
+        """
+        if not self._lock.acquire(blocking):
+            return False
+        if self.depth == 0 and fcntl is not None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            flags = fcntl.LOCK_EX if blocking else \
+                fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(fd, flags)
+            except OSError:
+                os.close(fd)
+                self._lock.release()
+                return False
+            self._fd = fd
+        self.depth += 1
+        return True
+
+    def release(self):
+        """Release the lock"""
+        self.depth -= 1
+        if self.depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class OwnerLock:
+    """
+    Lock file held by one process at a time for the lifetime of a resource.
+    Unlike ``FileLock``, it may be released by any thread of the process
+
+    :param path: Lock filename
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        """
+        Acquire the lock without waiting
+
+        :return: Whether the lock was acquired
+        """
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        """Release the lock"""
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,252 @@
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+router = APIRouter()
+
+# Default latency buckets in seconds
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+class Metric:
+    """
+    Base class for metrics in the Prometheus text format
+
+    :param name: Metric name
+    :param help_text: Description of metric
+    :param label_names: Names of labels
+    """
+    type = 'untyped'
+
+    def __init__(self, name: str, help_text: str,
+                 label_names: Labels = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+
+    def samples(self) -> Iterator[Sample]:
+        """Yield name suffix, labels and value of each sample"""
+        raise NotImplementedError
+
+    def _labels(self, label_values: Labels) -> Dict[str, str]:
+        return dict(zip(self.label_names, label_values))
+
+
+class Counter(Metric):
+    """Monotonically increasing count for each set of labels"""
+    type = 'counter'
+
+    def __init__(self, name: str, help_text: str,
+                 label_names: Labels = ()):
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        self._values[label_values] = \
+            self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def samples(self) -> Iterator[Sample]:
+        for label_values, value in list(self._values.items()):
+            yield '_total', self._labels(label_values), value
+
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets for each set of labels"""
+    type = 'histogram'
+
+    def __init__(self, name: str, help_text: str, label_names: Labels = (),
+                 buckets: Tuple[float, ...] = default_buckets):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per-bucket (non-cumulative) counts, with +Inf last, sum and count
+        self._values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        data = self._values.get(label_values)
+        if data is None:
+            data = self._values[label_values] = \
+                [[0] * (len(self.buckets) + 1), 0.0, 0]
+        data[0][bisect_left(self.buckets, value)] += 1
+        data[1] += value
+        data[2] += 1
+
+    def count(self, *label_values: str) -> int:
+        data = self._values.get(label_values)
+        return data[2] if data else 0
+
+    def samples(self) -> Iterator[Sample]:
+        for label_values, (counts, total, count) in list(self._values.items()):
+            labels = self._labels(label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),),
+                                           counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield '_bucket', {**labels, 'le': le}, cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, count
+
+
+class Gauge(Metric):
+    """Values computed on collection by ``func``, keyed by label values"""
+    type = 'gauge'
+
+    def __init__(self, name: str, help_text: str, label_names: Labels,
+                 func: Callable[[], Dict[Labels, float]]):
+        super().__init__(name, help_text, label_names)
+        self.func = func
+
+    def samples(self) -> Iterator[Sample]:
+        for label_values, value in self.func().items():
+            yield '', self._labels(label_values), value
+
+
+registry: Dict[str, Metric] = {}
+
+
+def _register(metric: Metric) -> Metric:
+    return registry.setdefault(metric.name, metric)
+
+
+def counter(name: str, help_text: str, label_names: Labels = ()) -> Counter:
+    """Return registered ``Counter``, creating it if needed"""
+    return _register(Counter(name, help_text, label_names))
+
+
+def histogram(name: str, help_text: str, label_names: Labels = (),
+              buckets: Tuple[float, ...] = default_buckets) -> Histogram:
+    """Return registered ``Histogram``, creating it if needed"""
+    return _register(Histogram(name, help_text, label_names, buckets))
+
+
+def gauge(name: str, help_text: str, label_names: Labels,
+          func: Callable[[], Dict[Labels, float]]) -> Gauge:
+    """Register ``Gauge`` computed by ``func`` on collection"""
+    metric = Gauge(name, help_text, label_names, func)
+    registry[name] = metric
+    return metric
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"')\
+        .replace('\n', r'\n')
+
+
+def render() -> str:
+    """
+    Render all registered metrics in the Prometheus text format
+
+    :return: Metrics exposition
+    """
+    lines: List[str] = []
+    for metric in list(registry.values()):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for suffix, labels, value in metric.samples():
+            label_str = ','.join(f'{key}="{_escape(val)}"'
+                                 for key, val in labels.items())
+            if label_str:
+                label_str = f'{{{label_str}}}'
+            lines.append(f"{metric.name}{suffix}{label_str} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+request_seconds = histogram(
+    'rem_request_duration_seconds', 'HTTP request latency by route and status',
+    ('route', 'method', 'status'))
+
+figshare_seconds = histogram(
+    'rem_figshare_request_duration_seconds',
+    'Figshare API call latency by endpoint', ('endpoint', 'stage', 'status'))
+
+storage_seconds = histogram(
+    'rem_storage_operation_duration_seconds',
+    'README database operation latency', ('backend', 'operation'))
+
+storage_records = counter(
+    'rem_storage_records', 'README database records read or written',
+    ('backend', 'operation'))
+
+
+# Caches reporting hit ratios, keyed by cache name. Each provides ``stats()``
+caches: Dict[str, object] = {}
+
+
+def register_cache(name: str, cache):
+    """
+    Report size and hit/miss statistics of a cache
+
+    :param name: Cache label for metrics
+    :param cache: Cache with a ``stats()`` method (e.g., ``TTLCache``)
+    """
+    caches[name] = cache
+
+
+def _cache_stat(key: str) -> Callable[[], Dict[Labels, float]]:
+    return lambda: {(name,): cache.stats()[key]
+                    for name, cache in list(caches.items())}
+
+
+gauge('rem_cache_hit_ratio', 'Cache hit ratio', ('cache',),
+      _cache_stat('hit_ratio'))
+gauge('rem_cache_hits', 'Cache hits', ('cache',), _cache_stat('hits'))
+gauge('rem_cache_misses', 'Cache misses', ('cache',), _cache_stat('misses'))
+gauge('rem_cache_size', 'Number of cache entries', ('cache',),
+      _cache_stat('size'))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency per route and status
+
+    Routes are labeled by endpoint function name to bound label cardinality.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive,
+                       send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status: Optional[int] = None
+
+        async def _send(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        t0 = perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            endpoint = scope.get('endpoint')
+            route = getattr(endpoint, '__name__', None) or 'other'
+            request_seconds.observe(perf_counter() - t0, route,
+                                    scope['method'], str(status or 500))
+
+
+@router.get('/metrics')
+async def get_metrics() -> PlainTextResponse:
+    """
+    Return metrics in the Prometheus text format
+
+    \f
+    :return: Metrics exposition
+    """
+    return PlainTextResponse(render(),
+                             media_type='text/plain; version=0.0.4')
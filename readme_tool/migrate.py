@@ -0,0 +1,463 @@
+"""
+Bulk import/export and migration tool for the README database
+
+Records are streamed in batches between the TinyDB JSON format (``.json``),
+JSON Lines (``.jsonl``) and the indexed SQLite store (all other suffixes).
+``doc_id`` values are preserved, and record counts and checksums are
+verified after each copy.
+
+Copies write the database files directly, so they are not recorded in the
+revision history of the README records.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, TextIO
+
+from .locks import FileLock
+from .storage import SQLiteStorage
+
+Record = Tuple[int, dict]
+
+default_batch_size = 1000
+read_chunk_size = 1 << 16
+
+
+def file_format(filename: str) -> str:
+    """
+    Return database format based on filename suffix
+
+    :param filename: Database filename
+
+    :return: One of 'tinydb', 'jsonl' or 'sqlite'
+    """
+    suffix = Path(filename).suffix
+    if suffix == '.json':
+        return 'tinydb'
+    if suffix == '.jsonl':
+        return 'jsonl'
+    return 'sqlite'
+
+
+def _iter_tinydb(fin: TextIO, table: str = '_default',
+                 chunk_size: int = read_chunk_size) -> Iterator[Record]:
+    """
+    Incrementally parse a TinyDB JSON file, yielding one record at a time
+
+    Only the current record is held in memory, not the whole file.
+
+    :param fin: Open TinyDB JSON file
+    :param table: TinyDB table to read
+    :param chunk_size: Number of characters to read at a time
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def _fill() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = fin.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def _skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or not _fill():
+                return
+
+    def _expect(chars: str) -> str:
+        nonlocal pos
+        _skip_ws()
+        if pos >= len(buf) or buf[pos] not in chars:
+            raise ValueError(f"Invalid TinyDB file: expected one of {chars!r}")
+        pos += 1
+        return buf[pos - 1]
+
+    def _value():
+        nonlocal pos
+        _skip_ws()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if not _fill():
+                    raise
+                continue
+            # A number may continue into the next chunk
+            if end == len(buf) and _fill():
+                continue
+            pos = end
+            return value
+
+    if not _fill():
+        return
+    _expect('{')
+    _skip_ws()
+    if buf[pos:pos + 1] == '}':
+        return
+    while True:
+        table_name = _value()
+        _expect(':')
+        _expect('{')
+        _skip_ws()
+        if buf[pos:pos + 1] == '}':
+            pos += 1
+        else:
+            while True:
+                doc_id = _value()
+                _expect(':')
+                record = _value()
+                if table_name == table:
+                    yield int(doc_id), record
+                if _expect(',}') == '}':
+                    break
+        if _expect(',}') == '}':
+            break
+
+
+def read_records(filename: str, after: int = 0,
+                 batch_size: int = default_batch_size) -> Iterator[Record]:
+    """
+    Stream records from a README database in ``doc_id`` order for SQLite,
+    and file order otherwise
+
+    :param filename: Database filename
+    :param after: Only include records with a larger ``doc_id``
+    :param batch_size: Number of records read at a time from SQLite
+    """
+    if not Path(filename).exists():
+        raise FileNotFoundError(f"{filename} not found")
+
+    fmt = file_format(filename)
+    if fmt == 'sqlite':
+        store = SQLiteStorage(filename)
+        try:
+            while True:
+                batch = store.scan(after=after, limit=batch_size)
+                yield from batch
+                if len(batch) < batch_size:
+                    break
+                after = batch[-1][0]
+        finally:
+            store.close()
+        return
+
+    with open(filename) as fin:
+        if fmt == 'tinydb':
+            records = _iter_tinydb(fin)
+        else:
+            records = ((row['doc_id'], row['record'])
+                       for row in (json.loads(line) for line in fin
+                                   if line.strip()))
+        for doc_id, record in records:
+            if doc_id > after:
+                yield doc_id, record
+
+
+def _batches(records: Iterator[Record],
+             batch_size: int) -> Iterator[List[Record]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _kept(filename: str, keep: Optional[int]) -> Iterator[Record]:
+    """Existing records of ``filename`` with a ``doc_id`` up to ``keep``"""
+    if keep is None or not Path(filename).exists():
+        return
+    for doc_id, record in read_records(filename):
+        if doc_id <= keep:
+            yield doc_id, record
+
+
+def write_records(filename: str, records: Iterator[Record],
+                  batch_size: int = default_batch_size,
+                  append: bool = False, keep: Optional[int] = None) -> int:
+    """
+    Write records to a README database in batches
+
+    SQLite destinations are updated in place (records with the same
+    ``doc_id`` are replaced). TinyDB files are rewritten, and JSON Lines
+    files are rewritten unless ``append`` is set. With ``keep``, existing
+    records with a ``doc_id`` up to ``keep`` are kept and all others are
+    replaced by ``records``.
+
+    :param filename: Database filename
+    :param records: ``doc_id`` and records to write
+    :param batch_size: Number of records written per transaction
+    :param append: Append to an existing JSON Lines file
+    :param keep: Keep existing records with a ``doc_id`` up to this value
+
+    :return: Number of records written (not including kept records)
+    """
+    fmt = file_format(filename)
+    count = 0
+
+    if fmt == 'sqlite':
+        store = SQLiteStorage(filename)
+        try:
+            with store.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if keep is not None:
+                    conn.execute("DELETE FROM records WHERE doc_id > ?",
+                                 (keep,))
+                for batch in _batches(records, batch_size):
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO records "
+                        "(doc_id, article_id, curation_id, data) "
+                        "VALUES (?, ?, ?, ?)",
+                        [(doc_id, record['article_id'],
+                          record.get('curation_id'), json.dumps(record))
+                         for doc_id, record in batch])
+                    conn.execute("COMMIT")
+                    count += len(batch)
+                    conn.execute("BEGIN IMMEDIATE")
+                conn.execute("COMMIT")
+        finally:
+            store.close()
+        return count
+
+    if fmt == 'jsonl' and append:
+        with open(filename, 'a') as fout:
+            for batch in _batches(records, batch_size):
+                fout.writelines(json.dumps({'doc_id': doc_id,
+                                            'record': record}) + '\n'
+                                for doc_id, record in batch)
+                count += len(batch)
+        return count
+
+    # Write to a temporary file so an interrupted copy leaves no partial file
+    tmp_file = f"{filename}.tmp"
+    kept = 0
+    with open(tmp_file, 'w') as fout:
+        if fmt == 'tinydb':
+            fout.write('{"_default": {')
+        for batch in _batches(itertools.chain(
+                ((doc_id, record, False)
+                 for doc_id, record in _kept(filename, keep)),
+                ((doc_id, record, True) for doc_id, record in records)),
+                batch_size):
+            for doc_id, record, new in batch:
+                if fmt == 'tinydb':
+                    sep = ', ' if count + kept else ''
+                    fout.write(f'{sep}"{doc_id}": {json.dumps(record)}')
+                else:
+                    fout.write(json.dumps({'doc_id': doc_id,
+                                           'record': record}) + '\n')
+                if new:
+                    count += 1
+                else:
+                    kept += 1
+        if fmt == 'tinydb':
+            fout.write('}}')
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(tmp_file, filename)
+    return count
+
+
+def checksum(records: Iterator[Record]) -> Tuple[int, str]:
+    """
+    Compute record count and an order-independent checksum
+
+    :param records: ``doc_id`` and records
+
+    :return: Number of records and hex checksum
+    """
+    count = 0
+    total = 0
+    for doc_id, record in records:
+        payload = json.dumps([doc_id, record], sort_keys=True)
+        digest = hashlib.sha256(payload.encode('utf-8')).digest()
+        total = (total + int.from_bytes(digest, 'big')) % (1 << 256)
+        count += 1
+    return count, f"{total:064x}"
+
+
+def combine(*checksums: Tuple[int, str]) -> Tuple[int, str]:
+    """
+    Return count and checksum of the union of disjoint record sets
+
+    :param checksums: Counts and checksums from ``checksum``
+    """
+    count = sum(c for c, _ in checksums)
+    total = sum(int(digest, 16) for _, digest in checksums) % (1 << 256)
+    return count, f"{total:064x}"
+
+
+def copy(source: str, destination: str, after: int = 0,
+         batch_size: int = default_batch_size, append: bool = False,
+         verify: bool = True) -> int:
+    """
+    Copy records from ``source`` to ``destination`` database
+
+    Records of an existing destination with a ``doc_id`` up to ``after``
+    are kept, and the rest are replaced by the source records after it.
+    With ``append``, all records of a JSON Lines destination are kept.
+
+    :param source: Source database filename
+    :param destination: Destination database filename
+    :param after: Only copy records with a larger ``doc_id`` (incremental)
+    :param batch_size: Number of records per batch
+    :param append: Append to an existing JSON Lines destination
+    :param verify: Check counts and checksums of the whole destination
+                   after copy
+
+    :return: Number of records copied
+    :raises ValueError: Verification failed
+    """
+    if Path(source).absolute() == Path(destination).absolute():
+        raise ValueError("source and destination must differ")
+
+    append = append and file_format(destination) == 'jsonl'
+    keep = None if append else after
+    if verify:
+        # Destination records expected to be left as they are
+        if keep is not None:
+            kept = checksum(_kept(destination, keep))
+        elif Path(destination).exists():
+            kept = checksum(read_records(destination))
+        else:
+            kept = checksum([])
+
+    count = write_records(destination,
+                          read_records(source, after=after,
+                                       batch_size=batch_size),
+                          batch_size=batch_size, append=append, keep=keep)
+    if verify:
+        expected = combine(kept, checksum(read_records(
+            source, after=after, batch_size=batch_size)))
+        _compare(expected, checksum(read_records(destination,
+                                                 batch_size=batch_size)))
+    return count
+
+
+def _compare(expected: Tuple[int, str], actual: Tuple[int, str]):
+    if expected[0] != actual[0]:
+        raise ValueError(f"Record count mismatch: {expected[0]} != "
+                         f"{actual[0]}")
+    if expected[1] != actual[1]:
+        raise ValueError(f"Checksum mismatch: {expected[1]} != {actual[1]}")
+
+
+def verify_copy(source: str, destination: str, after: int = 0,
+                batch_size: int = default_batch_size):
+    """
+    Check that ``destination`` holds the same records as ``source``
+
+    :param source: Source database filename
+    :param destination: Destination database filename
+    :param after: Only compare records with a larger ``doc_id``
+    :param batch_size: Number of records per batch
+
+    :raises ValueError: Record counts or checksums differ
+    """
+    _compare(checksum(read_records(source, after=after,
+                                   batch_size=batch_size)),
+             checksum(read_records(destination, after=after,
+                                   batch_size=batch_size)))
+
+
+def migrate_legacy(legacy_file: str, db_file: str,
+                   batch_size: int = default_batch_size) -> int:
+    """
+    Copy records from the TinyDB file used by earlier versions to a new
+    SQLite database. Nothing is copied once ``db_file`` exists, so the
+    legacy file is left as a backup. Called on app startup
+
+    :param legacy_file: TinyDB database filename (e.g., ``intake.json``)
+    :param db_file: SQLite database filename (e.g., ``intake.db``)
+    :param batch_size: Number of records per batch
+
+    :return: Number of records copied
+    """
+    if not Path(legacy_file).exists():
+        return 0
+    # Worker processes starting together migrate once
+    with FileLock(f"{db_file}.migrate.lock"):
+        if Path(db_file).exists():
+            return 0
+        # Copy to a temporary file so an interrupted migration is redone
+        tmp_file = f"{db_file}.migrating"
+        for suffix in ['', '-wal', '-shm']:
+            if Path(tmp_file + suffix).exists():
+                os.remove(tmp_file + suffix)
+        count = copy(legacy_file, tmp_file, batch_size=batch_size)
+        os.replace(tmp_file, db_file)
+    print(f"Migrated {count} records from {legacy_file} to {db_file}")
+    return count
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog='rem-db', description="Migrate, import and export the README "
+                                   "database (.json: TinyDB, .jsonl: JSON "
+                                   "Lines, others: SQLite)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    copy_parser = subparsers.add_parser('copy', help="Copy records")
+    copy_parser.add_argument('source')
+    copy_parser.add_argument('destination')
+    copy_parser.add_argument('--after', type=int, default=0,
+                             help="Only copy records with a larger doc_id")
+    copy_parser.add_argument('--append', action='store_true',
+                             help="Append to an existing JSON Lines file")
+    copy_parser.add_argument('--no-verify', action='store_true',
+                             help="Skip count and checksum verification")
+
+    verify_parser = subparsers.add_parser(
+        'verify', help="Compare record counts and checksums")
+    verify_parser.add_argument('source')
+    verify_parser.add_argument('destination')
+    verify_parser.add_argument('--after', type=int, default=0)
+
+    stats_parser = subparsers.add_parser(
+        'stats', help="Print record count and checksum")
+    stats_parser.add_argument('source')
+
+    for sub in [copy_parser, verify_parser, stats_parser]:
+        sub.add_argument('--batch-size', type=int, default=default_batch_size)
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'copy':
+            count = copy(args.source, args.destination, after=args.after,
+                         batch_size=args.batch_size, append=args.append,
+                         verify=not args.no_verify)
+            print(f"Copied {count} records from {args.source} to "
+                  f"{args.destination}")
+        elif args.command == 'verify':
+            verify_copy(args.source, args.destination, after=args.after,
+                        batch_size=args.batch_size)
+            print("Verified: record counts and checksums match")
+        else:
+            count, digest = checksum(read_records(
+                args.source, batch_size=args.batch_size))
+            print(f"{args.source}: {count} records, checksum {digest}")
+    except (OSError, ValueError) as err:
+        print(f"ERROR: {err}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
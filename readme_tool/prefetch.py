@@ -0,0 +1,122 @@
+import asyncio
+from typing import Optional
+
+from fastapi import HTTPException
+
+from . import figshare, ratelimit
+from .figshare_client import get_client
+from .locks import FileLock
+
+# Seconds between warm-up passes. 0 disables the background task
+interval = 300.0
+
+# Maximum number of curation lookups per second during a warm-up pass
+rate = 2.0
+
+# Pending curations retrieved per Figshare request
+page_size = 1000
+
+# Figshare environments to warm up (False: production, True: stage)
+stages = (False,)
+
+# With several worker processes, only the worker holding this lock file
+# runs warm-up passes. None: always run
+lock_file: Optional[str] = None
+
+_task: Optional[asyncio.Task] = None
+_lock: Optional[FileLock] = None
+
+
+async def warm_up(stage: bool = False) -> int:
+    """
+    Fill the metadata cache for all pending curations
+
+    :param stage: Figshare stage or production API
+
+    :return: Number of articles retrieved from Figshare
+    """
+    token = figshare.stage_api_key if stage else figshare.api_key
+    if not token:
+        return 0
+
+    fs_client = get_client(stage)
+    count = 0
+    offset = 0
+    while True:
+        response = await fs_client.get_curation_list(
+            token, status='pending', offset=offset, limit=page_size)
+        if response.status_code != 200:
+            print(f"WARNING: prefetch: Unable to retrieve pending curations "
+                  f"(status={response.status_code})")
+            return count
+        page = response.json()
+
+        for curation in page:
+            article_id = curation['article_id']
+            if (article_id, None, stage, False) in figshare.metadata_cache:
+                continue
+
+            try:
+                # Caches both (article_id, None, ...) and
+                # (article_id, curation_id, ...) keys used by the form
+                await figshare.get_figshare(article_id, stage=stage)
+            except HTTPException as err:
+                print(f"WARNING: prefetch: {article_id}: {err.detail}")
+            count += 1
+            if rate > 0:
+                await asyncio.sleep(1.0 / rate)
+
+        if len(page) < page_size:
+            return count
+        offset += page_size
+
+
+def _is_leader() -> bool:
+    global _lock
+    if lock_file is None:
+        return True
+    if _lock is None:
+        _lock = FileLock(lock_file)
+    # Keep the lock once acquired; retry on each pass otherwise
+    return _lock.depth > 0 or _lock.acquire(blocking=False)
+
+
+async def _run():
+    # Figshare requests of this task yield to interactive requests
+    ratelimit.priority.set('prefetch')
+    while True:
+        if not _is_leader():
+            await asyncio.sleep(interval)
+            continue
+        for stage in stages:
+            try:
+                count = await warm_up(stage)
+                if count:
+                    print(f"prefetch: Cached {count} pending curations "
+                          f"(stage={stage})")
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                print(f"WARNING: prefetch: warm-up failed ({err!r})")
+        await asyncio.sleep(interval)
+
+
+async def start():
+    """Start background warm-up task. Called on app startup"""
+    global _task
+    if interval > 0 and _task is None:
+        _task = asyncio.ensure_future(_run())
+
+
+async def stop():
+    """Stop background warm-up task. Called on app shutdown"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    if _lock is not None and _lock.depth > 0:
+        _lock.release()
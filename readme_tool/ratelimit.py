@@ -0,0 +1,364 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic, time
+from typing import Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from . import metrics
+
+# Request priorities, highest first. Interactive requests serve ``/form/``
+# and ``/metadata/`` page loads; batch and prefetch requests run in the
+# background
+priorities = ('interactive', 'batch', 'prefetch')
+
+# Sustained Figshare requests per second for each token on production
+# (False) and stage (True). 0 disables rate limiting
+rates = {False: 10.0, True: 10.0}
+
+# Bucket capacity: requests allowed in a burst after an idle period
+burst = 20.0
+
+# Fraction of ``burst`` kept for higher priorities. A batch request only
+# proceeds while a quarter of the bucket is left for interactive requests,
+# including requests of other worker processes
+reserve = {'interactive': 0.0, 'batch': 0.25, 'prefetch': 0.5}
+
+# Priority of Figshare requests made in the current context
+priority: ContextVar[str] = ContextVar('rate_limit_priority',
+                                       default='interactive')
+
+
+class SharedPriority:
+    """
+    Priority of a Figshare request made for several callers (e.g., a
+    coalesced call), raised to the highest priority among them. A raise
+    applies to the request even while it waits for the rate limiter
+
+    :param name: Priority of the first caller
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._waiting: Optional[Tuple["Limiter", asyncio.Future]] = None
+
+    def raise_to(self, name: str):
+        """Raise priority to ``name``, if higher"""
+        if priorities.index(name) < priorities.index(self.name):
+            self.name = name
+            if self._waiting is not None:
+                self._waiting[0].reprioritize(self._waiting[1], name)
+
+
+# Shared priority of Figshare requests made in the current context, which
+# takes precedence over ``priority``
+shared_priority: ContextVar[Optional[SharedPriority]] = \
+    ContextVar('rate_limit_shared_priority', default=None)
+
+wait_seconds = metrics.histogram(
+    'rem_ratelimit_wait_seconds',
+    'Time Figshare requests waited for the rate limiter',
+    ('stage', 'priority'))
+
+
+class MemoryStore:
+    """Token buckets for a single process"""
+
+    # ``take`` does not block, so it is called on the event loop
+    blocking = False
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, capacity: float,
+             floor: float = 0.0) -> float:
+        """
+        Take a token from bucket ``key`` if more than ``floor`` tokens
+        would remain
+
+        :param key: Bucket identifier
+        :param rate: Tokens added per second
+        :param capacity: Maximum tokens in the bucket
+        :param floor: Tokens to leave in the bucket
+
+        :return: 0 if a token was taken, otherwise seconds until one can be
+        """
+        with self._lock:
+            now = monotonic()
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, wait = _take(tokens, now - updated, rate, capacity, floor)
+            self._buckets[key] = (tokens, now)
+            return wait
+
+    def close(self):
+        pass
+
+
+class SQLiteStore:
+    """
+    Token buckets shared by worker processes through a SQLite database
+
+    :param db_file: SQLite database filename
+    """
+
+    # ``take`` may wait for other processes, so it is called in a thread
+    blocking = True
+
+    schema = """CREATE TABLE IF NOT EXISTS rate_limit (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                )"""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not shared with forked processes
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=30.0,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(self.schema)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def take(self, key: str, rate: float, capacity: float,
+             floor: float = 0.0) -> float:
+        """See ``MemoryStore.take``"""
+        with self._lock:
+            conn = self._connection()
+            # Wall clock, as monotonic clocks differ between processes
+            now = time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated FROM rate_limit WHERE key = ?",
+                    (key,)).fetchone()
+                tokens, updated = row if row is not None else (capacity, now)
+                tokens, wait = _take(tokens, max(now - updated, 0.0), rate,
+                                     capacity, floor)
+                conn.execute("INSERT OR REPLACE INTO rate_limit "
+                             "VALUES (?, ?, ?)", (key, tokens, now))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return wait
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+def _take(tokens: float, elapsed: float, rate: float, capacity: float,
+          floor: float) -> Tuple[float, float]:
+    """Return tokens left and wait time after refilling and taking a token"""
+    tokens = min(capacity, tokens + elapsed * rate)
+    if tokens - 1.0 >= floor:
+        return tokens - 1.0, 0.0
+    return tokens, (floor + 1.0 - tokens) / rate
+
+
+store = MemoryStore()
+
+
+class Limiter:
+    """
+    Queue of requests waiting on the token bucket for one token and stage.
+    Waiters are released by priority, then in arrival order
+
+    :param key: Bucket identifier
+    :param stage: Figshare stage or production API
+    """
+
+    def __init__(self, key: str, stage: bool):
+        self.key = key
+        self.stage = stage
+        self._waiters: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self._arrived: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Return number of waiting requests for each priority"""
+        depth = dict.fromkeys(priorities, 0)
+        for _, _, name, future in self._waiters:
+            if not future.done():
+                depth[name] += 1
+        return depth
+
+    async def _take(self, name: str) -> float:
+        args = (self.key, rates[self.stage], max(burst, 1.0),
+                reserve.get(name, 0.0) * burst)
+        if store.blocking:
+            return await run_in_threadpool(store.take, *args)
+        return store.take(*args)
+
+    async def acquire(self, name: str,
+                      shared: Optional[SharedPriority] = None):
+        """
+        Wait until a request of priority ``name`` may be sent
+
+        :param name: One of ``priorities``
+        :param shared: Priority of the request, if it may be raised while
+                       waiting
+        """
+        loop = asyncio.get_running_loop()
+        # Waiters are bound to the event loop that created them
+        if self._loop is not loop:
+            self._waiters = []
+            self._pump = None
+            self._arrived = asyncio.Event()
+            self._loop = loop
+
+        if not self._waiters and await self._take(name) == 0:
+            return
+
+        if shared is not None:
+            # May have been raised while taking a token
+            name = shared.name
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priorities.index(name),
+                                       next(self._order), name, future))
+        self._arrived.set()
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.ensure_future(self._run())
+        if shared is not None:
+            shared._waiting = (self, future)
+        try:
+            await future
+        finally:
+            if shared is not None:
+                shared._waiting = None
+
+    def reprioritize(self, future: asyncio.Future, name: str):
+        """
+        Move waiting request ``future`` to priority ``name``
+
+        :param future: Future of a waiting ``acquire``
+        :param name: One of ``priorities``
+        """
+        for i, (_, order, _, waiter) in enumerate(self._waiters):
+            if waiter is future:
+                self._waiters[i] = (priorities.index(name), order, name,
+                                    future)
+                heapq.heapify(self._waiters)
+                self._arrived.set()
+                return
+
+    async def _run(self):
+        while self._waiters:
+            _, _, name, future = self._waiters[0]
+            if future.done():
+                # Cancelled waiter
+                heapq.heappop(self._waiters)
+                continue
+            wait = await self._take(name)
+            if wait == 0:
+                # The token goes to the first waiter, which may have changed
+                # while a shared store was taking it
+                while self._waiters:
+                    _, _, _, head = heapq.heappop(self._waiters)
+                    if not head.done():
+                        head.set_result(None)
+                        break
+                continue
+            # A request of higher priority may arrive while waiting
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+
+_limiters: Dict[str, Limiter] = {}
+
+
+def bucket_key(token: Optional[str], stage: bool) -> str:
+    """Return bucket identifier for ``token``, without the token itself"""
+    digest = hashlib.sha256((token or '').encode('utf-8')).hexdigest()
+    return f"{'stage' if stage else 'production'}:{digest[:16]}"
+
+
+async def acquire(token: Optional[str], stage: bool = False):
+    """
+    Wait for the rate limit of ``token`` on the Figshare ``stage`` or
+    production API, at the priority of the current context
+
+    :param token: Figshare API token
+    :param stage: Figshare stage or production API
+    """
+    if not rates.get(stage):
+        return
+    key = bucket_key(token, stage)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = Limiter(key, stage)
+
+    shared = shared_priority.get()
+    name = shared.name if shared is not None else priority.get()
+    t0 = monotonic()
+    await limiter.acquire(name, shared)
+    if shared is not None:
+        name = shared.name
+    wait_seconds.observe(monotonic() - t0, str(stage).lower(), name)
+
+
+@contextmanager
+def priority_scope(name: str):
+    """
+    Send Figshare requests made within the block at priority ``name``
+
+    :param name: One of ``priorities``
+    """
+    if name not in priorities:
+        raise ValueError(f"Unknown priority: {name}")
+    reset_token = priority.set(name)
+    try:
+        yield
+    finally:
+        priority.reset(reset_token)
+
+
+def use_shared_store(db_file: str):
+    """
+    Share token buckets across worker processes
+
+    :param db_file: SQLite database filename
+    """
+    global store
+    store.close()
+    store = SQLiteStore(db_file)
+
+
+def _queue_depth() -> Dict[Tuple[str, ...], float]:
+    depth: Dict[Tuple[str, ...], float] = {}
+    for limiter in list(_limiters.values()):
+        stage = str(limiter.stage).lower()
+        for name, count in limiter.queue_depth().items():
+            labels = (stage, name)
+            depth[labels] = depth.get(labels, 0) + count
+    return depth
+
+
+metrics.gauge('rem_ratelimit_queue_depth',
+              'Figshare requests waiting for the rate limiter',
+              ('stage', 'priority'), _queue_depth)
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import json
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
+from jinja2 import Environment, FileSystemLoader
+from pydantic import BaseModel
+
+from . import figshare, intake_form, metrics, ratelimit
+from .cache import TTLCache
+from .http_cache import is_not_modified
+
+router = APIRouter()
+
+readme_dir = 'templates/readme/'
+media_types = {
+    'md': 'text/markdown; charset=utf-8',
+    'txt': 'text/plain; charset=utf-8',
+}
+
+intake_fields = ['citation', 'summary', 'files', 'materials', 'contributors',
+                 'notes']
+
+env = Environment(loader=FileSystemLoader(readme_dir), autoescape=False,
+                  trim_blocks=True, lstrip_blocks=True,
+                  keep_trailing_newline=True)
+
+# Rendered READMEs keyed by content hash of the inputs
+readme_cache = TTLCache(maxsize=256, ttl=3600.0)
+metrics.register_cache('readme', readme_cache)
+
+
+class ReadmeBatch(BaseModel):
+    items: List[figshare.MetadataItem]
+    format: str = 'txt'
+    stage: bool = False
+    allow_approved: bool = False
+    concurrency: int = 8
+
+
+def content_hash(fs_metadata: dict, intake: dict, fmt: str) -> str:
+    """
+    Return hash identifying a rendered README
+
+    :param fs_metadata: README metadata from Figshare
+    :param intake: README form responses
+    :param fmt: README format ('md' or 'txt')
+
+    :return: SHA-256 hex digest
+    """
+    payload = json.dumps([fmt, fs_metadata, intake], sort_keys=True,
+                         default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_readme(fs_metadata: dict, intake: dict, fmt: str = 'txt') \
+        -> Tuple[str, str]:
+    """
+    Render README from Figshare metadata and form responses
+
+    :param fs_metadata: README metadata from ``figshare_metadata_readme``
+    :param intake: README form responses
+    :param fmt: README format ('md' or 'txt')
+
+    :return: Rendered README and its content hash
+    """
+    digest = content_hash(fs_metadata, intake, fmt)
+    hit, content = readme_cache.get(digest)
+    if not hit:
+        template = env.get_template(f'README.{fmt}')
+        content = template.render(fs=fs_metadata, intake=intake)
+        readme_cache.set(digest, content)
+    return content, digest
+
+
+async def build_readme(article_id: int, curation_id: Optional[int] = None,
+                       fmt: str = 'txt', stage: bool = False,
+                       allow_approved: bool = False,
+                       db_file: str = intake_form.intake_db_file) \
+        -> Tuple[str, str]:
+    """
+    Merge Figshare metadata with the stored form responses and render README
+
+    :param article_id: Figshare article ID
+    :param curation_id: Figshare curation ID
+    :param fmt: README format ('md' or 'txt')
+    :param stage: Figshare stage or production API
+    :param allow_approved: Allow curations that are not pending
+    :param db_file: Filename for README database
+
+    :return: Rendered README and its content hash
+    """
+    if fmt not in media_types:
+        raise HTTPException(status_code=400,
+                            detail=f"FastAPI: format must be one of "
+                                   f"{list(media_types)}")
+
+    fs_metadata = await figshare.get_readme_metadata(
+        article_id, curation_id=curation_id, stage=stage,
+        allow_approved=allow_approved)
+
+    try:
+        record = await intake_form.get_data(article_id,
+                                            curation_id=curation_id,
+                                            db_file=db_file)
+    except HTTPException:
+        record = {}
+    intake = {key: record.get(key) or '' for key in intake_fields}
+
+    return render_readme(fs_metadata, intake, fmt)
+
+
+@router.get('/readme/{article_id}/')
+async def get_readme(article_id: int, curation_id: Optional[int] = None,
+                     format: str = 'txt', stage: bool = False,
+                     allow_approved: bool = False,
+                     db_file: str = intake_form.intake_db_file,
+                     request: Request = None) -> Response:
+    """
+    Return rendered README.md or README.txt. Requests with a matching
+    ``If-None-Match`` receive a 304 response
+
+    \f
+    :param article_id: Figshare article ID
+    :param curation_id: Figshare curation ID
+    :param format: README format ('md' or 'txt')
+    :param stage: Figshare stage or production API.
+                  Stage is available for Figshare institutions
+    :param allow_approved: Return 200 responses even if curation is not pending
+    :param db_file: Filename for README database
+    :param request: HTTP request (set by FastAPI)
+
+    :return: README content
+    """
+    content, digest = await build_readme(article_id, curation_id=curation_id,
+                                         fmt=format, stage=stage,
+                                         allow_approved=allow_approved,
+                                         db_file=db_file)
+    if request is not None and is_not_modified(request, f'"{digest}"'):
+        return Response(status_code=304, headers={'ETag': f'"{digest}"'})
+    return PlainTextResponse(
+        content, media_type=media_types[format],
+        headers={
+            'ETag': f'"{digest}"',
+            'Content-Disposition': f'inline; filename="README.{format}"',
+        })
+
+
+@router.post('/readme/batch')
+async def post_readme_batch(batch: ReadmeBatch,
+                            db_file: str = intake_form.intake_db_file) \
+        -> List[dict]:
+    """
+    Render READMEs for many articles at once
+
+    \f
+    :param batch: Articles (``article_id`` and optional ``curation_id``),
+                  README ``format``, Figshare ``stage``, ``allow_approved``
+                  and ``concurrency``
+    :param db_file: Filename for README database
+
+    :return: Per-article ``status_code`` with ``readme`` and ``hash``,
+             or ``detail`` for errors
+    """
+    if len(batch.items) > figshare.max_batch_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"FastAPI: Batch is limited to "
+                   f"{figshare.max_batch_size} items"
+        )
+
+    concurrency = max(1, min(batch.concurrency,
+                             figshare.max_batch_concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _item(item: figshare.MetadataItem) -> dict:
+        result = {'article_id': item.article_id,
+                  'curation_id': item.curation_id}
+        async with semaphore:
+            try:
+                # Yield to interactive page loads at the rate limiter
+                with ratelimit.priority_scope('batch'):
+                    content, digest = await build_readme(
+                        item.article_id, curation_id=item.curation_id,
+                        fmt=batch.format, stage=batch.stage,
+                        allow_approved=batch.allow_approved,
+                        db_file=db_file)
+                result.update({'status_code': 200, 'readme': content,
+                               'hash': digest})
+            except HTTPException as err:
+                result.update({'status_code': err.status_code,
+                               'detail': err.detail})
+        return result
+
+    return list(await asyncio.gather(*[_item(item) for item in batch.items]))
@@ -0,0 +1,123 @@
+import random
+from time import monotonic
+from typing import Optional
+
+# Response status codes from Figshare that are retried
+retry_statuses = frozenset([429, 500, 502, 503, 504])
+
+
+class CircuitOpenError(Exception):
+    """Raised when calls are rejected by an open circuit breaker"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to an upstream service
+
+    After ``failure_threshold`` consecutive failures, the circuit opens and
+    calls fail fast for ``reset_timeout`` seconds. One trial call is then
+    allowed (half-open): success closes the circuit, failure re-opens it.
+
+    :param failure_threshold: Consecutive failures before opening
+    :param reset_timeout: Seconds to stay open before a trial call
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._trial = False
+
+    def before_call(self):
+        """
+        Check whether a call is allowed
+
+        :raises CircuitOpenError: Circuit is open
+        """
+        if self.state == self.OPEN:
+            if monotonic() - self._opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError("Circuit open: Figshare is unavailable")
+            self.state = self.HALF_OPEN
+            self._trial = False
+
+        if self.state == self.HALF_OPEN:
+            if self._trial:
+                self.rejected += 1
+                raise CircuitOpenError("Circuit half-open: trial in progress")
+            self._trial = True
+
+    def record_success(self):
+        """Record successful call and close the circuit"""
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial = False
+
+    def release(self):
+        """
+        End a call without a result (e.g., cancelled). An interrupted
+        half-open trial allows another trial call
+        """
+        self._trial = False
+
+    def record_failure(self):
+        """Record failed call, opening the circuit if needed"""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or \
+                self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self._opened_at = monotonic()
+            self._trial = False
+
+    def stats(self) -> dict:
+        """Return circuit state and counters"""
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'opened': self.opened,
+            'rejected': self.rejected,
+        }
+
+
+class RetryPolicy:
+    """
+    Bounded retries with exponential backoff and full jitter
+
+    :param retries: Maximum number of retries after the first attempt
+    :param backoff_base: Backoff in seconds before the first retry
+    :param backoff_max: Maximum backoff in seconds
+    """
+
+    def __init__(self, retries: int = 2, backoff_base: float = 0.2,
+                 backoff_max: float = 2.0):
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Return seconds to wait before retry ``attempt`` (0-based)
+
+        :param attempt: Number of attempts already made minus one
+        :param retry_after: ``Retry-After`` header value, if provided
+
+        :return: Seconds to wait
+        """
+        if retry_after is not None:
+            try:
+                return min(max(float(retry_after), 0.0), self.backoff_max)
+            except ValueError:
+                pass
+        cap = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(0, cap)
@@ -0,0 +1,286 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .storage import get_storage
+
+# Maintain the search index on each write
+enabled = True
+
+# ``IntakeData`` text fields that are indexed
+text_fields = ('citation', 'summary', 'files', 'materials', 'contributors',
+               'notes')
+
+# Maximum number of pooled SQLite connections for each search index
+pool_size = 4
+
+# Markers around matched terms in snippets, and maximum snippet tokens
+snippet_markers = ('<mark>', '</mark>')
+snippet_tokens = 16
+
+_indexes: Dict[str, "SearchIndex"] = {}
+_indexes_lock = threading.Lock()
+
+
+class QueryError(ValueError):
+    """Search query that cannot be parsed"""
+
+
+def match_query(query: str) -> str:
+    """
+    Convert search terms to an FTS5 query matching records with all terms.
+    Terms ending with ``*`` match as prefixes
+
+    :param query: Search terms separated by whitespace
+
+    :return: FTS5 MATCH expression
+    :raises QueryError: No search terms
+    """
+    terms = []
+    for term in query.split():
+        prefix = term.endswith('*')
+        term = term.rstrip('*')
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"' +
+                         ('*' if prefix else ''))
+    if not terms:
+        raise QueryError("No search terms")
+    return ' '.join(terms)
+
+
+class SearchIndex:
+    """
+    Full-text index of README records, stored in SQLite FTS5
+    (``<db_file>.search``)
+
+    The index has a row for the first record of each ``article_id``,
+    updated on each write. It also stores the version of the README
+    database it matches (see ``Storage.version``), which each write
+    advances only if the index matched the database before the write.
+    When the index is opened, it is refilled from the README database if
+    it is new or the versions differ, so records written outside the app
+    (e.g., migrated copies) are picked up.
+
+    :param db_file: Filename for README database
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.path = f'{db_file}.search'
+        self._pool: LifoQueue = LifoQueue(maxsize=pool_size)
+        columns = ', '.join(text_fields)
+        with self.connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS records USING fts5("
+                f"curation_id UNINDEXED, {columns}, "
+                f"tokenize = 'porter unicode61')")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta ("
+                         "key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            version = self._version(conn)
+        if version is None or version != get_storage(db_file).version():
+            self.rebuild()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection from the pool"""
+        try:
+            conn = self._pool.get_nowait()
+        except Empty:
+            conn = sqlite3.connect(self.path, timeout=30.0,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            if self._pool.full():
+                conn.close()
+            else:
+                self._pool.put_nowait(conn)
+
+    @staticmethod
+    def _row(article_id: int, record: dict) -> tuple:
+        return (article_id, record.get('curation_id'),
+                *[record.get(field) or '' for field in text_fields])
+
+    @staticmethod
+    def _version(conn: sqlite3.Connection) -> Optional[str]:
+        row = conn.execute(
+            "SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row is not None else None
+
+    @staticmethod
+    def _set_version(conn: sqlite3.Connection, version: str):
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                     (version,))
+
+    def _advance(self, conn: sqlite3.Connection, before: str, after: str):
+        # Writes by others since ``before`` are not indexed
+        if self._version(conn) == before:
+            self._set_version(conn, after)
+
+    def advance(self, before: str):
+        """
+        Record that a write to the README database did not change the
+        indexed fields (e.g., fields indexed when they were journaled)
+
+        :param before: Database version before the write
+        """
+        after = get_storage(self.db_file).version()
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._advance(conn, before, after)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def index(self, fields: dict, before: str):
+        """
+        Update index after ``fields`` were written to the first record for
+        ``fields['article_id']``
+
+        :param fields: Fields written (merged into the indexed record)
+        :param before: Database version before the write
+        """
+        article_id = fields['article_id']
+        columns = ', '.join(('curation_id',) + text_fields)
+        placeholders = ', '.join('?' * (len(text_fields) + 2))
+        after = get_storage(self.db_file).version()
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT {columns} FROM records WHERE rowid = ?",
+                    (article_id,)).fetchone()
+                record = dict(zip(('curation_id',) + text_fields, row)) \
+                    if row is not None else {}
+                record.update(fields)
+                conn.execute("DELETE FROM records WHERE rowid = ?",
+                             (article_id,))
+                conn.execute(f"INSERT INTO records (rowid, {columns}) "
+                             f"VALUES ({placeholders})",
+                             self._row(article_id, record))
+                self._advance(conn, before, after)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def rebuild(self) -> int:
+        """
+        Replace index with the records of the README database
+
+        :return: Number of records indexed
+        """
+        store = get_storage(self.db_file)
+        # Writes while reading leave the index behind this version
+        version = store.version()
+        rows = {}
+        for _, record in store.all():
+            # Reads return the first record for each article_id
+            rows.setdefault(record['article_id'],
+                            self._row(record['article_id'], record))
+
+        columns = ', '.join(('curation_id',) + text_fields)
+        placeholders = ', '.join('?' * (len(text_fields) + 2))
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM records")
+                conn.executemany(f"INSERT INTO records (rowid, {columns}) "
+                                 f"VALUES ({placeholders})", rows.values())
+                self._set_version(conn, version)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return len(rows)
+
+    def search(self, query: str, offset: int = 0,
+               limit: int = 20) -> Tuple[int, List[dict]]:
+        """
+        Search indexed records, best matches first
+
+        :param query: Search terms (see ``match_query``)
+        :param offset: Number of hits to skip
+        :param limit: Maximum number of hits
+
+        :return: Total number of hits, and ``article_id``, ``curation_id``,
+                 BM25 ``score`` (lower is better) and ``snippet`` of hits
+        :raises QueryError: Invalid query
+        """
+        expression = match_query(query)
+        start, end = snippet_markers
+        with self.connection() as conn:
+            total = conn.execute(
+                "SELECT COUNT(*) FROM records WHERE records MATCH ?",
+                (expression,)).fetchone()[0]
+            rows = conn.execute(
+                "SELECT rowid, curation_id, rank, "
+                "snippet(records, -1, ?, ?, '…', ?) FROM records "
+                "WHERE records MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                (start, end, snippet_tokens, expression, limit,
+                 offset)).fetchall()
+        return total, [{'article_id': article_id, 'curation_id': curation_id,
+                        'score': score, 'snippet': snippet}
+                       for article_id, curation_id, score, snippet in rows]
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                break
+
+
+def get_index(db_file: str) -> SearchIndex:
+    """
+    Return shared search index for ``db_file``
+
+    :param db_file: Filename for README database
+    """
+    key = os.path.abspath(db_file)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = SearchIndex(db_file)
+    return index
+
+
+def index(db_file: str, fields: dict, before: str):
+    """
+    Update search index for fields written to ``db_file``, if enabled
+
+    :param db_file: Filename for README database
+    :param fields: Fields written
+    :param before: Database version before the write
+    """
+    if enabled:
+        get_index(db_file).index(fields, before)
+
+
+def advance(db_file: str, before: str):
+    """
+    Record a write to ``db_file`` that did not change indexed fields, if
+    the search index is open
+
+    :param db_file: Filename for README database
+    :param before: Database version before the write
+    """
+    search_index = _indexes.get(os.path.abspath(db_file))
+    if enabled and search_index is not None:
+        search_index.advance(before)
+
+
+def close_indexes():
+    """Close all shared search indexes. Called on app shutdown"""
+    with _indexes_lock:
+        for search_index in _indexes.values():
+            search_index.close()
+        _indexes.clear()
@@ -0,0 +1,99 @@
+import json
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseSettings, Field, confloat, conint
+
+settings_file = 'settings.json'
+
+api_key_fields = ('figshare_api_key', 'figshare_stage_api_key')
+
+
+class Settings(BaseSettings):
+    """
+    App settings from ``REM_*`` environment variables (e.g.,
+    ``REM_CACHE_TTL`` for ``cache_ttl``). Figshare API keys are read from
+    ``FIGSHARE_API_KEY`` and ``FIGSHARE_STAGE_API_KEY``, or ``settings.json``.
+    Tunables left as None keep the module defaults.
+    """
+    figshare_api_key: Optional[str] = Field(None, env='FIGSHARE_API_KEY')
+    figshare_stage_api_key: Optional[str] = \
+        Field(None, env='FIGSHARE_STAGE_API_KEY')
+
+    # Templates and static assets
+    gzip_assets: bool = False
+    template_cache: str = '.jinja_cache'
+
+    # Compression of HTML and JSON responses
+    compression: bool = True
+    compression_min_size: Optional[conint(ge=0)] = None
+
+    # Figshare metadata cache
+    cache_maxsize: Optional[conint(ge=0)] = None
+    cache_ttl: Optional[confloat(ge=0)] = None
+    cache_error_ttl: Optional[confloat(ge=0)] = None
+    shared_cache: Optional[str] = None
+    draft_validity: Optional[confloat(ge=0)] = None
+
+    # Background warm-up of the metadata cache
+    prefetch_interval: Optional[confloat(ge=0)] = None
+    prefetch_rate: Optional[confloat(ge=0)] = None
+    prefetch_stage: bool = False
+
+    # Polling of curation changes to invalidate the metadata cache
+    sync_interval: Optional[confloat(ge=0)] = None
+    sync_watermark_file: Optional[str] = None
+
+    # Figshare requests per second for each API token (0: unlimited)
+    rate_limit: Optional[confloat(ge=0)] = None
+    rate_limit_stage: Optional[confloat(ge=0)] = None
+    rate_limit_burst: Optional[confloat(ge=1)] = None
+
+    # Journal of form submissions. Only one worker process can use it; the
+    # others write submissions directly
+    journal: bool = False
+    journal_interval: Optional[confloat(ge=0)] = None
+
+    # Revision history of README records
+    history: bool = True
+    history_max_deltas: Optional[conint(ge=0)] = None
+
+    # Full-text search index of README records
+    search: bool = True
+
+    # Server
+    host: str = '127.0.0.1'
+    port: conint(gt=0, lt=65536) = 8000
+    workers: Optional[conint(ge=1)] = None
+
+    class Config:
+        env_prefix = 'REM_'
+
+
+def load_settings(filename: str = settings_file) -> Settings:
+    """
+    Load and validate settings. ``filename`` is only read if a Figshare API
+    key is not set in the environment
+
+    :param filename: JSON file with ``figshare_api_key`` and
+                     ``figshare_stage_api_key``
+
+    :return: App settings
+    :raises FileNotFoundError: API keys are not set and ``filename`` is missing
+    :raises pydantic.ValidationError: Invalid settings
+    """
+    settings = Settings()
+    if all(getattr(settings, field) for field in api_key_fields):
+        return settings
+
+    file = Path(filename).absolute()
+    if not file.exists():
+        raise FileNotFoundError(
+            f"{file} not found; please see settings_template.json")
+
+    with open(file) as fin:
+        file_settings = json.load(fin)
+    return settings.copy(update={
+        field: getattr(settings, field) or file_settings.get(field)
+        for field in api_key_fields
+    })
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one in-flight call
+
+    Callers requesting the same ``key`` while a call is in flight await
+    the same result (or exception) instead of starting another call.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable,
+                 func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run ``func`` unless an identical call is in flight
+
+        :param key: Identifier for identical calls
+        :param func: Coroutine function to call
+
+        :return: Result of the shared call
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None and not task.done():
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+
+        # Shield so a cancelled caller does not cancel the shared call
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved if no caller awaited it
+
+    def stats(self) -> dict:
+        """Return counts of calls, upstream calls and coalesced calls"""
+        return {
+            'calls': self.calls,
+            'upstream': self.calls - self.coalesced,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._inflight),
+        }
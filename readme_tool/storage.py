@@ -0,0 +1,564 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from queue import LifoQueue, Empty
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from tinydb import TinyDB, Query
+
+from .locks import FileLock
+from .metrics import storage_records, storage_seconds
+
+# Filename suffixes stored with the TinyDB JSON backend. Others use SQLite
+tinydb_suffixes = ('.json',)
+
+# Maximum number of pooled SQLite connections for each database file
+sqlite_pool_size = 4
+
+# Range of values (inclusive) to filter on. None means unbounded
+Range = Tuple[Optional[int], Optional[int]]
+
+# Number of locks used to serialize writes for the same article_id
+key_lock_stripes = 64
+
+_storages: Dict[str, "Storage"] = {}
+_storages_lock = threading.Lock()
+
+
+def timed(operation: str,
+          records: Callable[[object], int] = lambda result: 1):
+    """
+    Decorator recording latency and record counts of a storage operation
+
+    :param operation: Operation label for metrics
+    :param records: Function returning the number of records from the result
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            t0 = perf_counter()
+            result = func(self, *args, **kwargs)
+            storage_seconds.observe(perf_counter() - t0, self.backend,
+                                    operation)
+            storage_records.inc(self.backend, operation,
+                                amount=records(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def _found(result) -> int:
+    return 0 if result is None else 1
+
+
+class Storage:
+    """
+    Base class for README database backends
+
+    Records are dictionaries of ``IntakeData`` fields identified by an
+    integer ``doc_id``.
+
+    :param db_file: Filename for database
+    """
+    backend = 'base'
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._key_locks = [threading.RLock()
+                           for _ in range(key_lock_stripes)]
+
+    def key_lock(self, article_id: int) -> threading.RLock:
+        """Return lock serializing writes for ``article_id``"""
+        return self._key_locks[hash(article_id) % key_lock_stripes]
+
+    def get(self, article_id: int, curation_id: Optional[int] = None) \
+            -> Optional[Tuple[int, dict]]:
+        """
+        Retrieve first record for ``article_id`` (and ``curation_id``)
+
+        :param article_id: Figshare article ID
+        :param curation_id: Figshare curation ID
+
+        :return: ``doc_id`` and record, or None if not found
+        """
+        raise NotImplementedError
+
+    def insert(self, record: dict) -> int:
+        """
+        Add record to database
+
+        :param record: Record to include
+
+        :return: ``doc_id`` of new record
+        """
+        raise NotImplementedError
+
+    def update(self, doc_id: int, record: dict):
+        """
+        Update record in database
+
+        :param doc_id: ``doc_id`` of record to update
+        :param record: Fields to update
+        """
+        raise NotImplementedError
+
+    def upsert(self, record: dict) -> int:
+        """
+        Atomically update the first record for ``record['article_id']``
+        or add it if none exists
+
+        :param record: Record to include
+
+        :return: ``doc_id`` of updated or new record
+        """
+        raise NotImplementedError
+
+    def upsert_many(self, records: List[dict],
+                    durable: bool = False) -> List[int]:
+        """
+        Upsert records in order, as a single write where supported
+
+        :param records: Records to use for update or include
+        :param durable: Return only once the write is on disk (e.g., before
+                        removing a journal of the records)
+
+        :return: ``doc_id`` of updated or new records
+        """
+        return [self.upsert(record) for record in records]
+
+    def all(self) -> Iterator[Tuple[int, dict]]:
+        """Iterate over all ``doc_id`` and records"""
+        raise NotImplementedError
+
+    def scan(self, after: int = 0, limit: int = 1000,
+             article_ids: Range = (None, None),
+             curation_ids: Range = (None, None)) -> List[Tuple[int, dict]]:
+        """
+        Retrieve records in ``doc_id`` order
+
+        :param after: Only include records with a larger ``doc_id``
+        :param limit: Maximum number of records
+        :param article_ids: Minimum and maximum ``article_id``
+        :param curation_ids: Minimum and maximum ``curation_id``
+
+        :return: ``doc_id`` and records
+        """
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Return number of records"""
+        raise NotImplementedError
+
+    def version(self) -> str:
+        """
+        Return marker of the database contents. It changes with every
+        write, including writes by other processes and tools (e.g.,
+        ``rem-db``)
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release resources held by the backend"""
+
+
+class TinyDBStorage(Storage):
+    """
+    README database stored as a TinyDB JSON file
+
+    A single ``TinyDB`` instance is kept open for the database file.
+    Operations hold a lock file (``<db_file>.lock``) so several processes
+    can share the database; TinyDB's caches are dropped when another
+    process changed the file, and the file is reopened when it was
+    replaced (e.g., by ``rem-db``).
+    """
+    backend = 'tinydb'
+
+    def __init__(self, db_file: str):
+        super().__init__(db_file)
+        self._db = TinyDB(db_file)
+        self._lock = FileLock(f'{db_file}.lock')
+        self._stat = None
+
+    def _file_stat(self) -> Tuple[int, int, int]:
+        stat = os.stat(self.db_file)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _reset_cache(self):
+        table = self._db.table(self._db.default_table_name)
+        table.clear_cache()
+        table._next_id = None
+
+    @contextmanager
+    def _locked(self) -> Iterator[TinyDB]:
+        """Hold the database lock, reloading changes by other processes"""
+        with self._lock:
+            stat = self._file_stat() if self._lock.depth == 1 else None
+            if stat is not None and self._stat != stat:
+                if self._stat is not None and self._stat[0] != stat[0]:
+                    # Replaced: TinyDB still has the old file open
+                    self._db.close()
+                    self._db = TinyDB(self.db_file)
+                self._reset_cache()
+            try:
+                yield self._db
+            finally:
+                if self._lock.depth == 1:
+                    self._stat = self._file_stat()
+
+    @timed('read', records=_found)
+    def get(self, article_id: int, curation_id: Optional[int] = None) \
+            -> Optional[Tuple[int, dict]]:
+        q = Query()
+        if curation_id is None:
+            query = q['article_id'] == article_id
+        else:
+            query = (q['article_id'] == article_id) & \
+                    (q['curation_id'] == curation_id)
+
+        with self._locked():
+            doc = self._db.get(query)
+        if doc is None:
+            return None
+        return doc.doc_id, dict(doc)
+
+    @timed('insert')
+    def insert(self, record: dict) -> int:
+        with self._locked():
+            return self._db.insert(record)
+
+    @timed('update')
+    def update(self, doc_id: int, record: dict):
+        with self._locked():
+            self._db.update(record, doc_ids=[doc_id])
+
+    @timed('upsert')
+    def upsert(self, record: dict) -> int:
+        with self.key_lock(record['article_id']), self._locked():
+            doc = self._db.get(Query()['article_id'] == record['article_id'])
+            if doc is None:
+                return self._db.insert(record)
+            self._db.update(record, doc_ids=[doc.doc_id])
+            return doc.doc_id
+
+    @timed('upsert_many', records=len)
+    def upsert_many(self, records: List[dict],
+                    durable: bool = False) -> List[int]:
+        # Read and write the file once instead of once per record
+        with self._locked() as db:
+            data = db.storage.read() or {}
+            table = data.setdefault(db.default_table_name, {})
+            first: Dict[int, str] = {}
+            for doc_id in sorted(table, key=int):
+                first.setdefault(table[doc_id].get('article_id'), doc_id)
+            next_id = max(map(int, table), default=0) + 1
+
+            doc_ids = []
+            for record in records:
+                doc_id = first.get(record['article_id'])
+                if doc_id is None:
+                    doc_id = first[record['article_id']] = str(next_id)
+                    table[doc_id] = {}
+                    next_id += 1
+                table[doc_id].update(record)
+                doc_ids.append(int(doc_id))
+
+            db.storage.write(data)
+            self._reset_cache()
+            if durable:
+                fd = os.open(self.db_file, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        return doc_ids
+
+    def all(self) -> Iterator[Tuple[int, dict]]:
+        with self._locked():
+            docs = self._db.all()
+        for doc in docs:
+            yield doc.doc_id, dict(doc)
+
+    @timed('scan', records=len)
+    def scan(self, after: int = 0, limit: int = 1000,
+             article_ids: Range = (None, None),
+             curation_ids: Range = (None, None)) -> List[Tuple[int, dict]]:
+        def _in_range(value: Optional[int], bounds: Range) -> bool:
+            if bounds == (None, None):
+                return True
+            if value is None:
+                return False
+            return (bounds[0] is None or value >= bounds[0]) and \
+                (bounds[1] is None or value <= bounds[1])
+
+        with self._locked():
+            docs = self._db.all()
+        docs = sorted((doc for doc in docs if doc.doc_id > after and
+                       _in_range(doc.get('article_id'), article_ids) and
+                       _in_range(doc.get('curation_id'), curation_ids)),
+                      key=lambda doc: doc.doc_id)
+        return [(doc.doc_id, dict(doc)) for doc in docs[:limit]]
+
+    def count(self) -> int:
+        with self._locked():
+            return len(self._db)
+
+    def version(self) -> str:
+        # Every write rewrites the file; copies replace it (new inode)
+        with self._lock:
+            return '{}:{}:{}'.format(*self._file_stat())
+
+    def close(self):
+        with self._locked():
+            self._db.close()
+
+
+class SQLiteStorage(Storage):
+    """
+    README database stored in SQLite
+
+    Records are indexed on ``article_id`` and ``(article_id, curation_id)``.
+    A pool of long-lived connections is kept for the database file.
+    """
+    backend = 'sqlite'
+
+    schema = [
+        """CREATE TABLE IF NOT EXISTS records (
+               doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+               article_id INTEGER NOT NULL,
+               curation_id INTEGER,
+               data TEXT NOT NULL
+           )""",
+        """CREATE INDEX IF NOT EXISTS records_article_id
+               ON records (article_id)""",
+        """CREATE INDEX IF NOT EXISTS records_article_curation_id
+               ON records (article_id, curation_id)""",
+        # Count of writes, and an ID telling apart databases copied over
+        # this one, maintained for all writers by triggers
+        """CREATE TABLE IF NOT EXISTS changes (
+               id TEXT NOT NULL,
+               writes INTEGER NOT NULL
+           )""",
+        """INSERT INTO changes SELECT lower(hex(randomblob(8))), 0
+               WHERE NOT EXISTS (SELECT 1 FROM changes)""",
+        *[f"""CREATE TRIGGER IF NOT EXISTS records_{event.lower()}
+                  AFTER {event} ON records
+                  BEGIN UPDATE changes SET writes = writes + 1; END"""
+          for event in ('INSERT', 'UPDATE', 'DELETE')],
+    ]
+
+    def __init__(self, db_file: str, pool_size: int = sqlite_pool_size):
+        super().__init__(db_file)
+        self._pool: LifoQueue = LifoQueue(maxsize=pool_size)
+        with self.connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                conn.execute(statement)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, timeout=30.0,
+                               isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection from the pool"""
+        try:
+            conn = self._pool.get_nowait()
+        except Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if self._pool.full():
+                conn.close()
+            else:
+                self._pool.put_nowait(conn)
+
+    @timed('read', records=_found)
+    def get(self, article_id: int, curation_id: Optional[int] = None) \
+            -> Optional[Tuple[int, dict]]:
+        if curation_id is None:
+            sql = "SELECT doc_id, data FROM records WHERE article_id = ? " \
+                  "ORDER BY doc_id LIMIT 1"
+            params = (article_id,)
+        else:
+            sql = "SELECT doc_id, data FROM records WHERE article_id = ? " \
+                  "AND curation_id = ? ORDER BY doc_id LIMIT 1"
+            params = (article_id, curation_id)
+
+        with self.connection() as conn:
+            row = conn.execute(sql, params).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    @timed('insert')
+    def insert(self, record: dict) -> int:
+        with self.connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO records (article_id, curation_id, data) "
+                "VALUES (?, ?, ?)",
+                (record['article_id'], record.get('curation_id'),
+                 json.dumps(record)))
+            return cursor.lastrowid
+
+    @timed('update')
+    def update(self, doc_id: int, record: dict):
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT data FROM records WHERE doc_id = ?",
+                                   (doc_id,)).fetchone()
+                if row is not None:
+                    data = json.loads(row[0])
+                    data.update(record)
+                    conn.execute(
+                        "UPDATE records SET article_id = ?, curation_id = ?, "
+                        "data = ? WHERE doc_id = ?",
+                        (data['article_id'], data.get('curation_id'),
+                         json.dumps(data), doc_id))
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _upsert(conn: sqlite3.Connection, record: dict) -> int:
+        row = conn.execute(
+            "SELECT doc_id, data FROM records WHERE article_id = ? "
+            "ORDER BY doc_id LIMIT 1",
+            (record['article_id'],)).fetchone()
+        if row is None:
+            return conn.execute(
+                "INSERT INTO records (article_id, curation_id, data) "
+                "VALUES (?, ?, ?)",
+                (record['article_id'], record.get('curation_id'),
+                 json.dumps(record))).lastrowid
+
+        doc_id = row[0]
+        data = json.loads(row[1])
+        data.update(record)
+        conn.execute("UPDATE records SET curation_id = ?, data = ? "
+                     "WHERE doc_id = ?",
+                     (data.get('curation_id'), json.dumps(data), doc_id))
+        return doc_id
+
+    @timed('upsert')
+    def upsert(self, record: dict) -> int:
+        with self.key_lock(record['article_id']), self.connection() as conn:
+            # Write lock is held from the lookup until commit
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                doc_id = self._upsert(conn, record)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return doc_id
+
+    @timed('upsert_many', records=len)
+    def upsert_many(self, records: List[dict],
+                    durable: bool = False) -> List[int]:
+        doc_ids = []
+        with self.connection() as conn:
+            if durable:
+                # synchronous=NORMAL does not sync the WAL on commit
+                conn.execute("PRAGMA synchronous=FULL")
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for record in records:
+                        doc_ids.append(self._upsert(conn, record))
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+            finally:
+                if durable:
+                    conn.execute("PRAGMA synchronous=NORMAL")
+        return doc_ids
+
+    def all(self) -> Iterator[Tuple[int, dict]]:
+        after = 0
+        while True:
+            batch = self.scan(after=after)
+            yield from batch
+            if not batch:
+                break
+            after = batch[-1][0]
+
+    @timed('scan', records=len)
+    def scan(self, after: int = 0, limit: int = 1000,
+             article_ids: Range = (None, None),
+             curation_ids: Range = (None, None)) -> List[Tuple[int, dict]]:
+        where = ["doc_id > ?"]
+        params = [after]
+        for column, bounds in [('article_id', article_ids),
+                               ('curation_id', curation_ids)]:
+            if bounds[0] is not None:
+                where.append(f"{column} >= ?")
+                params.append(bounds[0])
+            if bounds[1] is not None:
+                where.append(f"{column} <= ?")
+                params.append(bounds[1])
+
+        sql = f"SELECT doc_id, data FROM records WHERE {' AND '.join(where)} " \
+              f"ORDER BY doc_id LIMIT ?"
+        with self.connection() as conn:
+            rows = conn.execute(sql, (*params, limit)).fetchall()
+        return [(doc_id, json.loads(data)) for doc_id, data in rows]
+
+    def count(self) -> int:
+        with self.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def version(self) -> str:
+        with self.connection() as conn:
+            return '{}:{}'.format(*conn.execute(
+                "SELECT id, writes FROM changes").fetchone())
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                break
+
+
+def get_storage(db_file: str) -> Storage:
+    """
+    Return shared storage backend for ``db_file``
+
+    ``.json`` files use TinyDB. All other files use SQLite.
+
+    :param db_file: Filename for database
+
+    :return: Storage backend
+    """
+    key = str(Path(db_file).absolute())
+    storage = _storages.get(key)
+    if storage is None:
+        with _storages_lock:
+            storage = _storages.get(key)
+            if storage is None:
+                if Path(db_file).suffix in tinydb_suffixes:
+                    storage = TinyDBStorage(db_file)
+                else:
+                    storage = SQLiteStorage(db_file)
+                _storages[key] = storage
+    return storage
+
+
+def close_storages():
+    """Close all shared storage backends. Called on app shutdown"""
+    with _storages_lock:
+        for storage in _storages.values():
+            storage.close()
+        _storages.clear()
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from . import figshare, intake_form, metrics, ratelimit
+from .figshare_client import get_client
+from .locks import FileLock
+
+# Seconds between polls of the curation list. 0 disables the background task
+interval = 60.0
+
+# Curation records retrieved per request, and maximum requests per poll
+page_size = 1000
+max_pages = 10
+
+# Figshare environments to poll (False: production, True: stage).
+# Environments without an API key are skipped
+stages = (False, True)
+
+# JSON file keeping watermarks across restarts. None: keep in memory only
+watermark_file: Optional[str] = None
+
+# With several worker processes, only the worker holding this lock file
+# polls. None: always poll
+lock_file: Optional[str] = None
+
+changes = metrics.counter('rem_sync_changes',
+                          'Changed curations found by polling', ('stage',))
+
+
+class ChangeEvent(NamedTuple):
+    """Curation modified since the previous poll"""
+    article_id: int
+    curation_id: int
+    status: str
+    modified_date: str
+    stage: bool
+
+
+class Watermark(NamedTuple):
+    """Latest ``modified_date`` seen and the curations modified then"""
+    modified_date: str
+    curation_ids: frozenset
+
+
+_watermarks: Dict[bool, Watermark] = {}
+_listeners: List[Callable[[ChangeEvent], None]] = []
+_task: Optional[asyncio.Task] = None
+_lock: Optional[FileLock] = None
+
+
+def on_change(listener: Callable[[ChangeEvent], None]):
+    """
+    Register function called with each ``ChangeEvent``
+
+    :param listener: Function taking a ``ChangeEvent``, called in a
+                     worker thread
+    """
+    _listeners.append(listener)
+
+
+def invalidate_metadata(event: ChangeEvent):
+    """Drop cached Figshare metadata for the changed article"""
+    figshare.metadata_cache.invalidate(
+        lambda key: key[0] == event.article_id and key[2] == event.stage)
+
+
+def invalidate_draft_validations(event: ChangeEvent):
+    """
+    Re-validate draft autosaves for the changed article. Other worker
+    processes re-validate after ``draft_validations.ttl`` seconds
+    """
+    intake_form.draft_validations.invalidate(
+        lambda key: key[0] == event.article_id and key[2] == event.stage)
+
+
+on_change(invalidate_metadata)
+on_change(invalidate_draft_validations)
+
+
+def _stage_name(stage: bool) -> str:
+    return 'stage' if stage else 'production'
+
+
+def load_watermarks():
+    """Read watermarks from ``watermark_file``, if it exists"""
+    if watermark_file is None or not os.path.exists(watermark_file):
+        return
+    with open(watermark_file) as fin:
+        data = json.load(fin)
+    for stage in (False, True):
+        entry = data.get(_stage_name(stage))
+        if entry is not None:
+            _watermarks[stage] = Watermark(entry['modified_date'],
+                                           frozenset(entry['curation_ids']))
+
+
+def save_watermarks():
+    """Write watermarks to ``watermark_file``"""
+    if watermark_file is None:
+        return
+    data = {_stage_name(stage): {'modified_date': mark.modified_date,
+                                 'curation_ids': sorted(mark.curation_ids)}
+            for stage, mark in _watermarks.items()}
+    tmp_file = f'{watermark_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as fout:
+        json.dump(data, fout)
+    os.replace(tmp_file, watermark_file)
+
+
+def changed_since(curations: List[dict], watermark: Optional[Watermark]) \
+        -> List[dict]:
+    """
+    Return curations modified after ``watermark``
+
+    :param curations: Curation records with ``modified_date``
+    :param watermark: Watermark from the previous poll
+
+    :return: Changed curations
+    """
+    if watermark is None:
+        return []
+    return [curation for curation in curations
+            if curation['modified_date'] > watermark.modified_date or
+            (curation['modified_date'] == watermark.modified_date and
+             curation['id'] not in watermark.curation_ids)]
+
+
+def next_watermark(curations: List[dict],
+                   watermark: Optional[Watermark]) -> Optional[Watermark]:
+    """Return watermark after seeing ``curations``"""
+    if not curations:
+        return watermark
+    latest = max(curation['modified_date'] for curation in curations)
+    if watermark is not None and latest < watermark.modified_date:
+        return watermark
+    ids = frozenset(curation['id'] for curation in curations
+                    if curation['modified_date'] == latest)
+    if watermark is not None and latest == watermark.modified_date:
+        ids |= watermark.curation_ids
+    return Watermark(latest, ids)
+
+
+async def poll(stage: bool = False) -> List[ChangeEvent]:
+    """
+    Find curations modified since the previous poll and notify listeners.
+    The first poll only sets the watermark
+
+    The curation list has no filter by modification date, so it is
+    retrieved newest first, and paging stops at curations older than the
+    watermark. At most ``max_pages`` pages are retrieved
+
+    :param stage: Figshare stage or production API
+
+    :return: Change events
+    """
+    token = figshare.stage_api_key if stage else figshare.api_key
+    if not token:
+        return []
+
+    watermark = _watermarks.get(stage)
+    curations = []
+    fs_client = get_client(stage)
+    for page_number in range(max_pages):
+        response = await fs_client.get_curation_list(
+            token, offset=page_number * page_size, limit=page_size,
+            order='modified_date', order_direction='desc')
+        if response.status_code != 200:
+            print(f"WARNING: sync: Unable to retrieve curations "
+                  f"(status={response.status_code})")
+            return []
+        page = response.json()
+        curations += page
+        if len(page) < page_size:
+            break
+        # Curations modified at the watermark may continue on the next page
+        since = watermark.modified_date if watermark is not None \
+            else curations[0]['modified_date']
+        if page[-1]['modified_date'] < since:
+            break
+    else:
+        print(f"WARNING: sync: More than {max_pages * page_size} "
+              f"curations changed (stage={stage}); older changes skipped")
+
+    events = [ChangeEvent(curation['article_id'], curation['id'],
+                          curation['status'], curation['modified_date'], stage)
+              for curation in changed_since(curations, watermark)]
+    for event in events:
+        for listener in _listeners:
+            try:
+                # Listeners may wait for the shared cache database
+                await run_in_threadpool(listener, event)
+            except Exception as err:
+                name = getattr(listener, '__name__', repr(listener))
+                print(f"WARNING: sync: {name} failed for article "
+                      f"{event.article_id} ({err!r})")
+    changes.inc(_stage_name(stage), amount=len(events))
+
+    new_watermark = next_watermark(curations, watermark)
+    if new_watermark != watermark:
+        _watermarks[stage] = new_watermark
+        save_watermarks()
+    return events
+
+
+def _is_leader() -> bool:
+    global _lock
+    if lock_file is None:
+        return True
+    if _lock is None:
+        _lock = FileLock(lock_file)
+    # Keep the lock once acquired; retry on each pass otherwise
+    return _lock.depth > 0 or _lock.acquire(blocking=False)
+
+
+async def _run():
+    # Figshare requests of this task yield to interactive requests
+    ratelimit.priority.set('batch')
+    leader = False
+    while True:
+        if not _is_leader():
+            await asyncio.sleep(interval)
+            continue
+        if not leader:
+            # Continue from the watermarks saved by a previous leader
+            load_watermarks()
+            leader = True
+        for stage in stages:
+            try:
+                events = await poll(stage)
+                if events:
+                    print(f"sync: {len(events)} curations changed "
+                          f"(stage={stage})")
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                print(f"WARNING: sync: poll failed ({err!r})")
+        await asyncio.sleep(interval)
+
+
+async def start():
+    """Start background polling task. Called on app startup"""
+    global _task
+    if interval > 0 and _task is None:
+        _task = asyncio.ensure_future(_run())
+
+
+async def stop():
+    """Stop background polling task. Called on app shutdown"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    if _lock is not None and _lock.depth > 0:
+        _lock.release()
@@ -18,6 +18,9 @@ setup(
     long_description=long_description,
     long_description_content_type='text/markdown',
     install_requires=requirements,
+    entry_points={
+        'console_scripts': ['rem-db=readme_tool.migrate:main'],
+    },
     python_requires='>=3.7',
     classifiers=[
         'Development Status :: 4 - Beta',
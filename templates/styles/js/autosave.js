@@ -0,0 +1,42 @@
+/* Autosave changed README form fields as a draft.
+   Changes are sent a few seconds after typing stops, only for the
+   fields that changed since the last save. */
+var autosaveDelay = 3000;
+var autosaveUrl = window.location.pathname.replace(/\/?$/, "/draft") +
+  window.location.search;
+var autosaveFields = ["citation", "summary", "files", "materials",
+                      "contributors", "notes"];
+var autosaveChanged = {};
+var autosaveTimer = null;
+
+function autosave() {
+  var draft = autosaveChanged;
+  autosaveChanged = {};
+  if (Object.keys(draft).length === 0) {
+    return;
+  }
+  fetch(autosaveUrl, {
+    method: "PATCH",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify(draft)
+  }).then(function(response) {
+    if (!response.ok) {
+      throw new Error(response.status);
+    }
+  }).catch(function() {
+    /* Retry with the next change, keeping newer values */
+    autosaveChanged = Object.assign(draft, autosaveChanged);
+  });
+}
+
+autosaveFields.forEach(function(field) {
+  var element = document.getElementById(field);
+  if (element === null) {
+    return;
+  }
+  element.addEventListener("input", function() {
+    autosaveChanged[field] = element.value;
+    clearTimeout(autosaveTimer);
+    autosaveTimer = setTimeout(autosave, autosaveDelay);
+  });
+});
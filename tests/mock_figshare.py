@@ -0,0 +1,186 @@
+"""
+Local stand-in for the Figshare API
+
+Serves the curation list, curation details and article endpoints used by
+``readme_tool.figshare_client``, with configurable latency and failures.
+Run in-process with ``MockFigshareServer`` (a real HTTP server on localhost)
+or standalone::
+
+    python -m tests.mock_figshare --port 8001 --curations 1000 \
+        --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import random
+import socket
+import threading
+from time import sleep
+from typing import List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI()
+
+
+class MockState:
+    """Data served and failure modes of the mock Figshare API"""
+
+    def __init__(self):
+        self.curations = {}
+        self.articles = {}
+        # Seconds added to each response, plus uniform random jitter
+        self.latency = 0.0
+        self.latency_jitter = 0.0
+        # Statuses returned, in order, for the next requests
+        self.fail_statuses: List[int] = []
+        # Fraction of requests failing at random with ``error_status``
+        self.error_rate = 0.0
+        self.error_status = 503
+        self.random = random.Random(0)
+        self.requests: List[str] = []
+
+    def reset(self):
+        self.__init__()
+
+    def add_curation(self, article_id: int, curation_id: int,
+                     status: str = 'pending', title: str = 'Dataset title'):
+        item = {
+            'id': article_id,
+            'title': title,
+            'description': f'<p>Description of {title}</p>',
+            'doi': f'10.25422/azu.data.{article_id}',
+            'citation': f'Ly, Chun (2021): {title}. University of Arizona. '
+                        f'Dataset. https://doi.org/10.25422/azu.data.{article_id}',
+            'license': {'name': 'CC BY 4.0'},
+            'references': [],
+        }
+        self.articles[article_id] = item
+        self.curations[curation_id] = {
+            'id': curation_id,
+            'article_id': article_id,
+            'status': status,
+            'modified_date': '2021-07-01T00:00:00Z',
+            'item': item,
+        }
+
+    def modify_curation(self, curation_id: int, modified_date: str,
+                        **fields):
+        """Update fields of a curation, as a curator would"""
+        self.curations[curation_id].update(fields,
+                                           modified_date=modified_date)
+
+    def add_curations(self, count: int, start: int = 1,
+                      status: str = 'pending'):
+        """Add ``count`` curations for article IDs from ``start``"""
+        for article_id in range(start, start + count):
+            self.add_curation(article_id, article_id + 1000000, status=status,
+                              title=f'Dataset {article_id}')
+
+
+state = MockState()
+
+
+@app.middleware('http')
+async def failure_modes(request: Request, call_next):
+    state.requests.append(request.url.path)
+    latency = state.latency
+    if state.latency_jitter:
+        latency += state.random.uniform(0, state.latency_jitter)
+    if latency:
+        await asyncio.sleep(latency)
+    status_code = None
+    if state.fail_statuses:
+        status_code = state.fail_statuses.pop(0)
+    elif state.error_rate and state.random.random() < state.error_rate:
+        status_code = state.error_status
+    if status_code is not None:
+        return JSONResponse({'message': 'Mock failure'},
+                            status_code=status_code)
+    return await call_next(request)
+
+
+@app.get('/v2/account/institution/reviews')
+async def curation_list(article_id: Optional[int] = None, status: str = '',
+                        offset: int = 0, limit: int = 1000, order: str = '',
+                        order_direction: str = 'desc'):
+    curations = [
+        {key: value for key, value in curation.items() if key != 'item'}
+        for curation in state.curations.values()
+        if (article_id is None or curation['article_id'] == article_id) and
+        (not status or curation['status'] == status)
+    ]
+    if order:
+        curations.sort(key=lambda curation: curation[order],
+                       reverse=order_direction == 'desc')
+    return curations[offset:offset + limit]
+
+
+@app.get('/v2/account/institution/review/{curation_id}')
+async def curation_details(curation_id: int):
+    if curation_id not in state.curations:
+        return JSONResponse({'message': 'Entity not found'}, status_code=404)
+    return state.curations[curation_id]
+
+
+@app.get('/v2/articles/{article_id}')
+async def article(article_id: int):
+    if article_id not in state.articles:
+        return JSONResponse({'message': 'Entity not found'}, status_code=404)
+    return state.articles[article_id]
+
+
+class MockFigshareServer:
+    """
+    Run the mock Figshare API on a free localhost port in a thread
+
+    Usage::
+
+        with MockFigshareServer() as server:
+            figshare_client.base_urls[False] = server.url
+    """
+
+    def __init__(self, port: Optional[int] = None):
+        if port is None:
+            with socket.socket() as sock:
+                sock.bind(('127.0.0.1', 0))
+                port = sock.getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+        config = uvicorn.Config(app, host='127.0.0.1', port=port,
+                                log_level='warning', lifespan='off')
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> 'MockFigshareServer':
+        self.thread.start()
+        while not self.server.started:
+            sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Figshare API')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--curations', type=int, default=100,
+                        help='Number of pending curations to serve')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    args = parser.parse_args()
+
+    state.add_curations(args.curations)
+    state.latency = args.latency
+    state.latency_jitter = args.latency_jitter
+    state.error_rate = args.error_rate
+    state.error_status = args.error_status
+    uvicorn.run(app, host='127.0.0.1', port=args.port, log_level='warning')
+
+
+if __name__ == "__main__":
+    main()
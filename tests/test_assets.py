@@ -0,0 +1,65 @@
+from shutil import copytree
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.templating import Jinja2Templates
+
+from readme_tool import assets
+
+
+def _client(directory: str):
+    manifest = assets.AssetManifest(directory)
+    app = FastAPI()
+    app.mount('/assets', assets.AssetFiles(directory=directory,
+                                           asset_manifest=manifest))
+    return TestClient(app), manifest
+
+
+def test_asset_url():
+    url = assets.asset_url('styles/css/styles.css')
+    assert url.startswith('/assets/styles/css/styles.')
+    assert url.endswith('.css') and url != '/assets/styles/css/styles.css'
+    assert assets.asset_url('/img/ReDATA_logo.png') == \
+        assets.asset_url('img/ReDATA_logo.png')
+
+
+def test_asset_files(tmp_path):
+    directory = str(tmp_path / 'templates')
+    copytree('templates', directory)
+    client, manifest = _client(directory)
+    path = manifest.fingerprint('styles/css/styles.css')
+
+    response = client.get(f'/assets/{path}')
+    assert response.status_code == 200
+    assert response.headers['cache-control'] == assets.immutable_cache_control
+    etag = response.headers['etag']
+
+    response = client.get(f'/assets/{path}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    # Non-fingerprinted paths are revalidated
+    response = client.get('/assets/styles/css/styles.css')
+    assert response.status_code == 200
+    assert response.headers['cache-control'] == 'no-cache'
+
+    # Pre-gzipped copies
+    assert assets.compress_assets(directory) > 0
+    assert assets.compress_assets(directory) == 0
+    response = client.get(f'/assets/{path}',
+                          headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['content-type'].startswith('text/css')
+    with open(f'{directory}/styles/css/styles.css', 'rb') as fin:
+        assert response.content == fin.read()  # Decoded by client
+    response = client.get(f'/assets/{path}',
+                          headers={'Accept-Encoding': 'gzip;q=0, br'})
+    assert 'content-encoding' not in response.headers
+
+
+def test_precompile_templates(tmp_path):
+    templates = Jinja2Templates(directory='templates/')
+    cache_dir = tmp_path / 'cache'
+    assert assets.precompile_templates(templates, str(cache_dir)) == 3
+    assert len(list(cache_dir.iterdir())) == 3
+    assert not templates.env.auto_reload
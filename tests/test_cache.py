@@ -0,0 +1,136 @@
+import sqlite3
+import threading
+from time import monotonic, sleep
+
+from fastapi import HTTPException
+
+from readme_tool import figshare
+from readme_tool.cache import SQLiteCache, TTLCache
+
+
+def test_ttl_cache_lru():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == (True, 1)  # 'a' is now most recently used
+    cache.set('c', 3)
+    assert cache.get('b') == (False, None)
+    assert 'a' in cache and 'c' in cache
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(maxsize=10, ttl=60, error_ttl=0.01)
+    cache.set('ok', 1)
+    cache.set('err', ValueError(), ttl=cache.error_ttl)
+    sleep(0.02)
+    assert cache.get('ok') == (True, 1)
+    assert cache.get('err') == (False, None)
+    assert len(cache) == 1
+
+
+def test_ttl_cache_invalidate():
+    cache = TTLCache()
+    for key in [(1, None), (1, 2), (3, None)]:
+        cache.set(key, key)
+    assert cache.invalidate(lambda key: key[0] == 1) == 2
+    assert len(cache) == 1
+
+
+def test_sqlite_cache(tmp_path):
+    db_file = str(tmp_path / 'cache.db')
+    cache = SQLiteCache(db_file, maxsize=2, ttl=60, error_ttl=0.01)
+    cache.set((1, None), {'id': 2})
+    cache.set((3, None), {'id': 4}, ttl=cache.error_ttl)
+    sleep(0.02)
+    assert cache.get((1, None)) == (True, {'id': 2})
+    assert cache.get((3, None)) == (False, None)
+
+    # Entries are shared with other processes using the same file
+    other = SQLiteCache(db_file, maxsize=2)
+    other.set((5, 6), {'id': 6})
+    other.set((7, 8), {'id': 8})
+    assert (7, 8) in cache
+    assert len(cache) == 2
+    assert cache.invalidate(lambda key: key[0] == 5) == 1
+    assert other.stats()['size'] == 1
+    cache.close()
+    other.close()
+
+
+def test_sqlite_cache_errors(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'),
+                        encode=figshare.dump_cache_value,
+                        decode=figshare.load_cache_value)
+    cache.set('err', HTTPException(status_code=401, detail='Not pending'))
+    hit, value = cache.get('err')
+    assert isinstance(value, HTTPException)
+    assert (value.status_code, value.detail) == (401, 'Not pending')
+    cache.close()
+
+
+def test_sqlite_cache_locked(tmp_path):
+    db_file = str(tmp_path / 'cache.db')
+    cache = SQLiteCache(db_file, timeout=0.05)
+    cache.set((1, None), {'id': 1})
+
+    # Another process holds the write lock
+    other = sqlite3.connect(db_file, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    t0 = monotonic()
+    cache.set((2, None), {'id': 2})
+    assert monotonic() - t0 < 1.0
+    assert cache.get((1, None)) == (True, {'id': 1})
+    assert cache.get((2, None)) == (True, {'id': 2})
+    assert cache.stats()['fallbacks'] == 1
+    other.execute("ROLLBACK")
+
+    assert cache.invalidate(lambda key: True) == 2
+    assert (2, None) not in cache
+
+    # Lookups are not held up by an invalidation waiting for the lock
+    cache.set((3, None), {'id': 3})
+    other.execute("BEGIN IMMEDIATE")
+    cache.write_timeout = 1.0
+    errors = []
+
+    def _invalidate():
+        try:
+            cache.invalidate(lambda key: True)
+        except sqlite3.OperationalError as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=_invalidate)
+    thread.start()
+    sleep(0.1)
+    t0 = monotonic()
+    assert cache.get((3, None)) == (True, {'id': 3})
+    assert monotonic() - t0 < 0.5
+    thread.join()
+    assert errors
+    other.execute("ROLLBACK")
+    other.close()
+    cache.close()
+
+
+def test_ttl_cache_threads():
+    cache = TTLCache(maxsize=1000, ttl=60)
+    stop = threading.Event()
+
+    def _write():
+        i = 0
+        while not stop.is_set():
+            cache.set(i % 2000, i)
+            cache.get((i * 7) % 2000)
+            i += 1
+
+    thread = threading.Thread(target=_write)
+    thread.start()
+    try:
+        # Invalidated from a worker thread while the loop uses the cache
+        for _ in range(300):
+            cache.invalidate(lambda key: key % 3 == 0)
+    finally:
+        stop.set()
+        thread.join()
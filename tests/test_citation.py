@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from readme_tool.citation import parse_citation
+
+with open('tests_data/citations.json') as fin:
+    corpus = json.load(fin)
+
+
+@pytest.mark.parametrize('sample', corpus,
+                         ids=[s['citation'][:30] for s in corpus])
+def test_parse_citation(sample):
+    citation = parse_citation(sample['citation'])
+    for key in ['year', 'title', 'publisher', 'item_type', 'doi']:
+        assert getattr(citation, key) == sample[key]
+    assert list(citation.authors) == sample['authors']
+
+    lines = citation.preferred_citation()
+    if sample['year'] is None:
+        assert lines == [sample['citation']]
+    else:
+        assert lines[0] == f"{'; '.join(sample['authors'])} ({sample['year']})."
+        assert lines[1].startswith(sample['title'])
+        if sample['doi']:
+            assert lines[-1] == f"https://doi.org/{sample['doi']}"
+
+
+def test_parse_citation_cache():
+    parse_citation.cache_clear()
+    for _ in range(3):
+        parse_citation(corpus[0]['citation'])
+    info = parse_citation.cache_info()
+    assert info.hits == 2 and info.misses == 1
@@ -0,0 +1,184 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.templating import Jinja2Templates
+
+from readme_tool import compression
+from readme_tool.assets import stream_template
+from readme_tool.compression import CompressionMiddleware, choose_encoding
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware)
+client = TestClient(app)
+
+large = {'files': 'data/file.csv: Measurements\n' * 200}
+
+
+@app.get('/large')
+async def get_large(response: Response) -> dict:
+    response.headers['ETag'] = '"abc"'
+    return large
+
+
+@app.get('/small')
+async def get_small() -> dict:
+    return {'ok': True}
+
+
+@app.get('/stream')
+async def get_stream() -> StreamingResponse:
+    return StreamingResponse(iter(['<html><head></head>', '<body>' * 200,
+                                   '</html>']), media_type='text/html')
+
+
+@app.get('/small-stream')
+async def get_small_stream() -> StreamingResponse:
+    return StreamingResponse(iter(['<html>', '</html>']),
+                             media_type='text/html')
+
+
+def _receive():
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Client stays connected
+        await asyncio.Event().wait()
+
+    return receive
+
+
+def _asgi_request(path: str, accept_encoding: str = 'gzip') -> list:
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+             'root_path': '', 'scheme': 'http', 'server': ('rem', 80),
+             'headers': [(b'accept-encoding', accept_encoding.encode())]}
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, _receive(), send))
+    return messages
+
+
+def test_choose_encoding(monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+    assert choose_encoding('gzip, deflate, br') == 'gzip'
+    assert choose_encoding('identity') is None
+    assert choose_encoding('gzip;q=0, *;q=0.5') is None
+    assert choose_encoding('*') == 'gzip'
+    assert choose_encoding('') is None
+
+
+def test_compressed_json():
+    response = client.get('/large', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert response.headers['etag'] == '"abc-gzip"'
+    assert response.json() == large
+    assert int(response.headers['content-length']) < len(large['files']) / 10
+
+    # Below the size threshold, or not accepted by the client
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in response.headers
+    assert response.headers['vary'] == 'Accept-Encoding'
+    response = client.get('/large', headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in response.headers
+    assert response.json() == large
+
+
+def test_compressed_stream():
+    messages = _asgi_request('/stream')
+    headers = dict(messages[0]['headers'])
+    assert headers[b'content-encoding'] == b'gzip'
+    assert b'content-length' not in headers
+
+    # Chunks are held back until minimum_size bytes are available, then
+    # each chunk is flushed, so it can be decoded before the next one
+    decoder = zlib.decompressobj(31)
+    bodies = [message['body'] for message in messages[1:]]
+    assert decoder.decompress(bodies[0]) == \
+        ('<html><head></head>' + '<body>' * 200).encode()
+    assert gzip.decompress(b''.join(bodies)) == \
+        ('<html><head></head>' + '<body>' * 200 + '</html>').encode()
+
+    # Short streams are sent uncompressed
+    messages = _asgi_request('/small-stream')
+    assert b'content-encoding' not in dict(messages[0]['headers'])
+    assert b''.join(message.get('body', b'')
+                    for message in messages[1:]) == b'<html></html>'
+
+
+def test_conditional():
+    etag = 'W/"v1"'
+
+    @app.get('/conditional')
+    async def get_conditional(request: Request):
+        if request.headers.get('if-none-match') == etag:
+            return Response(status_code=304, headers={'ETag': etag})
+        return JSONResponse(large, headers={'ETag': etag})
+
+    response = client.get('/conditional', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['etag'] == 'W/"v1-gzip"'
+
+    # The app sees the ETag of the uncompressed representation
+    response = client.get('/conditional', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': 'W/"v1-gzip"'})
+    assert response.status_code == 304
+    assert response.headers['etag'] == 'W/"v1-gzip"'
+    response = client.get('/conditional', headers={
+        'Accept-Encoding': 'identity', 'If-None-Match': 'W/"v1"'})
+    assert response.status_code == 304
+    assert response.headers['etag'] == 'W/"v1"'
+
+
+def test_brotli():
+    brotli = pytest.importorskip('brotli')
+    assert choose_encoding('gzip, br') == 'br'
+    assert choose_encoding('gzip, br;q=0.5') == 'gzip'
+    response = client.get('/large', headers={'Accept-Encoding': 'br'})
+    assert response.headers['content-encoding'] == 'br'
+    assert response.json() == large
+    assert brotli
+
+
+def test_stream_template(tmp_path, monkeypatch):
+    (tmp_path / 'page.html').write_text(
+        '<html><head><title>{{ title }}</title></head>\n'
+        '<body>{% for i in range(500) %}<p>{{ i }}</p>{% endfor %}</body>'
+        '</html>')
+    templates = Jinja2Templates(directory=str(tmp_path))
+    monkeypatch.setitem(compression.__dict__, 'enabled', False)
+
+    page_app = FastAPI()
+
+    @page_app.get('/page')
+    async def get_page():
+        return stream_template(templates, 'page.html', {'title': 'README'})
+
+    chunks = []
+
+    async def _run():
+        scope = {'type': 'http', 'method': 'GET', 'path': '/page',
+                 'query_string': b'', 'root_path': '', 'scheme': 'http',
+                 'server': ('rem', 80), 'headers': []}
+
+        async def send(message):
+            if message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b'').decode())
+
+        await page_app(scope, _receive(), send)
+
+    asyncio.run(_run())
+    # The head is sent on its own, before the body is rendered
+    assert '<title>README</title></head>' in chunks[0]
+    assert '<p>' not in chunks[0]
+    assert ''.join(chunks) == templates.get_template('page.html').render(
+        title='README')
+    assert len([chunk for chunk in chunks if chunk]) > 2
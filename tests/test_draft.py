@@ -0,0 +1,80 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from readme_tool import figshare, figshare_client, intake_form, journal, \
+    storage
+
+from .mock_figshare import MockFigshareServer, state
+
+app = FastAPI()
+app.include_router(intake_form.router)
+client = TestClient(app)
+
+article_id = 12966581
+curation_id = 540005
+
+
+@pytest.fixture(scope='module')
+def server():
+    with MockFigshareServer() as mock_server:
+        yield mock_server
+
+
+@pytest.fixture(autouse=True)
+def mock_figshare(server, monkeypatch):
+    state.reset()
+    state.add_curation(article_id, curation_id)
+    monkeypatch.setitem(figshare_client.base_urls, False, server.url)
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+    intake_form.draft_validations.clear()
+    yield
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+    journal.close_journals()
+    storage.close_storages()
+
+
+@pytest.mark.parametrize('journaled', [False, True])
+def test_patch_draft(tmp_path, monkeypatch, journaled):
+    monkeypatch.setattr(journal, 'enabled', journaled)
+    params = {'db_file': str(tmp_path / 'intake.db')}
+    url = f'/form/{article_id}/draft'
+
+    response = client.patch(url, params=params, json={'summary': 'Draft'})
+    assert response.status_code == 200
+    assert response.json() == {'article_id': article_id,
+                               'curation_id': curation_id,
+                               'saved': ['summary']}
+    # New records have all fields
+    record = client.get(f'/database/read/{article_id}', params=params).json()
+    assert record['summary'] == 'Draft' and record['files'] == ''
+
+    # Figshare is not queried again within the validity window
+    n_requests = len(state.requests)
+    figshare.metadata_cache.clear()
+    response = client.patch(url, params=params,
+                            json={'materials': 'Methods'})
+    assert response.json()['saved'] == ['materials']
+    assert len(state.requests) == n_requests
+
+    record = client.get(f'/database/read/{article_id}', params=params).json()
+    assert (record['summary'], record['materials']) == ('Draft', 'Methods')
+
+
+def test_patch_draft_errors(tmp_path):
+    params = {'db_file': str(tmp_path / 'intake.db')}
+    response = client.patch(f'/form/{article_id}/draft', params=params,
+                            json={})
+    assert response.status_code == 400
+    response = client.patch(f'/form/{article_id}/draft', params=params,
+                            json={'title': 'Not a form field'})
+    assert response.status_code == 422
+
+    # Curation not pending
+    state.curations[curation_id]['status'] = 'approved'
+    response = client.patch(f'/form/{article_id}/draft', params=params,
+                            json={'summary': 'Draft'})
+    assert response.status_code == 401
+    assert storage.get_storage(params['db_file']).count() == 0
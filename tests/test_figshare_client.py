@@ -0,0 +1,188 @@
+import asyncio
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+from fastapi import FastAPI
+
+from readme_tool import figshare, figshare_client
+
+app = FastAPI()
+app.include_router(figshare.router)
+client = TestClient(app)
+
+article_id = 12966581
+curation_id = 540005
+article_id_404 = 12345678
+
+citation = 'Ly, Chun; Smith, Jane (2020): Dataset title. ' \
+           'University of Arizona. Dataset. https://doi.org/10.25422/azu.data.12966581'
+
+curation = {
+    'id': curation_id,
+    'status': 'pending',
+    'item': {
+        'id': article_id,
+        'title': 'Dataset title',
+        'description': 'Description',
+        'doi': '10.25422/azu.data.12966581',
+        'citation': citation,
+        'license': {'name': 'CC BY 4.0'},
+        'references': [],
+    }
+}
+
+calls = []
+
+
+def mock_figshare(request: httpx.Request) -> httpx.Response:
+    calls.append((request.url.host, request.url.path))
+    path = request.url.path
+    if path == '/v2/account/institution/reviews':
+        if request.url.params.get('article_id') == str(article_id):
+            return httpx.Response(200, json=[curation])
+        return httpx.Response(200, json=[])
+    if path == f'/v2/account/institution/review/{curation_id}':
+        return httpx.Response(200, json=curation)
+    if path == f'/v2/articles/{article_id_404}':
+        return httpx.Response(404, json={'message': 'Entity not found'})
+    return httpx.Response(404, json={'message': 'Not found'})
+
+
+def setup_module():
+    figshare_client.transport = httpx.MockTransport(mock_figshare)
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+
+
+def teardown_module():
+    figshare_client.transport = None
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+
+
+def test_get_figshare():
+    calls.clear()
+    response = client.get(f'/figshare/{article_id}/')
+    assert response.status_code == 200
+    assert response.json()['id'] == curation_id
+    assert calls == [
+        ('api.figshare.com', '/v2/account/institution/reviews'),
+        ('api.figshare.com', f'/v2/account/institution/review/{curation_id}'),
+    ]
+
+    # Stage uses its own host and pool
+    calls.clear()
+    response = client.get(f'/figshare/{article_id}/',
+                          params={'curation_id': curation_id, 'stage': True})
+    assert response.status_code == 200
+    assert calls == [
+        ('api.figsh.com', f'/v2/account/institution/review/{curation_id}')
+    ]
+    assert figshare_client.get_client(True) is not \
+        figshare_client.get_client(False)
+
+
+def test_get_metadata_errors():
+    response = client.get(f'/metadata/{article_id_404}/')
+    assert response.status_code == 404
+    assert 'Entity not found' in response.json()['detail']
+
+    response = client.get(f'/metadata/{article_id}/')
+    assert response.status_code == 200
+    assert response.json()['curation_id'] == curation_id
+
+
+def test_metadata_cache():
+    figshare.metadata_cache.clear()
+    calls.clear()
+
+    # Form load then submit: one upstream fetch
+    for _ in range(2):
+        response = client.get(f'/metadata/{article_id}/')
+        assert response.status_code == 200
+    assert len(calls) == 2
+
+    # Resolved curation_id is cached as well
+    response = client.get(f'/metadata/{article_id}/',
+                          params={'curation_id': curation_id})
+    assert response.status_code == 200
+    assert len(calls) == 2
+
+    # Failures are cached
+    for _ in range(2):
+        response = client.get(f'/metadata/{article_id_404}/')
+        assert response.status_code == 404
+    assert len(calls) == 4
+
+    response = client.delete(f'/figshare/cache/{article_id}/')
+    assert response.status_code == 200
+    assert response.json()['removed'] == 2
+    client.get(f'/metadata/{article_id}/')
+    assert len(calls) == 6
+
+
+def test_single_flight():
+    async def _concurrent():
+        fs_client = figshare_client.get_client(False)
+        results = await asyncio.gather(*[
+            fs_client.get_curation_details(None, curation_id)
+            for _ in range(5)
+        ])
+        return fs_client, results
+
+    calls.clear()
+    fs_client, results = asyncio.run(_concurrent())
+    assert all(r.json()['id'] == curation_id for r in results)
+    assert len(calls) == 1
+    assert fs_client.flights.coalesced >= 4
+
+    response = client.get('/figshare/stats/')
+    assert response.status_code == 200
+    assert response.json()['single_flight']['production']['coalesced'] >= 4
+
+
+def test_metadata_batch():
+    figshare.metadata_cache.clear()
+    items = [{'article_id': article_id},
+             {'article_id': article_id_404},
+             {'article_id': article_id, 'curation_id': curation_id}]
+
+    response = client.post('/metadata/batch',
+                           json={'items': items, 'concurrency': 2})
+    assert response.status_code == 200
+    results = response.json()
+    assert [r['status_code'] for r in results] == [200, 404, 200]
+    assert results[0]['metadata']['curation_id'] == curation_id
+    assert 'Entity not found' in results[1]['detail']
+
+    response = client.post('/metadata/batch', params={'stream': True},
+                           json={'items': items})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(r['status_code'] for r in lines) == [200, 200, 404]
+
+    response = client.post('/metadata/batch', json={
+        'items': [{'article_id': 1}] * (figshare.max_batch_size + 1)})
+    assert response.status_code == 400
+
+
+def test_session_closed_on_loop_change():
+    fs_client = figshare_client.FigshareClient()
+
+    async def _session():
+        return fs_client._get_session()
+
+    first = asyncio.run(_session())
+
+    async def _next():
+        session = fs_client._get_session()
+        # Let the stale session close
+        await asyncio.sleep(0)
+        await asyncio.gather(*fs_client._closing)
+        return session
+
+    second = asyncio.run(_next())
+    assert second is not first
+    assert first.is_closed
+    assert not second.is_closed
@@ -0,0 +1,164 @@
+import random
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from readme_tool import history, intake_form, journal, storage
+from readme_tool.history import History, apply_text_delta, diff, patch, \
+    text_delta
+
+app = FastAPI()
+app.include_router(intake_form.router)
+client = TestClient(app)
+
+article_id = 12966581
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    yield str(tmp_path / 'intake.db')
+    history.close_histories()
+    storage.close_storages()
+
+
+def test_diff_patch():
+    old = {'article_id': 1, 'summary': 'The quick brown fox', 'notes': ''}
+    new = {'article_id': 1, 'summary': 'The quick red fox jumps',
+           'curation_id': 2}
+    delta = diff(old, new)
+    assert patch(old, delta) == new
+    assert delta['set'] == {'curation_id': 2}
+    assert delta['unset'] == ['notes']
+    assert diff(new, dict(new)) == {}
+
+    # Edits store the changed text only
+    text = 'x' * 10000
+    assert text_delta(text, text[:5000] + 'y' + text[5000:]) == \
+        [[5000, 5000, 'y']]
+
+    rng = random.Random(0)
+    for _ in range(100):
+        a = ''.join(rng.choice('ab\n') for _ in range(rng.randrange(30)))
+        b = ''.join(rng.choice('ab\n') for _ in range(rng.randrange(30)))
+        assert patch({'f': a}, diff({'f': a}, {'f': b})) == {'f': b}
+
+    # Long text is matched line by line
+    words = ['alpha', 'beta', 'gamma', 'delta', 'a' * 3000]
+    for _ in range(20):
+        a = '\n'.join(rng.choice(words) for _ in range(rng.randrange(200)))
+        b = '\n'.join(rng.choice(words) for _ in range(rng.randrange(200)))
+        assert patch({'f': a}, diff({'f': a}, {'f': b})) == {'f': b}
+    a = ''.join(f'line {i}\n' for i in range(20000))
+    b = ''.join(f'row {i}\n' for i in range(20000))
+    assert apply_text_delta(a, text_delta(a, b)) == b
+
+    # Longer text is stored whole
+    big = 'x' * (history.max_text_size + 1)
+    assert diff({'f': big}, {'f': big + 'y'}) == {'set': {'f': big + 'y'}}
+
+
+def test_revisions(db_file, monkeypatch):
+    monkeypatch.setattr(history, 'max_deltas', 5)
+    log = History(db_file)
+    files = 'data/file.csv: Measurements\n' * 500
+    versions = []
+    for i in range(20):
+        files = files.replace('Measurements', f'Measurements {i}', 1)
+        record = {'article_id': article_id, 'files': files}
+        assert log.record(record) == i + 1
+        versions.append(record)
+    # Unchanged records are not recorded
+    assert log.record(versions[-1]) is None
+
+    revisions = log.revisions(article_id)
+    assert [r['revision'] for r in revisions] == list(range(1, 21))
+    snapshots = [r['revision'] for r in revisions if r['snapshot']]
+    assert snapshots == [1, 7, 13, 19]
+    for i, version in enumerate(versions):
+        assert log.get(article_id, i + 1)[1] == version
+    assert log.get(article_id, 21) is None
+    assert log.get(1, 1) is None
+
+    # Storage grows with the edits, not the record
+    document_size = len(files)
+    assert log.size() < 5 * document_size
+    assert max(r['size'] for r in revisions if not r['snapshot']) < 100
+    log.close()
+
+
+def test_history_endpoints(db_file):
+    url = f'/database/history/{article_id}'
+    assert client.get(url, params={'db_file': db_file}).status_code == 404
+
+    record = {'article_id': article_id, 'curation_id': 540005,
+              'summary': 'First summary'}
+    client.post('/database/upsert', params={'db_file': db_file}, json=record)
+    client.post('/database/upsert', params={'db_file': db_file},
+                json={**record, 'summary': 'Second summary'})
+
+    response = client.get(url, params={'db_file': db_file, 'limit': 1})
+    assert response.status_code == 200
+    assert [r['revision'] for r in response.json()['revisions']] == [1]
+    assert response.json()['next_cursor'] == 1
+    response = client.get(url, params={'db_file': db_file, 'cursor': 1})
+    assert [r['revision'] for r in response.json()['revisions']] == [2]
+    assert response.json()['next_cursor'] is None
+
+    first = client.get(f'{url}/1', params={'db_file': db_file}).json()
+    assert first['record']['summary'] == 'First summary'
+    assert first['record']['files'] == ''
+    second = client.get(f'{url}/2', params={'db_file': db_file}).json()
+    assert second['record'] == \
+        storage.get_storage(db_file).get(article_id)[1]
+    assert client.get(f'{url}/3', params={'db_file': db_file}).status_code \
+        == 404
+
+
+def test_history_other_records(db_file):
+    # Revisions follow the first record for the article only
+    params = {'db_file': db_file}
+    record = {'article_id': article_id, 'curation_id': 540005,
+              'summary': 'First summary'}
+    client.post('/database/create', params=params, json=record)
+    client.post('/database/create', params=params,
+                json={**record, 'curation_id': 540006,
+                      'summary': 'Other summary'})
+    doc_id = storage.get_storage(db_file).get(article_id, 540006)[0]
+    client.post(f'/database/update/{doc_id}', params=params,
+                json={**record, 'curation_id': 540006,
+                      'summary': 'Other summary, updated'})
+    first_id = storage.get_storage(db_file).get(article_id)[0]
+    client.post(f'/database/update/{first_id}', params=params,
+                json={**record, 'summary': 'Second summary'})
+
+    url = f'/database/history/{article_id}'
+    response = client.get(url, params=params)
+    assert [r['revision'] for r in response.json()['revisions']] == [1, 2]
+    second = client.get(f'{url}/2', params=params).json()
+    assert second['record'] == storage.get_storage(db_file).get(article_id)[1]
+
+
+def test_history_existing_record(db_file):
+    # Written before history was recorded, e.g., migrated from intake.json
+    record = {**intake_form.IntakeData(article_id=article_id).dict(),
+              'curation_id': 540005, 'summary': 'Migrated summary',
+              'files': 'data.csv'}
+    storage.get_storage(db_file).insert(record)
+
+    try:
+        intake_form._save_draft({'article_id': article_id,
+                                 'materials': 'Draft materials'}, db_file)
+    finally:
+        journal.close_journals()
+    first = history.get_history(db_file).get(article_id, 1)[1]
+    assert first == {**record, 'materials': 'Draft materials'}
+
+
+def test_history_disabled(db_file, monkeypatch):
+    monkeypatch.setattr(history, 'enabled', False)
+    client.post('/database/upsert', params={'db_file': db_file},
+                json={'article_id': article_id})
+    response = client.get(f'/database/history/{article_id}',
+                          params={'db_file': db_file})
+    assert response.status_code == 404
@@ -0,0 +1,87 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from readme_tool import figshare, figshare_client, intake_form, storage
+from readme_tool.http_cache import http_date, strong_etag
+
+from .mock_figshare import MockFigshareServer, state
+
+app = FastAPI()
+app.include_router(figshare.router)
+app.include_router(intake_form.router)
+client = TestClient(app)
+
+article_id = 12966581
+curation_id = 540005
+
+
+@pytest.fixture(scope='module')
+def server():
+    with MockFigshareServer() as mock_server:
+        yield mock_server
+
+
+@pytest.fixture(autouse=True)
+def mock_figshare(server, monkeypatch):
+    state.reset()
+    state.add_curation(article_id, curation_id)
+    monkeypatch.setitem(figshare_client.base_urls, False, server.url)
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+    yield
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+    storage.close_storages()
+
+
+def test_strong_etag():
+    assert strong_etag({'a': 1, 'b': 2}) == strong_etag({'b': 2, 'a': 1})
+    assert strong_etag(1) != strong_etag('1')
+    assert http_date('2021-07-01T00:00:00Z') == \
+        'Thu, 01 Jul 2021 00:00:00 GMT'
+    assert http_date('') is None
+
+
+def test_metadata_not_modified():
+    url = f'/metadata/{article_id}/'
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers['etag']
+    assert response.headers['cache-control'] == 'private, max-age=60'
+    assert response.headers['last-modified'] == \
+        'Thu, 01 Jul 2021 00:00:00 GMT'
+
+    response = client.get(url, headers={'If-None-Match': f'"x", W/{etag}'})
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+
+    response = client.get(url, headers={
+        'If-Modified-Since': 'Fri, 02 Jul 2021 00:00:00 GMT'})
+    assert response.status_code == 304
+
+    # Curation changed
+    state.curations[curation_id]['modified_date'] = '2021-07-02T00:00:00Z'
+    figshare.metadata_cache.clear()
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+
+
+def test_database_read_not_modified(tmp_path):
+    params = {'db_file': str(tmp_path / 'intake.db')}
+    store = storage.get_storage(params['db_file'])
+    doc_id = store.insert({'article_id': article_id, 'summary': 'First'})
+
+    url = f'/database/read/{article_id}'
+    response = client.get(url, params=params)
+    etag = response.headers['etag']
+    assert response.headers['cache-control'] == 'private, no-cache'
+    assert client.get(url, params=params,
+                      headers={'If-None-Match': etag}).status_code == 304
+
+    store.update(doc_id, {'summary': 'Second'})
+    response = client.get(url, params=params, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()['summary'] == 'Second'
@@ -47,6 +47,45 @@ def test_get_db():
     response = client.get(url)
     assert response.status_code == 200
     assert isinstance(response.content, bytes)
+    assert response.json()['next_cursor'] is None
+
+
+def test_get_db_pages(tmp_path):
+    db_file = str(tmp_path / 'intake.db')
+    for i in range(25):
+        client.post(f'/database/create?db_file={db_file}',
+                    json={'article_id': 1000 + i, 'curation_id': 2000 + i})
+
+    # Cursor pagination
+    records = {}
+    params = {'db_file': db_file, 'limit': 10}
+    while True:
+        response = client.get('/database/', params=params)
+        assert response.status_code == 200
+        page = response.json()
+        records.update(page['records'])
+        if page['next_cursor'] is None:
+            break
+        params['cursor'] = page['next_cursor']
+    assert len(records) == 25
+
+    # Range filters
+    params = {'db_file': db_file, 'article_id_min': 1005,
+              'article_id_max': 1009, 'curation_id_min': 2007}
+    response = client.get('/database/', params=params)
+    assert [r['article_id'] for r in response.json()['records'].values()] \
+        == [1007, 1008, 1009]
+
+    # JSON Lines stream
+    params = {'db_file': db_file, 'format': 'jsonl', 'limit': 7}
+    response = client.get('/database/', params=params)
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert len(lines) == 25
+    assert ast.literal_eval(lines[0])['record']['article_id'] == 1000
+
+    response = client.get('/database/', params={'format': 'csv'})
+    assert response.status_code == 400
 
 
 def test_get_data():
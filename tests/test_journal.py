@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from readme_tool import intake_form, journal, storage
+
+record = {
+    'article_id': 12966581,
+    'curation_id': 540005,
+    'summary': 'This is summary content',
+}
+
+
+@pytest.fixture(params=['intake.json', 'intake.db'])
+def db_file(request, tmp_path):
+    yield str(tmp_path / request.param)
+    journal.close_journals()
+    storage.close_storages()
+
+
+def test_group_commit(tmp_path):
+    log = journal.Journal(str(tmp_path / 'test.journal'))
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        seqs = list(executor.map(lambda i: log.append({'i': i}), range(200)))
+    log.close()
+    assert sorted(seqs) == list(range(1, 201))
+    # Concurrent appends share fsyncs
+    assert log.fsyncs < 200
+    entries = list(journal.read_entries(log.path))
+    assert sorted(entry['i'] for entry in entries) == list(range(200))
+
+
+def test_submit_compact(db_file):
+    store = storage.get_storage(db_file)
+    doc_id = store.insert({**record, 'notes': 'Stored'})
+
+    sub_journal = journal.get_journal(db_file)
+    sub_journal.submit({**record, 'summary': 'Draft'})
+    sub_journal.submit({'article_id': 1, 'curation_id': 2, 'summary': 'New'})
+    sub_journal.submit({**record, 'summary': 'Final'})
+
+    # Not yet in the database, but visible to reads
+    assert store.get(record['article_id'])[1]['summary'] == \
+        record['summary']
+    data = asyncio.run(intake_form.get_data(record['article_id'],
+                                            db_file=db_file))
+    assert data == {**record, 'notes': 'Stored', 'summary': 'Final'}
+    assert asyncio.run(intake_form.get_data(1, db_file=db_file))['summary'] \
+        == 'New'
+
+    assert sub_journal.compact() == 2
+    assert store.count() == 2
+    assert store.get(record['article_id']) == \
+        (doc_id, {**record, 'notes': 'Stored', 'summary': 'Final'})
+    assert sub_journal.pending(record['article_id']) is None
+    assert os.path.getsize(sub_journal.path) == 0
+    assert not os.path.exists(sub_journal.compacting_path)
+
+
+def test_replay(db_file):
+    entries = [{'op': 'upsert', 'record': {**record, 'summary': 'One'}},
+               {'op': 'upsert', 'record': {**record, 'summary': 'Two'}}]
+    with open(f'{db_file}.journal.compacting', 'w') as fout:
+        fout.write(json.dumps(entries[0]) + '\n')
+    with open(f'{db_file}.journal', 'w') as fout:
+        fout.write(json.dumps(entries[1]) + '\n')
+        # Interrupted write is skipped
+        fout.write('{"op": "upsert", "rec')
+
+    assert journal.replay(db_file) == 2
+    store = storage.get_storage(db_file)
+    assert store.count() == 1
+    assert store.get(record['article_id'])[1]['summary'] == 'Two'
+    assert not os.path.exists(f'{db_file}.journal')
+    assert not os.path.exists(f'{db_file}.journal.compacting')
+
+
+def test_single_owner(db_file):
+    # Opened in a worker thread, closed from another thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(journal.get_journal, db_file).result()
+
+    # Other processes write directly rather than share the journal
+    with pytest.raises(journal.JournalInUseError):
+        journal.SubmissionJournal(db_file)
+    journal.close_journals()
+    journal.SubmissionJournal(db_file).close()
@@ -0,0 +1,59 @@
+from time import perf_counter
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from readme_tool import intake_form, metrics, storage
+from readme_tool.cache import TTLCache
+
+app = FastAPI()
+app.add_middleware(metrics.MetricsMiddleware)
+app.include_router(intake_form.router)
+app.include_router(metrics.router)
+client = TestClient(app)
+
+
+def test_histogram_render():
+    hist = metrics.Histogram('test_seconds', 'Test', ('route',),
+                             buckets=(0.1, 1.0))
+    for value in [0.05, 0.5, 5.0]:
+        hist.observe(value, 'a')
+    samples = list(hist.samples())
+    assert [s[2] for s in samples] == [1, 2, 3, 5.55, 3]
+    assert samples[2][1] == {'route': 'a', 'le': '+Inf'}
+
+
+def test_metrics_endpoint(tmp_path):
+    db_file = str(tmp_path / 'intake.db')
+    client.post('/database/create', params={'db_file': db_file},
+                json={'article_id': 1, 'curation_id': 2})
+    client.get('/database/read/1', params={'db_file': db_file})
+
+    cache = TTLCache()
+    metrics.register_cache('test', cache)
+    cache.get('missing')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.text
+    assert 'rem_request_duration_seconds_count{route="get_data",' \
+           'method="GET",status="200"} 1' in text
+    assert 'rem_storage_operation_duration_seconds_count{backend="sqlite",' \
+           'operation="read"}' in text
+    assert 'rem_storage_records_total{backend="sqlite",' \
+           'operation="insert"}' in text
+    assert 'rem_cache_misses{cache="test"} 1' in text
+    assert 'rem_cache_hit_ratio{cache="test"} 0.0' in text
+    del metrics.caches['test']
+    storage.close_storages()
+
+
+def test_overhead_budget():
+    # Recording one request must stay well under 20 us
+    hist = metrics.Histogram('budget_seconds', 'Test', ('route', 'status'))
+    n = 20000
+    t0 = perf_counter()
+    for _ in range(n):
+        t1 = perf_counter()
+        hist.observe(perf_counter() - t1, 'get_form', '200')
+    assert (perf_counter() - t0) / n < 20e-6
@@ -0,0 +1,104 @@
+import io
+import json
+
+import pytest
+
+from readme_tool import migrate
+
+records = {
+    doc_id: {'article_id': 1000 + doc_id, 'curation_id': 2000 + doc_id,
+             'summary': f'Summary {doc_id} with "quotes" and\nnewlines',
+             'files': 'x' * doc_id}
+    for doc_id in range(1, 51)
+}
+
+
+@pytest.fixture
+def tinydb_file(tmp_path):
+    filename = tmp_path / 'intake.json'
+    filename.write_text(json.dumps({'_default': records,
+                                    'other': {'1': {'a': 1}}}))
+    return str(filename)
+
+
+def test_iter_tinydb():
+    content = json.dumps({'_default': records})
+    # Small chunks exercise records split across reads
+    for chunk_size in [7, 64, 1 << 16]:
+        parsed = dict(migrate._iter_tinydb(io.StringIO(content),
+                                           chunk_size=chunk_size))
+        assert parsed == records
+
+    assert list(migrate._iter_tinydb(io.StringIO('{}'))) == []
+    assert list(migrate._iter_tinydb(io.StringIO('{"_default": {}}'))) == []
+
+
+def test_copy_round_trip(tinydb_file, tmp_path):
+    jsonl_file = str(tmp_path / 'intake.jsonl')
+    sqlite_file = str(tmp_path / 'intake.db')
+    tinydb_copy = str(tmp_path / 'intake_copy.json')
+
+    assert migrate.copy(tinydb_file, jsonl_file, batch_size=7) == 50
+    assert migrate.copy(jsonl_file, sqlite_file, batch_size=7) == 50
+    assert migrate.copy(sqlite_file, tinydb_copy, batch_size=7) == 50
+
+    with open(tinydb_copy) as fin:
+        assert json.load(fin)['_default'] == \
+            {str(k): v for k, v in records.items()}
+    assert migrate.checksum(migrate.read_records(tinydb_file)) == \
+        migrate.checksum(migrate.read_records(sqlite_file))
+
+
+def test_copy_incremental(tinydb_file, tmp_path):
+    jsonl_file = str(tmp_path / 'backup.jsonl')
+    migrate.main(['copy', tinydb_file, jsonl_file, '--after', '40'])
+    assert migrate.checksum(migrate.read_records(jsonl_file))[0] == 10
+
+    migrate.main(['copy', tinydb_file, jsonl_file, '--append',
+                  '--no-verify'])
+    with pytest.raises(ValueError, match='count mismatch'):
+        migrate.verify_copy(tinydb_file, jsonl_file)
+
+
+@pytest.mark.parametrize('suffix', ['.json', '.jsonl', '.db'])
+def test_copy_incremental_keeps_records(tinydb_file, tmp_path, suffix):
+    destination = str(tmp_path / f'backup{suffix}')
+    assert migrate.copy(tinydb_file, destination) == 50
+
+    # Newer records in the source replace the tail of the destination
+    changed = {**records, 45: {**records[45], 'notes': 'Changed'},
+               51: {'article_id': 1051, 'curation_id': 2051}}
+    with open(tinydb_file, 'w') as fout:
+        json.dump({'_default': changed}, fout)
+    assert migrate.copy(tinydb_file, destination, after=40) == 11
+    assert dict(migrate.read_records(destination)) == changed
+
+    # Earlier destination records are kept
+    with open(tinydb_file, 'w') as fout:
+        json.dump({'_default': {**changed, 1: {'article_id': 1}}}, fout)
+    migrate.copy(tinydb_file, destination, after=40)
+    assert dict(migrate.read_records(destination))[1] == records[1]
+
+
+def test_copy_to_existing_sqlite(tinydb_file, tmp_path):
+    sqlite_file = str(tmp_path / 'intake.db')
+    migrate.write_records(sqlite_file, iter([(99, {'article_id': 99})]))
+    assert migrate.copy(tinydb_file, sqlite_file) == 50
+    assert dict(migrate.read_records(sqlite_file)) == records
+
+
+def test_main_errors(tmp_path):
+    with pytest.raises(SystemExit):
+        migrate.main(['stats', str(tmp_path / 'missing.db')])
+
+
+def test_migrate_legacy(tinydb_file, tmp_path):
+    db_file = str(tmp_path / 'intake.db')
+    assert migrate.migrate_legacy(str(tmp_path / 'missing.json'),
+                                  db_file) == 0
+    assert migrate.migrate_legacy(tinydb_file, db_file) == 50
+    assert migrate.checksum(migrate.read_records(db_file)) == \
+        migrate.checksum(migrate.read_records(tinydb_file))
+
+    # Only the first start migrates
+    assert migrate.migrate_legacy(tinydb_file, db_file) == 0
@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+
+from readme_tool import figshare, figshare_client, prefetch
+
+pending = [{'id': 100 + i, 'article_id': 1000 + i, 'status': 'pending'}
+           for i in range(3)]
+
+calls = []
+
+
+def mock_figshare(request: httpx.Request) -> httpx.Response:
+    calls.append(request.url.path)
+    path = request.url.path
+    if path == '/v2/account/institution/reviews':
+        article_id = request.url.params.get('article_id')
+        if article_id is None:
+            offset = int(request.url.params.get('offset', 0))
+            limit = int(request.url.params.get('limit', 1000))
+            return httpx.Response(200, json=pending[offset:offset + limit])
+        return httpx.Response(200, json=[c for c in pending
+                                         if str(c['article_id']) == article_id])
+    curation_id = int(path.rsplit('/', 1)[-1])
+    curation = [c for c in pending if c['id'] == curation_id][0]
+    return httpx.Response(200, json={**curation, 'item': {}})
+
+
+def setup_module():
+    figshare_client.transport = httpx.MockTransport(mock_figshare)
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+    figshare.api_key = 'token'
+    figshare.stage_api_key = None
+
+
+def teardown_module():
+    figshare_client.transport = None
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+    figshare.api_key = None
+
+
+def test_warm_up(monkeypatch):
+    monkeypatch.setattr(prefetch, 'rate', 0)
+
+    assert asyncio.run(prefetch.warm_up()) == 3
+    for curation in pending:
+        for c_id in [None, curation['id']]:
+            assert (curation['article_id'], c_id, False, False) in \
+                figshare.metadata_cache
+    assert len(calls) == 1 + 2 * 3
+
+    # Cached articles are skipped
+    calls.clear()
+    assert asyncio.run(prefetch.warm_up()) == 0
+    assert len(calls) == 1
+
+    # No token for stage
+    assert asyncio.run(prefetch.warm_up(stage=True)) == 0
+
+
+def test_warm_up_pages(monkeypatch):
+    monkeypatch.setattr(prefetch, 'rate', 0)
+    monkeypatch.setattr(prefetch, 'page_size', 2)
+    figshare.metadata_cache.clear()
+    calls.clear()
+
+    assert asyncio.run(prefetch.warm_up()) == 3
+    assert calls.count('/v2/account/institution/reviews') == 2 + 3
+
+
+def test_start_stop(monkeypatch):
+    monkeypatch.setattr(prefetch, 'interval', 3600)
+
+    async def _start_stop():
+        await prefetch.start()
+        assert prefetch._task is not None
+        await asyncio.sleep(0)
+        await prefetch.stop()
+        assert prefetch._task is None
+
+    asyncio.run(_start_stop())
@@ -0,0 +1,213 @@
+import asyncio
+import threading
+from time import monotonic
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from readme_tool import figshare, figshare_client, metrics, ratelimit
+from readme_tool.ratelimit import Limiter, MemoryStore, SQLiteStore
+
+from .mock_figshare import MockFigshareServer, state
+
+
+@pytest.fixture(autouse=True)
+def limiter_state(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'store', MemoryStore())
+    monkeypatch.setattr(ratelimit, '_limiters', {})
+    monkeypatch.setattr(ratelimit, 'rates', {False: 50.0, True: 50.0})
+
+
+def test_token_bucket():
+    store = MemoryStore()
+    assert store.take('key', 1.0, 2.0) == 0
+    assert store.take('key', 1.0, 2.0) == 0
+    assert store.take('key', 1.0, 2.0) == pytest.approx(1.0, abs=0.01)
+
+    # Tokens below the floor are kept for higher priorities
+    assert store.take('other', 1.0, 4.0, floor=2.0) == 0
+    assert store.take('other', 1.0, 4.0, floor=2.0) == 0
+    assert store.take('other', 1.0, 4.0, floor=2.0) > 0
+    assert store.take('other', 1.0, 4.0) == 0
+
+
+def test_shared_store(tmp_path):
+    db_file = str(tmp_path / 'rate_limit.db')
+    worker_1, worker_2 = SQLiteStore(db_file), SQLiteStore(db_file)
+    assert worker_1.take('key', 1.0, 2.0) == 0
+    assert worker_2.take('key', 1.0, 2.0) == 0
+    assert worker_1.take('key', 1.0, 2.0) > 0
+    assert worker_2.take('key', 1.0, 2.0) > 0
+    worker_1.close()
+    worker_2.close()
+
+
+def test_priority_order(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'burst', 1.0)
+    monkeypatch.setattr(ratelimit, 'reserve', {})
+    limiter = Limiter('key', False)
+    order = []
+
+    async def _request(name: str):
+        await limiter.acquire(name)
+        order.append(name)
+
+    async def _requests():
+        await limiter.acquire('interactive')
+        tasks = [asyncio.ensure_future(_request(name))
+                 for name in ['prefetch', 'batch', 'prefetch', 'interactive']]
+        await asyncio.sleep(0)
+        assert limiter.queue_depth() == \
+            {'interactive': 1, 'batch': 1, 'prefetch': 2}
+        await asyncio.gather(*tasks)
+
+    t0 = monotonic()
+    asyncio.run(_requests())
+    assert order == ['interactive', 'batch', 'prefetch', 'prefetch']
+    # 4 requests at 50 per second after the burst
+    assert 0.06 < monotonic() - t0 < 0.5
+
+
+def test_priority_scope():
+    with ratelimit.priority_scope('prefetch'):
+        assert ratelimit.priority.get() == 'prefetch'
+    assert ratelimit.priority.get() == 'interactive'
+    with pytest.raises(ValueError):
+        with ratelimit.priority_scope('urgent'):
+            pass
+
+
+def test_figshare_requests(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'burst', 2.0)
+    with MockFigshareServer() as server:
+        state.reset()
+        state.add_curation(1, 100)
+        monkeypatch.setitem(figshare_client.base_urls, False, server.url)
+        figshare_client._clients.clear()
+
+        async def _get_details(curation_id: int):
+            client = figshare_client.get_client()
+            return await client.get_curation_details('token', curation_id)
+
+        async def _requests():
+            # Distinct requests, so none are coalesced
+            responses = await asyncio.gather(
+                *[_get_details(100 + i) for i in range(6)])
+            await figshare_client.close_clients()
+            return responses
+
+        waited = ratelimit.wait_seconds.count('false', 'interactive')
+        t0 = monotonic()
+        responses = asyncio.run(_requests())
+        figshare_client._clients.clear()
+
+    assert [r.status_code for r in responses] == [200] + [404] * 5
+    assert monotonic() - t0 > 4 / 50
+    assert ratelimit.wait_seconds.count('false', 'interactive') == waited + 6
+    assert 'rem_ratelimit_queue_depth{stage="false",priority="batch"} 0' in \
+        metrics.render()
+
+    # Disabled rate limit
+    ratelimit.rates[False] = 0.0
+    asyncio.run(ratelimit.acquire('token'))
+    assert ratelimit._limiters.keys() == \
+        {ratelimit.bucket_key('token', False)}
+
+
+def test_reprioritize(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'burst', 1.0)
+    monkeypatch.setattr(ratelimit, 'reserve', {})
+    limiter = Limiter('key', False)
+    order = []
+
+    async def _request(name: str, shared=None):
+        await limiter.acquire(name, shared)
+        order.append(shared.name if shared else name)
+
+    async def _requests():
+        await limiter.acquire('interactive')
+        shared = ratelimit.SharedPriority('prefetch')
+        tasks = [asyncio.ensure_future(_request('batch')),
+                 asyncio.ensure_future(_request('prefetch', shared))]
+        await asyncio.sleep(0)
+        # An interactive caller joins the prefetch request
+        shared.raise_to('interactive')
+        shared.raise_to('batch')
+        assert limiter.queue_depth()['interactive'] == 1
+        await asyncio.gather(*tasks)
+
+    asyncio.run(_requests())
+    assert order == ['interactive', 'batch']
+
+
+def test_coalesced_priority(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'burst', 1.0)
+    with MockFigshareServer() as server:
+        state.reset()
+        state.add_curation(1, 100)
+        monkeypatch.setitem(figshare_client.base_urls, False, server.url)
+        figshare_client._clients.clear()
+
+        async def _requests():
+            client = figshare_client.get_client()
+            await ratelimit.acquire('token')
+            with ratelimit.priority_scope('prefetch'):
+                prefetch = asyncio.ensure_future(
+                    client.get_curation_details('token', 100))
+            await asyncio.sleep(0)
+            # Joins the prefetch call, which then runs as interactive
+            response = await client.get_curation_details('token', 100)
+            await prefetch
+            await figshare_client.close_clients()
+            return response
+
+        waited = {name: ratelimit.wait_seconds.count('false', name)
+                  for name in ['interactive', 'prefetch']}
+        assert asyncio.run(_requests()).status_code == 200
+        figshare_client._clients.clear()
+
+    assert ratelimit.wait_seconds.count('false', 'interactive') == \
+        waited['interactive'] + 2
+    assert ratelimit.wait_seconds.count('false', 'prefetch') == \
+        waited['prefetch']
+
+
+def test_batch_priority(monkeypatch):
+    app = FastAPI()
+    app.include_router(figshare.router)
+    with MockFigshareServer() as server:
+        state.reset()
+        state.add_curations(3)
+        monkeypatch.setitem(figshare_client.base_urls, False, server.url)
+        monkeypatch.setattr(figshare, 'api_key', 'token')
+        figshare_client._clients.clear()
+        figshare.metadata_cache.clear()
+
+        waited = {name: ratelimit.wait_seconds.count('false', name)
+                  for name in ['interactive', 'batch']}
+        response = TestClient(app).post('/metadata/batch', json={
+            'items': [{'article_id': i} for i in range(1, 4)]})
+        figshare_client._clients.clear()
+        figshare.metadata_cache.clear()
+
+    assert [item['status_code'] for item in response.json()] == [200] * 3
+    assert ratelimit.wait_seconds.count('false', 'batch') > waited['batch']
+    assert ratelimit.wait_seconds.count('false', 'interactive') == \
+        waited['interactive']
+
+
+def test_shared_store_off_loop(monkeypatch, tmp_path):
+    store = SQLiteStore(str(tmp_path / 'rate_limit.db'))
+    monkeypatch.setattr(ratelimit, 'store', store)
+    threads = []
+    take = store.take
+
+    def _take(*args):
+        threads.append(threading.current_thread())
+        return take(*args)
+
+    monkeypatch.setattr(store, 'take', _take)
+    asyncio.run(ratelimit.acquire('token'))
+    assert threads and threads[0] is not threading.main_thread()
+    store.close()
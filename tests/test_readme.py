@@ -0,0 +1,103 @@
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from readme_tool import figshare, figshare_client, readme, storage
+
+app = FastAPI()
+app.include_router(readme.router)
+client = TestClient(app)
+
+article_id = 12966581
+curation_id = 540005
+article_id_404 = 12345678
+
+curation = {
+    'id': curation_id,
+    'status': 'pending',
+    'item': {
+        'id': article_id,
+        'title': 'Dataset title',
+        'description': '<p>Dataset description</p>',
+        'doi': '10.25422/azu.data.12966581',
+        'citation': 'Ly, Chun (2020): Dataset title. University of Arizona. '
+                    'Dataset. https://doi.org/10.25422/azu.data.12966581',
+        'license': {'name': 'CC BY 4.0'},
+        'references': ['https://example.com/paper'],
+    }
+}
+
+
+def mock_figshare(request: httpx.Request) -> httpx.Response:
+    path = request.url.path
+    if path == '/v2/account/institution/reviews':
+        if request.url.params.get('article_id') == str(article_id):
+            return httpx.Response(200, json=[curation])
+        return httpx.Response(200, json=[])
+    if path == f'/v2/account/institution/review/{curation_id}':
+        return httpx.Response(200, json=curation)
+    return httpx.Response(404, json={'message': 'Entity not found'})
+
+
+def setup_module():
+    figshare_client.transport = httpx.MockTransport(mock_figshare)
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+    readme.readme_cache.clear()
+
+
+def teardown_module():
+    figshare_client.transport = None
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+    storage.close_storages()
+
+
+def test_get_readme(tmp_path):
+    db_file = str(tmp_path / 'intake.db')
+    params = {'db_file': db_file, 'format': 'md'}
+
+    # Without form responses
+    response = client.get(f'/readme/{article_id}/', params=params)
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/markdown')
+    content = response.text
+    assert content.startswith('# Dataset title')
+    assert 'Dataset description' in content and '<p>' not in content
+    assert '## Files and Folders' not in content
+
+    storage.get_storage(db_file).upsert({
+        'article_id': article_id, 'curation_id': curation_id,
+        'files': 'data.csv: Measurements', 'notes': ''})
+    response = client.get(f'/readme/{article_id}/', params=params)
+    assert '## Files and Folders\ndata.csv: Measurements' in response.text
+    assert '## Additional Notes' not in response.text
+    etag = response.headers['etag']
+
+    # Unchanged inputs are served from cache with the same hash
+    hits = readme.readme_cache.hits
+    response = client.get(f'/readme/{article_id}/', params=params)
+    assert response.headers['etag'] == etag
+    assert readme.readme_cache.hits == hits + 1
+    response = client.get(f'/readme/{article_id}/', params=params,
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    response = client.get(f'/readme/{article_id}/',
+                          params={'db_file': db_file})
+    assert response.text.startswith('Dataset title\n=============')
+
+    response = client.get(f'/readme/{article_id}/',
+                          params={'db_file': db_file, 'format': 'pdf'})
+    assert response.status_code == 400
+
+
+def test_readme_batch(tmp_path):
+    db_file = str(tmp_path / 'intake.db')
+    items = [{'article_id': article_id}, {'article_id': article_id_404}]
+    response = client.post('/readme/batch', params={'db_file': db_file},
+                           json={'items': items, 'format': 'md'})
+    assert response.status_code == 200
+    results = response.json()
+    assert [r['status_code'] for r in results] == [200, 404]
+    assert results[0]['readme'].startswith('# Dataset title')
@@ -0,0 +1,156 @@
+import asyncio
+from time import monotonic
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from readme_tool import figshare, figshare_client, intake_form, ratelimit
+from readme_tool.resilience import CircuitBreaker, CircuitOpenError, \
+    RetryPolicy
+
+from .mock_figshare import MockFigshareServer, state
+
+app = FastAPI()
+app.include_router(intake_form.router)
+client = TestClient(app)
+
+article_id = 12966581
+curation_id = 540005
+
+
+@pytest.fixture(scope='module')
+def server():
+    with MockFigshareServer() as mock_server:
+        yield mock_server
+
+
+@pytest.fixture(autouse=True)
+def mock_figshare(server, monkeypatch):
+    state.reset()
+    state.add_curation(article_id, curation_id)
+    monkeypatch.setitem(figshare_client.base_urls, False, server.url)
+    monkeypatch.setattr(figshare_client, 'retry_policy',
+                        RetryPolicy(retries=2, backoff_base=0.01))
+    monkeypatch.setattr(figshare_client, 'timeout', httpx.Timeout(0.5))
+    # Rate limiting is tested in test_ratelimit
+    monkeypatch.setattr(ratelimit, 'rates', {False: 0.0, True: 0.0})
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+    yield
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+
+
+def _get_details():
+    fs_client = figshare_client.get_client(False)
+    return asyncio.run(fs_client.get_curation_details(None, curation_id))
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    asyncio.run(asyncio.sleep(0.06))
+    breaker.before_call()  # Trial call
+    assert breaker.state == 'half_open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.stats() == {'state': 'closed', 'consecutive_failures': 0,
+                               'opened': 1, 'rejected': 2}
+
+
+def test_retry_policy():
+    policy = RetryPolicy(retries=3, backoff_base=0.1, backoff_max=0.5)
+    for attempt in range(5):
+        assert 0 <= policy.delay(attempt) <= min(0.5, 0.1 * 2 ** attempt)
+    assert policy.delay(0, retry_after='0.3') == 0.3
+    assert policy.delay(0, retry_after='60') == 0.5
+
+
+def test_retry_5xx_429():
+    state.fail_statuses = [503, 429]
+    response = _get_details()
+    assert response.status_code == 200
+    assert len(state.requests) == 3
+
+    # Retries are bounded
+    state.requests.clear()
+    state.fail_statuses = [500] * 5
+    response = _get_details()
+    assert response.status_code == 500
+    assert len(state.requests) == 3
+
+
+def test_timeout_opens_breaker(monkeypatch):
+    monkeypatch.setattr(figshare_client, 'breaker_threshold', 2)
+    monkeypatch.setattr(figshare_client, 'retry_policy',
+                        RetryPolicy(retries=0))
+    state.latency = 1.0
+
+    for _ in range(2):
+        with pytest.raises(httpx.TimeoutException):
+            _get_details()
+
+    breaker = figshare_client.get_client(False).breaker
+    assert breaker.state == 'open'
+
+    # Fail fast without waiting on Figshare
+    t0 = monotonic()
+    with pytest.raises(CircuitOpenError):
+        _get_details()
+    assert monotonic() - t0 < 0.1
+
+    # Form shows the error page
+    response = client.get(f'/form/{article_id}/')
+    assert response.status_code == 200
+    assert 'unable to reach ReDATA' in response.text
+    assert breaker.stats()['rejected'] == 2
+
+
+def test_cancelled_trial():
+    breaker = figshare_client.get_client(False).breaker
+    breaker.record_failure()
+    breaker.state = 'open'
+    breaker._opened_at = monotonic() - breaker.reset_timeout
+    state.latency = 1.0
+
+    async def _cancel_trial():
+        task = asyncio.ensure_future(figshare_client.get_client(False).get(
+            None, f'/v2/account/institution/review/{curation_id}'))
+        await asyncio.sleep(0.05)
+        assert breaker.state == 'half_open'
+        # Cancels the in-flight trial call on exit
+
+    asyncio.run(_cancel_trial())
+
+    # Another trial is allowed and closes the circuit
+    state.latency = 0.0
+    assert _get_details().status_code == 200
+    assert breaker.state == 'closed'
+
+
+def test_stats_endpoint():
+    stats_app = FastAPI()
+    stats_app.include_router(figshare.router)
+    response = TestClient(stats_app).get('/figshare/stats/')
+    assert response.json()['circuit_breaker']['production']['state'] == \
+        'closed'
+
+
+def test_mock_error_rate(monkeypatch):
+    monkeypatch.setattr(figshare_client, 'retry_policy',
+                        RetryPolicy(retries=0))
+    state.error_rate = 1.0
+    assert _get_details().status_code == 503
+
+    state.error_rate = 0.5
+    statuses = [_get_details().status_code for _ in range(40)]
+    assert 0 < statuses.count(503) < 40
@@ -0,0 +1,155 @@
+import asyncio
+from time import perf_counter
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from readme_tool import intake_form, journal, migrate, search, storage
+from readme_tool.search import QueryError, SearchIndex, match_query
+
+app = FastAPI()
+app.include_router(intake_form.router)
+client = TestClient(app)
+
+
+@pytest.fixture(params=['intake.json', 'intake.db'])
+def db_file(request, tmp_path):
+    yield str(tmp_path / request.param)
+    search.close_indexes()
+    storage.close_storages()
+
+
+def _record(article_id: int, **fields) -> dict:
+    return {'article_id': article_id, 'curation_id': article_id + 1,
+            **fields}
+
+
+def test_match_query():
+    assert match_query('soil  carbon') == '"soil" "carbon"'
+    assert match_query('contrib* "x') == '"contrib"* """x"'
+    with pytest.raises(QueryError):
+        match_query(' * ')
+
+
+def test_search_endpoint(db_file):
+    params = {'db_file': db_file}
+    client.post('/database/create', params=params, json=_record(
+        1, summary='Soil carbon measurements',
+        materials='Samples were dried and weighed'))
+    client.post('/database/create', params=params, json=_record(
+        2, summary='Lake temperature', contributors='Chun Ly: curation'))
+    client.post('/database/upsert', params=params, json=_record(
+        3, summary='Soil moisture', notes='Soil soil soil'))
+
+    response = client.get('/database/search', params={**params, 'q': 'soil'})
+    assert response.status_code == 200
+    result = response.json()
+    assert result['total'] == 2
+    # Ranked by relevance
+    assert [hit['article_id'] for hit in result['hits']] == [3, 1]
+    assert '<mark>Soil</mark>' in result['hits'][0]['snippet']
+    assert result['next_offset'] is None
+    result = client.get('/database/search',
+                        params={**params, 'q': 'soil', 'limit': 1}).json()
+    assert [hit['article_id'] for hit in result['hits']] == [3]
+    assert result['next_offset'] == 1
+
+    # Stemmed terms and prefixes
+    hits = client.get('/database/search',
+                      params={**params, 'q': 'weigh'}).json()['hits']
+    assert [hit['article_id'] for hit in hits] == [1]
+    hits = client.get('/database/search',
+                      params={**params, 'q': 'cur*'}).json()['hits']
+    assert [(hit['article_id'], hit['curation_id']) for hit in hits] == \
+        [(2, 3)]
+
+    # Updates replace indexed text
+    doc_id = client.get('/database/read/1',
+                        params={**params, 'index': True}).json()
+    client.post(f'/database/update/{doc_id}', params=params,
+                json=_record(1, summary='Air quality'))
+    result = client.get('/database/search',
+                        params={**params, 'q': 'soil'}).json()
+    assert [hit['article_id'] for hit in result['hits']] == [3]
+    assert client.get('/database/search', params={
+        **params, 'q': 'quality'}).json()['total'] == 1
+
+    assert client.get('/database/search',
+                      params={**params, 'q': '*'}).status_code == 400
+
+
+def test_rebuild(db_file):
+    store = storage.get_storage(db_file)
+    for article_id in range(500):
+        store.insert(_record(article_id, summary=f'Dataset {article_id}',
+                             materials='Common methods text'))
+
+    # New indexes are filled from the README database
+    index = search.get_index(db_file)
+    total, hits = index.search('dataset 42')
+    assert total == 1 and hits[0]['article_id'] == 42
+
+    t0 = perf_counter()
+    total, hits = index.search('methods', limit=20)
+    assert (total, len(hits)) == (500, 20)
+    assert perf_counter() - t0 < 0.5
+
+    store.insert(_record(1000, summary='Added outside the app'))
+    assert index.search('outside')[0] == 0
+    assert index.rebuild() == 501
+    assert index.search('outside')[0] == 1
+
+
+def test_stale_index(db_file, monkeypatch):
+    store = storage.get_storage(db_file)
+    asyncio.run(intake_form.add_data(intake_form.IntakeData(**_record(
+        1, summary='Indexed on write')), db_file=db_file))
+    search.close_indexes()
+
+    # Records written outside the app are picked up when the index is opened
+    store.insert(_record(2, summary='Copied from another database'))
+    index = search.get_index(db_file)
+    assert index.search('copied')[0] == 1
+    assert index.search('indexed')[0] == 1
+    search.close_indexes()
+
+    # Rewrites keeping the number of records, e.g., by rem-db
+    doc_id = store.get(2)[0]
+    migrate.write_records(db_file, iter([
+        (doc_id, _record(2, summary='Rewritten elsewhere'))]),
+        keep=doc_id - 1)
+    assert store.count() == 2
+    index = search.get_index(db_file)
+    assert index.search('rewritten')[0] == 1
+    assert index.search('copied')[0] == 0
+    search.close_indexes()
+
+    # An index in sync is not rebuilt
+    monkeypatch.setattr(SearchIndex, 'rebuild', None)
+    assert search.get_index(db_file).search('rewritten')[0] == 1
+
+
+def test_journaled_index(db_file, monkeypatch):
+    search.get_index(db_file)
+    try:
+        intake_form._submit(_record(1, summary='Journaled'), db_file)
+    finally:
+        # Applies the submission to the database
+        journal.close_journals()
+    search.close_indexes()
+
+    # Fields indexed when journaled need no rebuild
+    monkeypatch.setattr(SearchIndex, 'rebuild', None)
+    assert search.get_index(db_file).search('journaled')[0] == 1
+
+
+def test_search_disabled(tmp_path, monkeypatch):
+    db_file = str(tmp_path / 'intake.db')
+    monkeypatch.setattr(search, 'enabled', False)
+    asyncio.run(intake_form.add_data(intake_form.IntakeData(**_record(
+        1, summary='Not indexed')), db_file=db_file))
+    monkeypatch.setattr(search, 'enabled', True)
+    # Records written while disabled are indexed on creation
+    assert SearchIndex(db_file).search('indexed')[0] == 1
+    storage.close_storages()
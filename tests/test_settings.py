@@ -0,0 +1,66 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from readme_tool import figshare, intake_form
+from readme_tool.settings import Settings, load_settings
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    monkeypatch.setenv('FIGSHARE_API_KEY', 'production token')
+    monkeypatch.setenv('FIGSHARE_STAGE_API_KEY', 'stage token')
+    monkeypatch.setenv('REM_PREFETCH_INTERVAL', '0')
+    monkeypatch.setenv('REM_SYNC_INTERVAL', '0')
+    monkeypatch.setenv('REM_JOURNAL', '0')
+    monkeypatch.setenv('REM_TEMPLATE_CACHE', str(tmp_path / 'jinja'))
+    # Startup opens the search index of the README database
+    monkeypatch.setattr(intake_form, 'intake_db_file',
+                        str(tmp_path / 'intake.db'))
+    return monkeypatch
+
+
+def test_settings(env):
+    env.setenv('REM_CACHE_TTL', '60')
+    env.setenv('REM_PREFETCH_STAGE', 'true')
+    settings = load_settings('missing.json')
+    assert settings.figshare_api_key == 'production token'
+    assert settings.cache_ttl == 60.0
+    assert settings.cache_maxsize is None
+    assert settings.prefetch_stage is True
+
+    env.setenv('REM_CACHE_TTL', '-1')
+    with pytest.raises(ValidationError):
+        Settings()
+
+
+def test_settings_file(monkeypatch, tmp_path):
+    monkeypatch.delenv('FIGSHARE_API_KEY', raising=False)
+    monkeypatch.setenv('FIGSHARE_STAGE_API_KEY', 'stage token')
+    settings_file = tmp_path / 'settings.json'
+    with pytest.raises(FileNotFoundError):
+        load_settings(str(settings_file))
+
+    settings_file.write_text(json.dumps({
+        'figshare_api_key': 'file token',
+        'figshare_stage_api_key': 'file stage token'}))
+    settings = load_settings(str(settings_file))
+    # Environment variables take precedence
+    assert (settings.figshare_api_key, settings.figshare_stage_api_key) == \
+        ('file token', 'stage token')
+
+
+def test_ready(env):
+    import main
+
+    env.setattr(main, 'settings', None)
+    env.setattr(figshare, 'api_key', None)
+    env.setattr(figshare, 'stage_api_key', None)
+    assert TestClient(main.app).get('/ready').status_code == 503
+
+    with TestClient(main.app) as client:
+        response = client.get('/ready')
+        assert response.status_code == 200
+        assert figshare.api_key == 'production token'
@@ -0,0 +1,127 @@
+import pytest
+
+from readme_tool import storage
+
+record = {
+    'article_id': 12966581,
+    'curation_id': 540005,
+    'summary': 'This is summary content',
+    'files': 'This is files content',
+}
+
+
+@pytest.fixture(params=['intake.json', 'intake.db'])
+def db(request, tmp_path):
+    store = storage.get_storage(str(tmp_path / request.param))
+    yield store
+    storage.close_storages()
+
+
+def test_get_storage(tmp_path):
+    assert isinstance(storage.get_storage(str(tmp_path / 'a.json')),
+                      storage.TinyDBStorage)
+    assert isinstance(storage.get_storage(str(tmp_path / 'a.db')),
+                      storage.SQLiteStorage)
+    # Backends are kept open for each database file
+    assert storage.get_storage(str(tmp_path / 'a.db')) is \
+        storage.get_storage(str(tmp_path / 'a.db'))
+    storage.close_storages()
+
+
+def test_insert_get(db):
+    assert db.get(record['article_id']) is None
+
+    doc_id = db.insert(record)
+    db.insert({**record, 'curation_id': 549476, 'summary': 'Old'})
+    assert db.count() == 2
+
+    assert db.get(record['article_id']) == (doc_id, record)
+    match = db.get(record['article_id'], curation_id=549476)
+    assert match[1]['summary'] == 'Old'
+    assert db.get(record['article_id'], curation_id=1) is None
+
+
+def test_update(db):
+    doc_id = db.insert(record)
+    db.update(doc_id, {'article_id': record['article_id'], 'notes': 'Notes'})
+    _, updated = db.get(record['article_id'])
+    assert updated == {**record, 'notes': 'Notes'}
+    assert dict(db.all()) == {doc_id: updated}
+
+
+def test_upsert(db):
+    doc_id = db.upsert(record)
+    assert db.get(record['article_id']) == (doc_id, record)
+
+    new_record = {**record, 'curation_id': 549476, 'summary': 'Updated'}
+    assert db.upsert(new_record) == doc_id
+    assert db.count() == 1
+    assert db.get(record['article_id'], curation_id=549476) == \
+        (doc_id, new_record)
+
+
+def test_upsert_concurrent(db):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        doc_ids = list(executor.map(
+            lambda i: db.upsert({**record, 'notes': str(i)}), range(32)))
+    assert len(set(doc_ids)) == 1
+    assert db.count() == 1
+
+
+def _insert_records(db_file: str, start: int):
+    # Runs in a separate process with its own backend instance
+    store = storage.get_storage(db_file)
+    for article_id in range(start, start + 20):
+        store.insert({**record, 'article_id': article_id})
+        store.upsert({**record, 'article_id': 0, 'notes': str(article_id)})
+    storage.close_storages()
+
+
+@pytest.mark.parametrize('db_name', ['intake.json', 'intake.db'])
+def test_multiprocess_writes(tmp_path, db_name):
+    import multiprocessing
+
+    db_file = str(tmp_path / db_name)
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_insert_records,
+                                 args=(db_file, 1 + 100 * i))
+                 for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    store = storage.get_storage(db_file)
+    records = list(store.all())
+    assert len(records) == 81
+    assert len({doc_id for doc_id, _ in records}) == 81
+    assert sum(1 for _, rec in records if rec['article_id'] == 0) == 1
+    storage.close_storages()
+
+
+def test_upsert_many(db):
+    doc_id = db.insert(record)
+    doc_ids = db.upsert_many([{**record, 'notes': 'First'},
+                              {**record, 'article_id': 1, 'notes': 'New'},
+                              {**record, 'notes': 'Second'}])
+    assert doc_ids[0] == doc_ids[2] == doc_id
+    assert db.count() == 2
+    assert db.get(record['article_id'])[1]['notes'] == 'Second'
+    assert db.get(1) == (doc_ids[1], {**record, 'article_id': 1,
+                                      'notes': 'New'})
+    # Later single writes see the batch
+    assert db.insert({**record, 'article_id': 2}) > doc_ids[1]
+
+
+def test_upsert_many_durable(db):
+    doc_ids = db.upsert_many([record, {**record, 'notes': 'Durable'}],
+                             durable=True)
+    assert doc_ids[0] == doc_ids[1]
+    assert db.get(record['article_id'])[1]['notes'] == 'Durable'
+    if db.backend == 'sqlite':
+        # Later writes are back to synchronous=NORMAL (1)
+        with db.connection() as conn:
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
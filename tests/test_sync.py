@@ -0,0 +1,165 @@
+import asyncio
+import json
+
+import pytest
+
+from readme_tool import figshare, figshare_client, intake_form, sync
+from readme_tool.locks import FileLock
+
+from .mock_figshare import MockFigshareServer, state
+
+list_path = '/v2/account/institution/reviews'
+
+
+@pytest.fixture(scope='module')
+def server():
+    with MockFigshareServer() as mock_server:
+        yield mock_server
+
+
+@pytest.fixture(autouse=True)
+def mock_figshare(server, monkeypatch, tmp_path):
+    state.reset()
+    state.add_curations(5)
+    monkeypatch.setitem(figshare_client.base_urls, False, server.url)
+    monkeypatch.setattr(figshare, 'api_key', 'token')
+    monkeypatch.setattr(figshare, 'stage_api_key', None)
+    monkeypatch.setattr(sync, 'page_size', 2)
+    monkeypatch.setattr(sync, 'watermark_file', str(tmp_path / 'sync.json'))
+    monkeypatch.setattr(sync, '_watermarks', {})
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+    yield
+    figshare_client._clients.clear()
+    figshare.metadata_cache.clear()
+
+
+def poll() -> list:
+    return asyncio.run(sync.poll())
+
+
+def test_poll():
+    # First poll sets the watermark: 3 pages of 2 curations
+    assert poll() == []
+    assert state.requests == [list_path] * 3
+    assert sync._watermarks[False] == sync.Watermark(
+        '2021-07-01T00:00:00Z', frozenset(range(1000001, 1000006)))
+    assert poll() == []
+
+    for article_id in range(1, 6):
+        figshare.metadata_cache.set((article_id, None, False, False), {})
+    figshare.metadata_cache.set((2, None, True, False), {})
+    intake_form.draft_validations.set((2, None, False, False), 1000002)
+    intake_form.draft_validations.set((3, None, False, False), 1000003)
+
+    state.modify_curation(1000002, '2021-07-02T10:00:00Z', status='approved')
+    state.add_curation(6, 1000006)
+    events = poll()
+    assert events == [
+        sync.ChangeEvent(2, 1000002, 'approved', '2021-07-02T10:00:00Z',
+                         False),
+        sync.ChangeEvent(6, 1000006, 'pending', '2021-07-01T00:00:00Z',
+                         False),
+    ]
+    # Only the changed article is invalidated, and only for production
+    assert (2, None, False, False) not in figshare.metadata_cache
+    assert (2, None, True, False) in figshare.metadata_cache
+    for article_id in (1, 3, 4, 5):
+        assert (article_id, None, False, False) in figshare.metadata_cache
+    # Draft autosaves are validated again
+    assert (2, None, False, False) not in intake_form.draft_validations
+    assert (3, None, False, False) in intake_form.draft_validations
+    intake_form.draft_validations.clear()
+
+    # Same timestamp as the watermark, but not seen before
+    state.add_curation(7, 1000007)
+    state.curations[1000007]['modified_date'] = '2021-07-02T10:00:00Z'
+    assert [event.article_id for event in poll()] == [7]
+
+    # Upstream traffic is the curation list only
+    assert set(state.requests) == {list_path}
+
+
+def test_watermark_file():
+    poll()
+    with open(sync.watermark_file) as fin:
+        assert json.load(fin)['production']['modified_date'] == \
+            '2021-07-01T00:00:00Z'
+
+    # Changes while not running are found after a restart
+    sync._watermarks.clear()
+    state.modify_curation(1000003, '2021-07-03T00:00:00Z')
+    sync.load_watermarks()
+    assert [event.article_id for event in poll()] == [3]
+
+
+def test_listener(monkeypatch):
+    received = []
+    monkeypatch.setattr(sync, '_listeners', [received.append])
+    poll()
+    state.modify_curation(1000001, '2021-07-02T00:00:00Z', status='rejected')
+    poll()
+    assert [(event.article_id, event.status) for event in received] == \
+        [(1, 'rejected')]
+
+
+def test_poll_pages(monkeypatch):
+    for day, curation_id in enumerate(range(1000001, 1000006), 1):
+        state.curations[curation_id]['modified_date'] = \
+            f'2021-07-0{day}T00:00:00Z'
+    # Newest first: the first poll needs the newest curations only
+    poll()
+    assert state.requests == [list_path]
+    assert sync._watermarks[False] == sync.Watermark(
+        '2021-07-05T00:00:00Z', frozenset([1000005]))
+
+    # Paging stops at curations older than the watermark
+    state.requests.clear()
+    state.modify_curation(1000001, '2021-07-06T00:00:00Z')
+    assert [event.article_id for event in poll()] == [1]
+    assert state.requests == [list_path] * 2
+
+    # Pages per poll are capped
+    monkeypatch.setattr(sync, 'max_pages', 1)
+    for curation_id in (1000002, 1000003, 1000004):
+        state.modify_curation(curation_id, '2021-07-07T00:00:00Z')
+    assert len(poll()) == 2
+
+
+def test_listener_failure(monkeypatch):
+    received = []
+
+    def fail(event):
+        raise RuntimeError("Listener failed")
+
+    monkeypatch.setattr(sync, '_listeners', [fail, received.append])
+    poll()
+    state.modify_curation(1000001, '2021-07-02T00:00:00Z')
+    assert [event.article_id for event in poll()] == [1]
+    assert [event.article_id for event in received] == [1]
+
+
+def test_poll_failure():
+    poll()
+    watermark = sync._watermarks[False]
+    state.modify_curation(1000001, '2021-07-02T00:00:00Z')
+    state.fail_statuses = [404]
+    assert poll() == []
+    assert sync._watermarks[False] == watermark
+    assert [event.article_id for event in poll()] == [1]
+
+
+def test_leader(monkeypatch, tmp_path):
+    lock_file = str(tmp_path / 'sync.lock')
+    monkeypatch.setattr(sync, 'lock_file', lock_file)
+    monkeypatch.setattr(sync, '_lock', None)
+
+    # Another worker is polling
+    other = FileLock(lock_file)
+    assert other.acquire(blocking=False)
+    assert not sync._is_leader()
+    other.release()
+
+    assert sync._is_leader()
+    asyncio.run(sync.stop())
+    assert sync._lock.depth == 0